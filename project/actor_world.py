@@ -0,0 +1,170 @@
+import numpy as np
+from pygame.math import Vector2 as vec
+from maze_generator.nav_grid import NavGrid
+from settings import *
+
+# vector attributes of actors kept in ActorWorld arrays (shape: capacity x 2)
+VECTOR_FIELDS = ("pos", "prev_pos", "vel", "acc")
+# scalar attributes of actors kept in ActorWorld arrays (shape: capacity)
+SCALAR_FIELDS = ("speed", "friction", "step_cost")
+
+
+#####################################################################################################################
+#MARK: ActorVector
+class ActorVector:
+    """
+    Descriptor of actor (NPC) vector attribute (e.g. pos) kept in the row of ActorWorld array.
+    Descriptors are installed only on actors in the world (see world_class), other actors have plain attributes.
+    Getter returns a new vec (copy), so the value must always be assigned back
+    to be changed: npc.pos += offset works, npc.pos.x += 1 doesn't.
+    """
+    def __set_name__(self, owner: type, name: str):
+        self.name = name
+
+    def __get__(self, actor, owner: type | None = None) -> vec:
+        if actor is None:
+            return self
+        row = actor.actor_world.arrays[self.name][actor.actor_id]
+        return vec(row[0], row[1])
+
+    def __set__(self, actor, value: vec):
+        value = vec(value)
+        actor.actor_world.arrays[self.name][actor.actor_id] = value.x, value.y
+
+
+class ActorScalar(ActorVector):
+    """
+    Descriptor of actor (NPC) scalar attribute (e.g. speed), see ActorVector
+    """
+    def __get__(self, actor, owner: type | None = None) -> float:
+        if actor is None:
+            return self
+        return float(actor.actor_world.arrays[self.name][actor.actor_id])
+
+    def __set__(self, actor, value: float):
+        actor.actor_world.arrays[self.name][actor.actor_id] = value
+
+
+# actor class => its subclass with descriptors
+WORLD_CLASSES: dict[type, type] = {}
+
+
+def world_class(actor_class: type) -> type:
+    """
+    subclass of actor class with ActorVector and ActorScalar descriptors of VECTOR_FIELDS and SCALAR_FIELDS,
+    actors are switched to it while they are in ActorWorld
+    """
+    if actor_class not in WORLD_CLASSES:
+        descriptors = {name: ActorVector() for name in VECTOR_FIELDS} | {name: ActorScalar() for name in SCALAR_FIELDS}
+        WORLD_CLASSES[actor_class] = type(actor_class.__name__, (actor_class,), descriptors)
+    return WORLD_CLASSES[actor_class]
+
+
+#####################################################################################################################
+#MARK: ActorWorld
+class ActorWorld:
+    """
+    Structure of arrays with planar physics state of all actors (NPCs and the Player) of a Scene:
+    position, previous position, velocity, acceleration, speed, friction and step cost of the current tile.
+    Actor objects become views over their row (see ActorVector), step integrates all actors
+    with a few NumPy operations instead of per actor Python code with Vector2 temporaries.
+    Rows are kept packed: removed actor is replaced by the last one.
+    """
+    def __init__(self, capacity: int = ACTOR_WORLD_CAPACITY) -> None:
+        self.actors: list = []
+        self.arrays: dict[str, np.ndarray] = {}
+        for name in VECTOR_FIELDS:
+            self.arrays[name] = np.zeros((capacity, 2), dtype=np.float64)
+        for name in SCALAR_FIELDS:
+            self.arrays[name] = np.ones(capacity, dtype=np.float64)
+        # time step of each actor for the next step, set by NPC.physics (0 - actor is not integrated,
+        # e.g. stunned or not updated in this frame by SimulationLOD), reset after each step
+        self.dt = np.zeros(capacity, dtype=np.float64)
+
+    def grow(self):
+        for name, array in self.arrays.items():
+            self.arrays[name] = np.concatenate((array, np.ones_like(array)))
+        self.dt = np.concatenate((self.dt, np.zeros_like(self.dt)))
+
+    def add(self, actor):
+        """
+        move actor attributes (VECTOR_FIELDS, SCALAR_FIELDS) from the instance to the next free row
+        and switch the actor to its class with descriptors
+        """
+        if len(self.actors) == len(self.dt):
+            self.grow()
+        values = {name: getattr(actor, name) for name in VECTOR_FIELDS + SCALAR_FIELDS}
+        actor.actor_world = self
+        actor.actor_id = len(self.actors)
+        actor.__class__ = world_class(type(actor))
+        self.actors.append(actor)
+        self.dt[actor.actor_id] = 0.0
+        for name, value in values.items():
+            del actor.__dict__[name]
+            setattr(actor, name, value)
+
+    def remove(self, actor):
+        """
+        copy actor attributes back to the instance (the object stays usable, with its original class)
+        and fill the gap with the last row
+        """
+        if actor.actor_world is not self:
+            return
+        values = {name: getattr(actor, name) for name in VECTOR_FIELDS + SCALAR_FIELDS}
+        index = actor.actor_id
+        last = len(self.actors) - 1
+        if index != last:
+            for array in self.arrays.values():
+                array[index] = array[last]
+            self.dt[index] = self.dt[last]
+            self.actors[index] = self.actors[last]
+            self.actors[index].actor_id = index
+        self.actors.pop()
+        actor.actor_world = None
+        actor.actor_id = -1
+        actor.__class__ = actor.__class__.__bases__[0]
+        for name, value in values.items():
+            setattr(actor, name, value)
+
+    #MARK: step
+    def step(self, nav_grid: NavGrid):
+        """
+        same integration as NPC.integrate for all actors with dt set in this frame (each with its own dt):
+        friction, velocity limited by speed scaled by step cost of the current tile, new position.
+        Rects of moved actors are adjusted afterwards.
+        """
+        count = len(self.actors)
+        if count == 0:
+            return
+        dt = self.dt[:count, None]
+        active = dt[:, 0] > 0
+        pos = self.arrays["pos"][:count]
+        vel = self.arrays["vel"][:count]
+        acc = self.arrays["acc"][:count]
+        step_cost = self.arrays["step_cost"][:count]
+
+        self.arrays["prev_pos"][:count][active] = pos[active]
+
+        acc[active] += vel[active] * self.arrays["friction"][:count, None][active]
+        vel[active] += acc[active] * dt[active]
+
+        # tile under the actor (see NPC.get_tileset_coord), step cost 1 outside the map
+        cols = (pos[:, 0] // TILE_SIZE).astype(np.intp)
+        rows = ((pos[:, 1] - 4) // TILE_SIZE).astype(np.intp)
+        inside = (rows >= 0) & (rows < nav_grid.rows) & (cols >= 0) & (cols < nav_grid.cols)
+        step_cost[:] = 1
+        step_cost[inside] = np.abs(nav_grid.data[rows[inside], cols[inside]])
+        step_cost[step_cost == 0] = 1
+        speed = self.arrays["speed"][:count] * (100 / step_cost)
+
+        magnitude = np.hypot(vel[:, 0], vel[:, 1])
+        too_fast = active & (magnitude >= speed) & (magnitude > 0)
+        vel[too_fast] *= (speed[too_fast] / magnitude[too_fast])[:, None]
+
+        pos[active] += vel[active] * dt[active] + (vel[active] / 2) * dt[active]
+        dt[:] = 0.0
+
+        moved = np.flatnonzero(active)
+        actors = self.actors
+        for index, x, y in zip(moved.tolist(), pos[moved, 0].tolist(), pos[moved, 1].tolist()):
+            actors[index].adjust_rect(vec(x, y))
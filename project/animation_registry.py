@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from os import PathLike
+from types import MappingProxyType
+import weakref
+import pygame
+from atlas import texture_atlas
+from settings import *
+
+Animations = MappingProxyType  # animation name => tuple of frames (Surfaces)
+
+
+def load_sprite_sheet(path: PathLike) -> dict[str, tuple[pygame.Surface, ...]]:
+    """
+    Load sprite sheet and cut it into animation names and frames using SPRITE_SHEET_DEFINITION dict.
+    If provided sheet is missing some of the animations from dict, a frame from upper left corner (0,0)
+    will be used.
+    If directional variants are missing (e.g.: only idle animation, but no idle left, idle right...)
+    the general animation will be copied.
+    """
+    animations = {}
+    img = texture_atlas.get(path)
+    img_rect = img.get_rect()
+    # use first tile (from upper left corner) as default 1 frame animation
+    rec_def = pygame.Rect(0, 0, TILE_SIZE, TILE_SIZE)
+    img_def = img.subsurface(rec_def)
+    animation_def = (img_def,)
+    directions = ["up", "down", "left", "right"]
+
+    for key, definition in SPRITE_SHEET_DEFINITION.items():
+        animation = []
+        for coord in definition:
+            x, y = coord
+            rec = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+            if rec.colliderect(img_rect):
+                img_part = img.subsurface(rec)
+                animation.append(img_part)
+            else:
+                continue
+                # print(f"ERROR! {self.name}: coordinate {x}x{y} not inside sprite sheet for {key} animation")
+
+        if len(animation) > 0:
+            animations[key] = tuple(animation)
+        else:
+            animations[key] = animation_def
+
+        # if there is only one animation for each direction
+        # that is when animation name doesn't include direction (e.g. 'idle')
+        # than add reference in all directions (e.g. 'idle_up', 'idle_down',...)
+        for direction in directions:
+            if direction not in key:
+                animations[f"{key}_{direction}"] = animations[key]
+    return animations
+
+
+def tint_animations(animations: Animations, color: tuple[int, int, int, int]) -> dict[str, tuple[pygame.Surface, ...]]:
+    """
+    copy of animations with semi transparent color blended over each frame (e.g. red for stunned character),
+    animations shared between names (directional aliases) stay shared
+    """
+    tinted_frames: dict[int, tuple[pygame.Surface, ...]] = {}
+    tinted = {}
+    for key, frames in animations.items():
+        if id(frames) not in tinted_frames:
+            color_filter = pygame.Surface(frames[0].get_size(), pygame.SRCALPHA)
+            color_filter.fill(color)
+            tinted_frames[id(frames)] = tuple(frame.copy() for frame in frames)
+            for frame in tinted_frames[id(frames)]:
+                frame.blit(color_filter, (0, 0))
+        tinted[key] = tinted_frames[id(frames)]
+    return tinted
+
+
+#####################################################################################################################
+#MARK: AnimationRegistry
+class AnimationRegistry:
+    """
+    Process-wide cache of character animations keyed by character name.
+    Sprite sheet of a character is decoded and cut into frames only once and the same read-only animations
+    (mapping of animation name => tuple of frames) are shared by all NPC instances with that name,
+    in all scenes. At most cache_size characters are kept, the least recently used one is dropped first,
+    but characters of live users (actors which passed themselves as user to get) are never dropped,
+    so the cache can grow over cache_size while they are alive.
+
+    Tinted variants (see ANIMATION_TINTS, e.g. "stunned") are made once, on first request,
+    so switching character to a tinted frame is just a change of reference.
+    """
+    def __init__(self, cache_size: int = ANIMATION_CACHE_SIZE) -> None:
+        self.cache_size = cache_size
+        # character name => tint ("" for original frames) => animations
+        self.cache: OrderedDict[str, dict[str, Animations]] = OrderedDict()
+        # character name => live actors using its animations
+        self.users: dict[str, weakref.WeakSet] = {}
+
+    def get(self, name: str, tint: str = "", user: object | None = None) -> Animations:
+        if user is not None:
+            self.users.setdefault(name, weakref.WeakSet()).add(user)
+        if name in self.cache:
+            self.cache.move_to_end(name)
+            variants = self.cache[name]
+        else:
+            variants = {"": MappingProxyType(load_sprite_sheet(CHARACTERS_DIR / name / "SpriteSheet.png"))}
+            self.cache[name] = variants
+            self.evict()
+
+        if tint not in variants:
+            variants[tint] = MappingProxyType(tint_animations(variants[""], ANIMATION_TINTS[tint]))
+        return variants[tint]
+
+    def evict(self):
+        """
+        drop least recently used characters over cache_size, skip characters with live users
+        """
+        for name in list(self.cache):
+            if len(self.cache) <= self.cache_size:
+                break
+            if not self.users.get(name):
+                del self.cache[name]
+                self.users.pop(name, None)
+
+    def clear(self):
+        self.cache.clear()
+
+
+animation_registry = AnimationRegistry()
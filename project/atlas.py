@@ -0,0 +1,139 @@
+#!../.venv/bin/python
+"""
+Texture atlas - all images from CHARACTERS_DIR, HUD_DIR, PARTICLES_DIR (and the mouse cursor) packed
+into a few large images (pages) with JSON index of their sub-rects.
+Game loads one page instead of dozens of separate files, which matters most in web build (pygbag),
+where each file is a separate fetch.
+
+Atlas is built offline (./atlas.py) or on the first run on desktop (when index is missing or older than any source image),
+the web build uses the atlas shipped with the game. Images missing from the atlas are loaded from their own files.
+
+usage:
+    ./atlas.py
+"""
+import json
+from os import PathLike
+from pathlib import Path
+import pygame
+from settings import *
+
+ATLAS_INDEX = "atlas.json"
+
+
+def get_atlas_sources() -> list[Path]:
+    sources = []
+    for folder in (CHARACTERS_DIR, HUD_DIR, PARTICLES_DIR):
+        sources.extend(sorted(folder.rglob("*.png")))
+    sources.append(MOUSE_CURSOR_IMG)
+    return sources
+
+
+def get_atlas_key(path: PathLike) -> str:
+    """
+    image path relative to ASSETS_DIR (with '/' separator), used as key in the atlas index
+    """
+    path = Path(path)
+    if not path.is_relative_to(ASSETS_DIR):
+        path = path.resolve()
+    return path.relative_to(ASSETS_DIR).as_posix()
+
+
+def build_atlas(atlas_dir: Path = ATLAS_DIR, page_size: int = ATLAS_PAGE_SIZE, padding: int = ATLAS_PADDING):
+    """
+    pack source images into pages using simple shelf packing (images sorted by height are put in rows),
+    save pages as PNG files and index (image => [page, x, y, width, height]) as JSON.
+    Images larger than ATLAS_MAX_IMAGE_SIZE (e.g. HUD theme preview) would mostly waste page space, they stay separate.
+    """
+    images = []
+    for path in get_atlas_sources():
+        image = pygame.image.load(path)
+        if max(image.get_size()) <= ATLAS_MAX_IMAGE_SIZE:
+            images.append((path, image))
+    images.sort(key=lambda item: (item[1].get_height(), item[1].get_width()), reverse=True)
+
+    # each page is a list of (image, position)
+    pages: list[list[tuple[pygame.Surface, tuple[int, int]]]] = []
+    index: dict[str, list[int]] = {}
+    x = y = shelf_height = page_size
+    for path, image in images:
+        width, height = image.get_size()
+        if x + width > page_size:
+            # next shelf
+            x = 0
+            y += shelf_height + padding
+            shelf_height = 0
+        if y + height > page_size:
+            pages.append([])
+            x = y = shelf_height = 0
+        pages[-1].append((image, (x, y)))
+        index[get_atlas_key(path)] = [len(pages) - 1, x, y, width, height]
+        x += width + padding
+        shelf_height = max(shelf_height, height)
+
+    atlas_dir.mkdir(parents=True, exist_ok=True)
+    page_names = []
+    for page_no, page in enumerate(pages):
+        used_height = max(pos[1] + image.get_height() for image, pos in page)
+        surface = pygame.Surface((page_size, used_height), pygame.SRCALPHA)
+        for image, pos in page:
+            surface.blit(image, pos)
+        page_names.append(f"atlas_{page_no}.png")
+        pygame.image.save(surface, atlas_dir / page_names[-1])
+
+    with open(atlas_dir / ATLAS_INDEX, "w", encoding="UTF-8") as f:
+        json.dump({"pages": page_names, "images": index}, f, indent=1)
+    print(f"atlas: {len(index)} images packed into {len(pages)} page(s) in '{atlas_dir}'")
+
+
+def is_atlas_stale(atlas_dir: Path = ATLAS_DIR) -> bool:
+    index_file = atlas_dir / ATLAS_INDEX
+    if not index_file.exists():
+        return True
+    index_time = index_file.stat().st_mtime
+    return any(path.stat().st_mtime > index_time for path in get_atlas_sources())
+
+
+#####################################################################################################################
+#MARK: TextureAtlas
+class TextureAtlas:
+    """
+    Runtime loader: get(path) returns subsurface of the atlas page (converted with alpha) for packed images.
+    Index and pages are loaded lazily on first use (after display mode is set).
+    """
+    def __init__(self, atlas_dir: Path = ATLAS_DIR) -> None:
+        self.atlas_dir = atlas_dir
+        self.is_loaded = False
+        self.page_names: list[str] = []
+        self.index: dict[str, list[int]] = {}
+        self.pages: dict[int, pygame.Surface] = {}
+
+    def load_index(self):
+        self.is_loaded = True
+        if not IS_WEB and is_atlas_stale(self.atlas_dir):
+            build_atlas(self.atlas_dir)
+        index_file = self.atlas_dir / ATLAS_INDEX
+        if index_file.exists():
+            with open(index_file, encoding="UTF-8") as f:
+                data = json.load(f)
+            self.page_names = data["pages"]
+            self.index = data["images"]
+
+    def get(self, path: PathLike) -> pygame.Surface:
+        if not self.is_loaded:
+            self.load_index()
+        key = get_atlas_key(path)
+        if key not in self.index:
+            return pygame.image.load(path).convert_alpha()
+
+        page_no, x, y, width, height = self.index[key]
+        if page_no not in self.pages:
+            self.pages[page_no] = pygame.image.load(self.atlas_dir / self.page_names[page_no]).convert_alpha()
+        return self.pages[page_no].subsurface((x, y, width, height))
+
+
+texture_atlas = TextureAtlas()
+
+
+if __name__ == "__main__":
+    pygame.init()
+    build_atlas()
@@ -0,0 +1,161 @@
+#!../.venv/bin/python
+"""
+Headless benchmark of Game.loop.
+
+Runs the game with SDL dummy video driver (no window, no OpenGL) for a given number of frames
+on selected scene, feeding scripted INPUTS, and reports p50/p95/p99 time of each frame phase.
+
+usage:
+    ./benchmark.py --scene Village --frames 600
+    ./benchmark.py --scene Maze --maze-cols 20 --maze-rows 20 --inputs walk.json --json results.json
+
+input script (JSON) is a list of [frame_no, action, pressed] entries, e.g.:
+    [[0, "right", true], [60, "right", false], [60, "down", true], [120, "down", false]]
+the script is repeated when there are more frames than the script length
+
+inputs of a run can be recorded and replayed later (e.g. to compare the same run across commits),
+the replay ignores --inputs, --seed and --frames, maze options must be the same as in the recorded run:
+    ./benchmark.py --scene Maze --frames 600 --record walk.grec
+    ./benchmark.py --scene Maze --replay walk.grec
+"""
+import os
+# must be set before pygame (and settings) is imported
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+import argparse
+import asyncio
+import json
+import random
+from collections import defaultdict
+from game import Game
+from profiler import Profiler
+from settings import *
+
+# walk in a square, jump at every corner
+DEFAULT_SCRIPT = [
+    [0,   "right", True],
+    [60,  "right", False],
+    [60,  "jump",  True],
+    [60,  "down",  True],
+    [120, "down",  False],
+    [120, "jump",  True],
+    [120, "left",  True],
+    [180, "left",  False],
+    [180, "jump",  True],
+    [180, "up",    True],
+    [240, "up",    False],
+]
+
+PHASES = ["input", "update", "draw", "cursor", "scale_blit", "shader", "flip", "frame"]
+PERCENTILES = [50, 95, 99]
+
+
+class BenchmarkGame(Game):
+    def __init__(self, script: list[list], start_scene: str = "Village", entry_point: str = "start", record_file: str = "", replay_file: str = "") -> None:
+        super().__init__(start_scene, entry_point, record_file or None, replay_file or None)
+        # frame number => list of (action, pressed)
+        self.script: dict[int, list[tuple[str, bool]]] = defaultdict(list)
+        self.script_len = 1
+        for frame_no, action, pressed in script:
+            self.script[frame_no].append((action, pressed))
+            self.script_len = max(self.script_len, frame_no + 1)
+
+    def get_inputs(self) -> list[pygame.event.EventType]:
+        events = super().get_inputs()
+        for action, pressed in self.script.get(self.frame_no % self.script_len, []):
+            if pressed:
+                self.input_map.press(action)
+            else:
+                self.input_map.release(action)
+        return events
+
+
+def enter_maze(game: Game, maze_cols: int, maze_rows: int):
+    """
+    use the maze exit of current scene to generate maze of a given size
+    """
+    current_scene = game.states[-1]
+    for exit in current_scene.exit_sprites:
+        if exit.is_maze:
+            exit.maze_cols = maze_cols
+            exit.maze_rows = maze_rows
+            current_scene.new_scene = exit
+            current_scene.go_to_scene()
+            return
+    raise ValueError(f"no maze exit found in {current_scene}")
+
+
+def percentile(values: list[float], p: int) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    random.seed(args.seed)
+    if args.inputs:
+        with open(args.inputs, encoding="UTF-8") as f:
+            script = json.load(f)
+    else:
+        script = DEFAULT_SCRIPT
+    if args.replay:
+        # inputs (and seed, dt, start scene) come from the recording
+        script = []
+
+    if args.scene == "Maze":
+        game = BenchmarkGame(script, "Village", "start", args.record, args.replay)
+        enter_maze(game, args.maze_cols, args.maze_rows)
+    else:
+        game = BenchmarkGame(script, args.scene, args.entry_point, args.record, args.replay)
+
+    if game.input_replay:
+        args.frames = max(1, game.input_replay.frames_cnt - args.warmup)
+    # keep all measured frames in profiler ring buffer
+    game.profiler = Profiler(max_frames=args.frames)
+    game.profiler.enabled = True
+    game.fixed_dt = 1 / FPS_CAP
+    game.max_frames = args.warmup + args.frames
+    asyncio.run(game.loop())
+
+    if args.trace:
+        game.profiler.export_chrome_trace(args.trace)
+
+    phase_times = game.profiler.phase_times()
+    results = {}
+    for phase in PHASES:
+        values = phase_times.get(phase, [0.0])
+        results[phase] = {f"p{p}": percentile(values, p) * 1000 for p in PERCENTILES}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmark of Game.loop")
+    parser.add_argument("--scene", default="Village", help="Village, VillageHouse or Maze")
+    parser.add_argument("--entry-point", default="start", help="entry point in the scene (ignored for Maze)")
+    parser.add_argument("--maze-cols", type=int, default=10)
+    parser.add_argument("--maze-rows", type=int, default=7)
+    parser.add_argument("--frames", type=int, default=600, help="number of measured frames")
+    parser.add_argument("--warmup", type=int, default=30, help="number of frames skipped before measuring")
+    parser.add_argument("--inputs", default="", help="JSON file with input script (default: walk in a square)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for random (NPC speed, maze, particles)")
+    parser.add_argument("--json", default="", help="save results to JSON file")
+    parser.add_argument("--trace", default="", help="save measured frames to Chrome trace JSON file")
+    parser.add_argument("--record", default="", help="record inputs of the run to file")
+    parser.add_argument("--replay", default="", help="replay inputs recorded with --record")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    print(f"scene: {args.scene} frames: {args.frames} (times in ms)")
+    print(f"{'phase':>12} " + " ".join(f"{f'p{p}':>8}" for p in PERCENTILES))
+    for phase, values in results.items():
+        print(f"{phase:>12} " + " ".join(f"{value:8.3f}" for value in values.values()))
+
+    if args.json:
+        with open(args.json, "w", encoding="UTF-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
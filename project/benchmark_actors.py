@@ -0,0 +1,132 @@
+#!../.venv/bin/python
+"""
+Benchmark of NPC simulation with and without ActorWorld (USE_ACTOR_WORLD) and SimulationLOD (USE_SIMULATION_LOD).
+
+Generates a maze, spawns a given number of NPCs on random tiles connected with the Player (all of them chase the Player)
+and runs Game.loop headless, then reports p50/p95 time of sprites update (movement, animation, per NPC physics),
+vectorized physics step (ActorWorld only) and the whole frame.
+Behaviour of SimulationLOD is checked by comparing the runs with LOD on and off: NPCs in the camera view
+(at the end of both runs) must end up close to the same positions and LOD must not leave more NPCs inside walls.
+
+usage:
+    ./benchmark_actors.py --npcs 300 --frames 300
+    ./benchmark_actors.py --npcs 1000 --maze-cols 40 --maze-rows 40
+"""
+import os
+# must be set before pygame (and settings) is imported
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+import argparse
+import asyncio
+import io
+import random
+from contextlib import redirect_stdout
+from pygame.math import Vector2 as vec
+import scene
+from benchmark import BenchmarkGame, enter_maze, percentile
+from characters import NPC
+from profiler import Profiler
+from settings import *
+
+# friendly characters only (enemies stun and kill each other when they meet the Player)
+NPC_NAMES = ["Woman", "Villager1", "Villager2", "Cat", "Frog"]
+
+
+def spawn_npcs(current_scene: scene.Scene, count: int):
+    grid = current_scene.nav_grid
+    # only tiles from which the Player can be reached
+    player_coord = current_scene.player.tileset_coord
+    current_scene.flow_field.set_goal((player_coord.y, player_coord.x))
+    walkable = [grid.to_node(index) for index, is_walkable in enumerate(grid.walkable)
+                if is_walkable and current_scene.flow_field.get_next_step(grid.to_node(index))]
+    for i in range(count):
+        row, col = random.choice(walkable)
+        pos = (col * TILE_SIZE + TILE_SIZE // 2, row * TILE_SIZE + TILE_SIZE // 2 + 4)
+        npc = NPC(current_scene.game, current_scene, [current_scene.draw_sprites], current_scene.shadow_sprites,
+                  pos, NPC_NAMES[i % len(NPC_NAMES)])
+        current_scene.NPC.append(npc)
+        current_scene.group.add(npc)
+
+
+def run(args: argparse.Namespace, use_actor_world: bool, use_lod: bool) -> dict[str, dict[str, float]]:
+    random.seed(args.seed)
+    # read by Scene when it is created
+    scene.USE_ACTOR_WORLD = use_actor_world
+    scene.USE_SIMULATION_LOD = use_lod
+    # Player stands still at the maze entry
+    game = BenchmarkGame([], "Village", "start")
+    enter_maze(game, args.maze_cols, args.maze_rows)
+    spawn_npcs(game.states[-1], args.npcs)
+
+    game.profiler = Profiler(max_frames=args.frames)
+    game.profiler.enabled = True
+    game.fixed_dt = 1 / FPS_CAP
+    game.max_frames = args.warmup + args.frames
+    # crowded NPCs pushed into walls keep reporting "Path not found!"
+    with redirect_stdout(io.StringIO()):
+        asyncio.run(game.loop())
+
+    phase_times = game.profiler.phase_times(depth=1)
+    phase_times["frame"] = game.profiler.phase_times()["frame"]
+    results = {}
+    for phase in ("sprites", "physics", "frame"):
+        values = phase_times.get(phase, [0.0])
+        results[phase] = {f"p{p}": percentile(values, p) * 1000 for p in (50, 95)}
+
+    current_scene = game.states[-1]
+    view_rect = current_scene.get_view_rect()
+    results["npcs"] = {
+        "positions": [(npc.pos.x, npc.pos.y) for npc in current_scene.NPC],
+        "in_view": [view_rect.colliderect(npc.rect) for npc in current_scene.NPC],
+        "in_walls": sum(bool(current_scene.collision_grid.collide_walls(npc.feet)) for npc in current_scene.NPC),
+    }
+    return results
+
+
+def compare_lod(name: str, results_off: dict, results_on: dict, max_drift: float):
+    """
+    print distance (in tiles) between positions of NPCs in view (in both runs) with LOD off and on and number of NPCs in walls,
+    raise AssertionError when LOD changed the behaviour
+    """
+    off, on = results_off["npcs"], results_on["npcs"]
+    drift = []
+    if len(off["positions"]) == len(on["positions"]):
+        drift = [vec(position_off).distance_to(position_on) / TILE_SIZE
+                 for position_off, position_on, in_view_off, in_view_on in zip(off["positions"], on["positions"], off["in_view"], on["in_view"])
+                 if in_view_off and in_view_on]
+    drift_avg = sum(drift) / max(1, len(drift))
+    print(f"{name:>8} NPCs in view: {len(drift)} drift avg: {drift_avg:.2f} max: {max(drift, default=0):.2f} tiles, "
+          f"NPCs in walls lod off: {off['in_walls']} on: {on['in_walls']}")
+    if on["in_walls"] > off["in_walls"]:
+        raise AssertionError(f"{name}: more NPCs in walls with LOD on ({on['in_walls']}) than off ({off['in_walls']})")
+    if drift_avg > max_drift:
+        raise AssertionError(f"{name}: NPCs in view drifted {drift_avg:.2f} tiles with LOD on (max {max_drift})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of NPC physics with and without ActorWorld")
+    parser.add_argument("--npcs", type=int, default=300, help="number of spawned NPCs")
+    parser.add_argument("--maze-cols", type=int, default=20)
+    parser.add_argument("--maze-rows", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=300, help="number of measured frames")
+    parser.add_argument("--warmup", type=int, default=30, help="number of frames skipped before measuring")
+    parser.add_argument("--max-drift", type=float, default=1.0, help="max average distance (in tiles) of NPCs in view with LOD on and off")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"maze: {args.maze_cols}x{args.maze_rows} NPCs: {args.npcs} frames: {args.frames} (times in ms)")
+    print(f"{'physics':>8} {'lod':>4} {'sprites p50':>12} {'p95':>8} {'physics p50':>12} {'p95':>8} {'frame p50':>10} {'p95':>8}")
+    all_results = {}
+    for name, use_actor_world, use_lod in (("npc", False, False), ("world", True, False), ("npc", False, True), ("world", True, True)):
+        results = all_results[(name, use_lod)] = run(args, use_actor_world, use_lod)
+        print(f"{name:>8} {'on' if use_lod else 'off':>4} {results['sprites']['p50']:12.2f} {results['sprites']['p95']:8.2f} "
+              f"{results['physics']['p50']:12.2f} {results['physics']['p95']:8.2f} "
+              f"{results['frame']['p50']:10.2f} {results['frame']['p95']:8.2f}")
+
+    for name in ("npc", "world"):
+        compare_lod(name, all_results[(name, False)], all_results[(name, True)], args.max_drift)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!../.venv/bin/python
+"""
+Micro-benchmark of NPC.animate.
+
+Animates all NPCs of a scene (half of them stunned) for a given number of frames and counts
+how many new Surfaces were assigned to NPC.image - i.e. how many Surfaces animate allocated.
+"legacy" is the previous implementation (copy of the frame each update + red filter Surface for stunned NPC),
+"current" is NPC.animate (shared frames and precomputed tinted variants, switched by reference).
+
+usage:
+    ./benchmark_animation.py --frames 1000
+"""
+import os
+# must be set before pygame (and settings) is imported
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+import argparse
+from time import perf_counter
+from animation_registry import animation_registry
+from characters import NPC
+from game import Game
+from settings import *
+
+
+def legacy_animate(npc: NPC, state: str, fps: float, loop: bool = True):
+    """
+    NPC.animate before frames were shared
+    """
+    npc.frame_index += fps
+
+    if npc.frame_index >= len(npc.animations[state]) - 1:
+        if loop:
+            npc.frame_index = 0.0
+        else:
+            npc.frame_index = len(npc.animations[state]) - 1.0
+
+    npc.image = npc.animations[state][int(npc.frame_index)].copy()
+
+    if npc.is_stunned:
+        red_filter = pygame.Surface(npc.image.get_size(), pygame.SRCALPHA)
+        red_filter.fill((200,0,0,64))
+        npc.image.blit(red_filter, (0,0))
+        # filter is allocated as well
+        return red_filter
+
+
+def run(npcs: list[NPC], frames: int, use_legacy: bool) -> tuple[int, float]:
+    """
+    number of Surfaces allocated and time (in seconds) of animating all npcs for a given number of frames
+    """
+    # keep references to all seen Surfaces, so ids are not reused
+    # shared frames (and tinted variants) from the registry are not allocated by animate
+    seen: dict[int, pygame.Surface] = {}
+    for npc in npcs:
+        for animations in animation_registry.cache[npc.name].values():
+            for animation in animations.values():
+                seen.update((id(frame), frame) for frame in animation)
+    allocated = 0
+    fps = ANIMATION_SPEED / FPS_CAP
+    time_start = perf_counter()
+    for _ in range(frames):
+        for npc in npcs:
+            if use_legacy:
+                extra = legacy_animate(npc, "run_down", fps)
+                allocated += extra is not None
+            else:
+                npc.animate("run_down", fps)
+            if id(npc.image) not in seen:
+                seen[id(npc.image)] = npc.image
+                allocated += 1
+    elapsed = perf_counter() - time_start
+    return allocated, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark of NPC.animate")
+    parser.add_argument("--scene", default="Village")
+    parser.add_argument("--frames", type=int, default=1000)
+    args = parser.parse_args()
+
+    game = Game(args.scene, "start")
+    npcs = game.states[-1].NPC
+    for i, npc in enumerate(npcs):
+        if i % 2 == 0:
+            # stun lasts longer than the benchmark (game time doesn't run here)
+            npc.stun(3600)
+
+    print(f"scene: {args.scene} NPCs: {len(npcs)} (stunned: {sum(npc.is_stunned for npc in npcs)}) frames: {args.frames}")
+    print(f"{'animate':>8} {'surfaces':>10} {'per NPC frame':>14} {'ms / frame':>11}")
+    for name, use_legacy in (("legacy", True), ("current", False)):
+        # first pass makes (and caches) tinted variants
+        run(npcs, 1, use_legacy)
+        allocated, elapsed = run(npcs, args.frames, use_legacy)
+        print(f"{name:>8} {allocated:10d} {allocated / (args.frames * len(npcs)):14.3f} {elapsed / args.frames * 1000:11.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!../.venv/bin/python
+"""
+Benchmark of path finding engines (a_star, jps, hpa) on a generated maze.
+
+For random pairs of walkable tiles and for "cross-maze" pairs (from one corner of the maze to the opposite one)
+each engine searches the path, number of expanded nodes, search time and path cost are compared with a_star.
+Every found path is validated (only permitted moves) and must exist exactly when a_star finds one,
+average cost of paths found by each engine must stay within --max-cost-ratio of a_star path cost.
+
+usage:
+    ./benchmark_path.py --maze-cols 50 --maze-rows 50 --queries 200
+    ./benchmark_path.py --map Village --queries 500 --json results.json
+"""
+import os
+# must be set before pygame (and settings) is imported
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+import argparse
+import json
+import random
+from time import perf_counter
+import pytmx
+from maze_generator import hunt_and_kill_maze
+from maze_generator.maze_utils import a_star, get_pyscroll_from_maze
+from maze_generator.nav_grid import DIRECTIONS, NavGrid
+from maze_generator.path_search import ClusterGraph, jump_point_search
+from benchmark import percentile
+from settings import *
+
+Node = tuple[int, int]
+
+
+def load_grid(args: argparse.Namespace) -> NavGrid:
+    if args.map == "Maze":
+        maze = hunt_and_kill_maze.HuntAndKillMaze(args.maze_cols, args.maze_rows)
+        maze.generate()
+        tileset_map = pytmx.TiledMap(MAZE_DIR / "MazeTileset_clean.tmx")
+        get_pyscroll_from_maze(tileset_map, maze, to_map="Village", entry_point="Stairs")
+    else:
+        tileset_map = pytmx.TiledMap(MAPS_DIR / f"{args.map}.tmx")
+    return NavGrid.from_tiled_map(tileset_map)
+
+
+def path_cost(grid: NavGrid, path: list[Node]) -> int | None:
+    """
+    cost of the path, None when path contains move which is not permitted
+    """
+    cost = 0
+    for node, next_node in zip(path, path[1:]):
+        direction = (next_node[0] - node[0], next_node[1] - node[1])
+        if direction not in DIRECTIONS:
+            return None
+        d = DIRECTIONS.index(direction)
+        index = grid.to_index(node)
+        if not grid.moves[d][index]:
+            return None
+        cost += grid.costs[d][index]
+    return cost
+
+
+def get_queries(grid: NavGrid, count: int, cross_maze: int) -> list[tuple[Node, Node]]:
+    walkable = [grid.to_node(index) for index, is_walkable in enumerate(grid.walkable) if is_walkable]
+    # tiles of the map (not margin) closest to the corners
+    corners = [min(walkable, key=lambda node: abs(node[0] - row) + abs(node[1] - col))
+               for row, col in ((0, 0), (0, grid.cols), (grid.rows, 0), (grid.rows, grid.cols))]
+    queries = [(random.choice(walkable), random.choice(walkable)) for _ in range(count)]
+    for i in range(cross_maze):
+        start = corners[i % 4]
+        queries.append((start, corners[3 - i % 4]))
+    return queries
+
+
+def run(args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    random.seed(args.seed)
+    grid = load_grid(args)
+
+    time_start = perf_counter()
+    cluster_graph = ClusterGraph(grid, args.cluster_size)
+    cluster_graph.build()
+    build_time = perf_counter() - time_start
+    print(f"map: {args.map} {grid.cols}x{grid.rows} tiles, uniform cost: {grid.uniform_cost}, "
+          f"hpa: {len(cluster_graph.edges)} abstract nodes built in {build_time * 1000:.1f} ms")
+
+    engines = {
+        "a_star": lambda start, goal, stats: a_star(grid, start, goal, stats),
+        "jps": lambda start, goal, stats: jump_point_search(grid, start, goal, stats),
+        "hpa": cluster_graph.find_path,
+    }
+    queries = get_queries(grid, args.queries, args.cross_maze)
+    measures = {name: {"expanded": [], "time": [], "cost_ratio": []} for name in engines}
+
+    for start, goal in queries:
+        reference_cost = None
+        for name, find_path in engines.items():
+            stats = {}
+            time_start = perf_counter()
+            path = find_path(start, goal, stats)
+            measures[name]["time"].append(perf_counter() - time_start)
+            measures[name]["expanded"].append(stats.get("expanded", 0))
+
+            cost = None
+            if path:
+                cost = path_cost(grid, path)
+                if cost is None or path[0] != start or path[-1] != goal:
+                    raise AssertionError(f"{name}: invalid path from {start} to {goal}")
+            if name == "a_star":
+                reference_cost = cost
+            elif (cost is None) != (reference_cost is None):
+                raise AssertionError(f"{name}: path from {start} to {goal} found: {cost is not None}, a_star: {reference_cost is not None}")
+            if cost and reference_cost:
+                measures[name]["cost_ratio"].append(cost / reference_cost)
+
+    results = {}
+    for name, values in measures.items():
+        results[name] = {
+            "expanded_avg": sum(values["expanded"]) / len(queries),
+            "expanded_p95": percentile(values["expanded"], 95),
+            "time_avg_ms": sum(values["time"]) / len(queries) * 1000,
+            "time_p95_ms": percentile(values["time"], 95) * 1000,
+            "cost_ratio": sum(values["cost_ratio"]) / max(1, len(values["cost_ratio"])),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of path finding engines")
+    parser.add_argument("--map", default="Maze", help="Maze (generated) or name of map in MAPS_DIR, e.g. Village")
+    parser.add_argument("--maze-cols", type=int, default=30)
+    parser.add_argument("--maze-rows", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=200, help="number of random queries")
+    parser.add_argument("--cross-maze", type=int, default=20, help="number of corner to opposite corner queries")
+    parser.add_argument("--cluster-size", type=int, default=HPA_CLUSTER_SIZE, help="size of hpa clusters (in tiles)")
+    parser.add_argument("--max-cost-ratio", type=float, default=1.1, help="max allowed average path cost compared to a_star")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default="", help="save results to JSON file")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    print(f"{'engine':>8} {'expanded':>10} {'p95':>8} {'avg ms':>8} {'p95 ms':>8} {'cost/a*':>8}")
+    for name, values in results.items():
+        print(f"{name:>8} {values['expanded_avg']:10.1f} {values['expanded_p95']:8.0f} "
+              f"{values['time_avg_ms']:8.2f} {values['time_p95_ms']:8.2f} {values['cost_ratio']:8.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="UTF-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+    for name, values in results.items():
+        if values["cost_ratio"] > args.max_cost_ratio:
+            raise AssertionError(f"{name}: average path cost is {values['cost_ratio']:.3f} of a_star path cost (max {args.max_cost_ratio})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,15 @@
 import os
 import random
+from typing import Callable
 import pygame
 from pygame.math import Vector2 as vec
-from maze_generator.maze_utils import a_star
 from settings import *
 import game
 import scene
 import npc_state
 from objects import HealthBar, Shadow
+from animation_registry import Animations, animation_registry
+from timer_wheel import Timer
 
 ##########################################################################################################################
 #MARK: NPC
@@ -27,23 +29,33 @@ class NPC(pygame.sprite.Sprite):
         self.game = game
         self.scene = scene
         self.name = name # monochrome_ninja
+        # set by ActorWorld.add
+        self.actor_world = None
+        self.actor_id: int = -1
         self.shadow = Shadow(shadow_group, (0, 0), [TILE_SIZE - 2, 6])
         self.health_bar = HealthBar(shadow_group, (pos[0], pos[1] - TILE_SIZE - 4))
-        self.animations: dict[str, list[pygame.surface.Surface]] = {}
         self.animation_speed = ANIMATION_SPEED
         # self.import_image(f"assets/{self.name}/")
-        self.import_sprite_sheet(CHARACTERS_DIR / self.name / "SpriteSheet.png")
+        # read-only animations shared by all characters with the same name
+        self.animations: Animations = animation_registry.get(self.name, user=self)
+        # tinted variant shown while stunned, resolved from the registry on the first stun (see stun)
+        self.stunned_animations: Animations | None = None
         self.frame_index: float = 0.0
         # self.image = self.animations["idle"][int(self.frame_index)].convert_alpha()
         self.image = self.animations["idle_down"][int(self.frame_index)]
         # self.image.set_colorkey(COLORS["black"])
         self.pos: vec = vec(pos[0], pos[1])
         self.prev_pos: vec = self.pos.copy()
+        # position before the last simulation step, sprites are drawn between it and pos (see Scene.draw)
+        self.render_prev_pos: vec = self.pos.copy()
+        # goal of flow field which can't be reached, "Path not found" is printed once per goal (see follow_flow_field)
+        self.unreachable_goal: tuple[int, int] | None = None
         self.tileset_coord: Point = self.get_tileset_coord()
         self.rect = self.image.get_frect(midbottom = self.pos)
         # hit box size is half the TILE_SIZE, bottom, centered
         self.feet = pygame.Rect(0, 0, self.rect.width // 2, TILE_SIZE // 2)
         self.feet.midbottom = self.pos
+        self.scene.collision_grid.move_actor(self)
         # individual steps to follow (mainly a center of a given tile, but pixel accurate)
         # provided by A* path finding
         self.waypoints: tuple[Point] = waypoints
@@ -64,6 +76,7 @@ class NPC(pygame.sprite.Sprite):
         self.friction: int = -12
         self.acc = vec(0, 0)
         self.vel = vec(0, 0)
+        self.step_cost: int = 1
         
         # jump/fly physics
         self.up_force: int = 3200
@@ -77,8 +90,8 @@ class NPC(pygame.sprite.Sprite):
         self.is_jumping = False
         self.is_stunned = False
         
-        self.stunned_event_id  = pygame.event.custom_type()
-        self.game.register_custom_event(self.stunned_event_id, self.back_from_stunned)
+        # end of stun scheduled in game.timer_wheel
+        self.stunned_timer: Timer | None = None
         # actual NPC state, mainly to determine type of animation and speed
         self.state: npc_state.NPC_State = npc_state.Idle()
         self.state.enter_time = self.scene.game.time_elapsed
@@ -89,6 +102,9 @@ class NPC(pygame.sprite.Sprite):
         self.attitude: str = "friendly"
         if self.name in ["Snake", "SpiderRed", "Spirit", "Slime"]:
             self.attitude = "enemy"
+
+        if self.scene.actor_world:
+            self.scene.actor_world.add(self)
         
     def get_tileset_coord(self, pos: vec | None = None) -> Point:
         """
@@ -100,46 +116,6 @@ class NPC(pygame.sprite.Sprite):
         # shift up by 4 pixels since perceived location is different than actual Sprite position on screen
         return Point(int(pos.x // TILE_SIZE), int((pos.y - 4) // TILE_SIZE))
         
-    def import_sprite_sheet(self, path: str):
-        """ 
-        Load sprite sheet and cut it into animation names and frames using SPRITE_SHEET_DEFINITION dict.
-        If provided sheet is missing some of the animations from dict, a frame from upper left corner (0,0)
-        will be used.
-        If directional variants are missing (e.g.: only idle animation, but no idle left, idle right...)
-        the general animation will be copied.
-        """
-        img = pygame.image.load(path).convert_alpha()
-        img_rect = img.get_rect()
-        # use first tile (from upper left corner) as default 1 frame animation
-        rec_def = pygame.Rect(0, 0, TILE_SIZE, TILE_SIZE)
-        img_def = img.subsurface(rec_def)
-        animation_def = [img_def]
-        directions = ["up", "down", "left", "right"]
-
-        for key, definition in SPRITE_SHEET_DEFINITION.items():
-            animation = []
-            for coord in definition:
-                x, y = coord
-                rec = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-                if rec.colliderect(img_rect):                   
-                    img_part = img.subsurface(rec)
-                    animation.append(img_part)
-                else:
-                    continue
-                    # print(f"ERROR! {self.name}: coordinate {x}x{y} not inside sprite sheet for {key} animation")
-            
-            if len(animation) > 0:
-                self.animations[key] = animation
-            else:
-                self.animations[key] = animation_def
-            
-            # if there is only one animation for each direction
-            # that is when animation name doesn't include direction (e.g. 'idle')
-            # than add reference in all directions (e.g. 'idle_up', 'idle_down',...)
-            for direction in directions:
-                if direction not in key:
-                    self.animations[f"{key}_{direction}"] = self.animations[key]
-
     def import_image(self, path: str):
         """
         old implementation used with separate img per frame (e.g. monochrome_ninja)
@@ -169,12 +145,11 @@ class NPC(pygame.sprite.Sprite):
             else:
                 self.frame_index = len(self.animations[state]) - 1.0
                 
-        self.image = self.animations[state][int(self.frame_index)].copy()
-        
+        # frames are shared (read-only) - image is switched by reference, tinted variants are precomputed
         if self.is_stunned:
-            red_filter = pygame.Surface(self.image.get_size(), pygame.SRCALPHA)
-            red_filter.fill((200,0,0,64))
-            self.image.blit(red_filter, (0,0))
+            self.image = self.stunned_animations[state][int(self.frame_index)]
+        else:
+            self.image = self.animations[state][int(self.frame_index)]
         
     def get_direction_360(self) -> str:
         angle = self.vel.angle_to(vec(0,1))
@@ -197,13 +172,45 @@ class NPC(pygame.sprite.Sprite):
         if self.is_stunned:
             return
         
+        # NPC without own waypoints chases the Player
         if not self.target == vec(0,0) or self.waypoints_cnt == 0:
-            if (self.waypoints_cnt == 0 or not self.target == self.scene.player.pos):
-                self.target = self.scene.player.pos.copy()
-                self.find_path()
+            self.target = self.scene.player.pos.copy()
+            self.follow_flow_field()
+            return
                 
         self.follow_waypoints()
                             
+    def follow_flow_field(self):
+        """
+        move toward the Player using flow field shared by all NPCs (see Scene.flow_field)
+        """
+        player_coord = self.scene.player.tileset_coord
+        goal = (player_coord.y, player_coord.x)
+        start = (self.tileset_coord.y, self.tileset_coord.x)
+        self.scene.flow_field.set_goal(goal)
+        next_step = self.scene.flow_field.get_next_step(start)
+        if next_step:
+            y, x = next_step
+            # center of the next tile, shifted down like waypoints (see follow_waypoints)
+            point = vec(x * TILE_SIZE + TILE_SIZE // 2, y * TILE_SIZE + TILE_SIZE // 2 + 4)
+        elif start == goal:
+            # in the same tile as the Player
+            point = self.target
+        else:
+            if goal != self.unreachable_goal:
+                self.unreachable_goal = goal
+                print(f"{self.name}: Path not found!")
+            self.acc = vec(0,0)
+            self.vel = vec(0,0)
+            return
+        
+        direction = point - self.pos
+        # skip when within around 1 pixel
+        if direction.length_squared() <= 2.0:
+            self.acc = vec(0,0)
+            return
+        self.acc = direction.normalize() * self.force
+                            
     def follow_waypoints(self):
         if self.waypoints_cnt > 0:
             npc_pos = self.pos
@@ -227,15 +234,23 @@ class NPC(pygame.sprite.Sprite):
                     current_way_point_vec = vec(self.waypoints[self.current_waypoint_no])
                     current_way_point_vec.y += 4
             direction = current_way_point_vec - npc_pos
-            direction = direction.normalize() * self.force
-            self.acc.x = direction.x
-            self.acc.y = direction.y
+            # exactly on the waypoint (e.g. consecutive waypoints in the same place) - nothing to steer to
+            if direction == vec(0, 0):
+                return
+            self.acc = direction.normalize() * self.force
 
-    def find_path(self):
+    def find_path(self, extra_waypoints: tuple[Point] = ()):
+        """
+        request path to target from Scene.path_service, current waypoints are followed until the path is found
+        
+        extra_waypoints: appended to the found path
+        """
         start = (self.tileset_coord.y, self.tileset_coord.x)
         target = self.get_tileset_coord(self.target)
         goal = (target.y, target.x)
-        path = a_star(start=start, goal=goal, grid=self.scene.path_finding_grid)
+        self.scene.path_service.request(start, goal, lambda path: self.set_path(path, start, extra_waypoints))
+
+    def set_path(self, path: tuple[tuple[int, int]] | None, start: tuple[int, int], extra_waypoints: tuple[Point] = ()):
         if path:
             waypoints = []
             path_list = list(path)
@@ -252,8 +267,8 @@ class NPC(pygame.sprite.Sprite):
                 y, x = waypoint
                 p = Point(x * TILE_SIZE + TILE_SIZE // 2, y * TILE_SIZE + TILE_SIZE // 2)
                 waypoints.append(p)
-            self.waypoints = tuple(waypoints)
-            self.waypoints_cnt = len(waypoints)
+            self.waypoints = tuple(waypoints) + extra_waypoints
+            self.waypoints_cnt = len(self.waypoints)
             self.current_waypoint_no = 0
             # self.acc = vec(0,0)
             # self.vel = vec(0,0)
@@ -276,23 +291,6 @@ class NPC(pygame.sprite.Sprite):
         if self.is_stunned:
             return
 
-        self.prev_pos = self.pos.copy()
-        
-        self.acc.x += self.vel.x * self.friction
-        self.vel.x += self.acc.x * dt
-        
-        self.acc.y += self.vel.y * self.friction
-        self.vel.y += self.acc.y * dt
-        
-        if self.tileset_coord.y < len(self.scene.path_finding_grid) and self.tileset_coord.x < len(self.scene.path_finding_grid[0]):
-            step_cost = abs(self.scene.path_finding_grid[self.tileset_coord.y][self.tileset_coord.x])
-        else:
-            step_cost = 1
-        speed = (self.speed * (100 / step_cost))
-        
-        if self.vel.magnitude() >= speed:
-            self.vel = self.vel.normalize() * speed
-            
         if self.is_flying:
             
             if self.scene.game.time_elapsed % 0.25 < 0.125:
@@ -316,9 +314,42 @@ class NPC(pygame.sprite.Sprite):
 
                 # TODO not a good place to do it
                 self.scene.group.change_layer(self, self.scene.sprites_layer)
+
+        # actors in the world are integrated all at once (see ActorWorld.step called by Scene.update)
+        if self.actor_world:
+            self.actor_world.dt[self.actor_id] = dt
+        else:
+            self.integrate(dt)
+
+    def integrate(self, dt: float):
+        """
+        planar movement: friction, velocity limited by speed (scaled by step cost of current tile), new position
+        """
+        pos = self.pos
+        vel = self.vel
+        acc = self.acc
+        self.prev_pos = pos.copy()
+        
+        acc.x += vel.x * self.friction
+        vel.x += acc.x * dt
+        
+        acc.y += vel.y * self.friction
+        vel.y += acc.y * dt
+        
+        if self.scene.nav_grid.is_inside(self.tileset_coord.y, self.tileset_coord.x):
+            self.step_cost = self.scene.nav_grid.get_step_cost(self.tileset_coord.y, self.tileset_coord.x) or 1
+        else:
+            self.step_cost = 1
+        speed = (self.speed * (100 / self.step_cost))
+        
+        if vel.magnitude() >= speed:
+            vel = vel.normalize() * speed
         
-        self.pos.x += self.vel.x * dt + (self.vel.x / 2) * dt
-        self.pos.y += self.vel.y * dt + (self.vel.y / 2) * dt
+        pos.x += vel.x * dt + (vel.x / 2) * dt
+        pos.y += vel.y * dt + (vel.y / 2) * dt
+        self.acc = acc
+        self.vel = vel
+        self.pos = pos
         
         self.adjust_rect()
         
@@ -338,34 +369,43 @@ class NPC(pygame.sprite.Sprite):
 
     def die(self):
         self.scene.NPC = [npc for npc in self.scene.NPC if not npc == self]
+        self.scene.collision_grid.remove_actor(self)
+        if self.actor_world:
+            self.actor_world.remove(self)
+        if self.stunned_timer:
+            self.stunned_timer.cancel()
+            self.stunned_timer = None
         self.shadow.kill()
         self.health_bar.kill()
         self.kill()
 
 
     def update(self, dt: float):
+        self.render_prev_pos = self.pos.copy()
         self.state.update(dt, self)
         self.change_state()
         
         
-    def slide(self, colliders) -> None:
+    def slide(self, collides: Callable[[pygame.Rect], bool]) -> None:
+        """
+        collides: function checking if feet (hitbox) collide with anything (e.g. SpatialGrid.collide_walls)
+        """
         move_vec = self.pos - self.prev_pos
         # can't move by full vector,
         # first try move ony in one axis (reset the movement along the other axis to zero)
         
         # slide along y axis
-        self.pos.x -= move_vec.x
+        self.pos -= vec(move_vec.x, 0)
         self.adjust_rect()
-        if self.feet.collidelist(colliders) == -1:
+        if not collides(self.feet):
             # looks ok, so set prev pos
             self.prev_pos = self.pos.copy()
             return
         
         # slide along x axis
-        self.pos.x += move_vec.x
-        self.pos.y -= move_vec.y
+        self.pos += vec(move_vec.x, -move_vec.y)
         self.adjust_rect()
-        if self.feet.collidelist(colliders) == -1:
+        if not collides(self.feet):
             # looks ok, so set prev pos
             self.prev_pos = self.pos.copy()
             return
@@ -373,8 +413,20 @@ class NPC(pygame.sprite.Sprite):
         # slide is not possible, block movement
         self.move_back()
 
+    def stun(self, duration: float):
+        """
+        stop moving for duration seconds (of game time), stun in progress is prolonged
+        """
+        self.is_stunned = True
+        if self.stunned_animations is None:
+            self.stunned_animations = animation_registry.get(self.name, "stunned", user=self)
+        if self.stunned_timer:
+            self.stunned_timer.cancel()
+        self.stunned_timer = self.game.timer_wheel.schedule(duration, self.back_from_stunned)
+
     def back_from_stunned(self):
         self.is_stunned = False
+        self.stunned_timer = None
 
     #MARK: encounter        
     def encounter(self, oponent: "NPC"):
@@ -393,11 +445,8 @@ class NPC(pygame.sprite.Sprite):
             if oponent.health == 0:
                 oponent.die()
 
-            self.is_stunned = True
-            pygame.time.set_timer(pygame.event.Event(self.stunned_event_id), 1000)
-
-            oponent.is_stunned = True
-            pygame.time.set_timer(pygame.event.Event(oponent.stunned_event_id), 1000)
+            self.stun(1.0)
+            oponent.stun(1.0)
             
             # push the npc
             player_move = self.pos - oponent.pos
@@ -429,16 +478,37 @@ class NPC(pygame.sprite.Sprite):
         
         self.adjust_rect()
 
-    def adjust_rect(self):
-        self.tileset_coord = self.get_tileset_coord() 
-        # display sprite n pixels above position so the shadow doesn't stick out from the bottom
-        self.rect.midbottom = self.pos + vec(0,  -self.jumping_offset - 3)
+    def teleport(self, pos: vec):
+        """
+        place at pos without movement (e.g. entry point of the scene), so it isn't drawn interpolated from the old position
+        """
+        self.pos = vec(pos)
+        self.prev_pos = self.pos.copy()
+        self.render_prev_pos = self.pos.copy()
+        self.adjust_rect()
+
+    def adjust_rect(self, pos: vec | None = None):
+        """
+        pos: current position when already known by the caller (e.g. ActorWorld.step)
+        """
+        if pos is None:
+            pos = self.pos
+        self.tileset_coord = self.get_tileset_coord(pos) 
+        self.place_sprites(pos)
+        self.scene.collision_grid.move_actor(self)
         # 'hitbox' for collisions
-        self.feet.midbottom = self.pos
-        # shadow
-        self.shadow.rect.midbottom = self.pos #+ vec(0, -1)
-        self.health_bar.rect.midbottom = self.pos + vec(0, -TILE_SIZE - 4)
+        self.feet.midbottom = pos
         self.health_bar.set_bar(self.health / self.max_health)
+
+    def place_sprites(self, pos: vec):
+        """
+        move sprite, shadow and health bar to pos (also used to draw them at interpolated position)
+        """
+        # display sprite n pixels above position so the shadow doesn't stick out from the bottom
+        self.rect.midbottom = pos + vec(0,  -self.jumping_offset - 3)
+        # shadow
+        self.shadow.rect.midbottom = pos #+ vec(0, -1)
+        self.health_bar.rect.midbottom = pos + vec(0, -TILE_SIZE - 4)
             
         
     def debug(self, msgs: list[str]):
@@ -472,8 +542,8 @@ class Player(NPC):
         if not self.target == vec(0,0):
             self.follow_waypoints()
             
-        if INPUTS["left_click"]: # or not self.target == vec(0,0):
-            target = vec(pygame.mouse.get_pos())
+        if self.game.input_map.is_pressed("left_click"): # or not self.target == vec(0,0):
+            target = vec(self.game.mouse_pos)
             mx, my = self.scene.map_layer.get_center_offset()
             # convert screen position to world position
             x = target.x // self.scene.map_layer._real_ratio_x - mx
@@ -485,12 +555,10 @@ class Player(NPC):
                 fix_exit_target = True
                 y += TILE_SIZE
             self.target = vec(x, y + 8)
-            self.find_path()
             if fix_exit_target:
-                self.waypoints = tuple(list(self.waypoints) + [Point(x, y - TILE_SIZE)])
-                self.waypoints_cnt = len(self.waypoints)
-
-            INPUTS["left_click"] = False
+                self.find_path((Point(x, y - TILE_SIZE),))
+            else:
+                self.find_path()
 
             self.follow_waypoints()
             # target = vec(pygame.mouse.get_pos())
@@ -505,25 +573,27 @@ class Player(NPC):
             self.waypoints_cnt = 0
             self.waypoints = ()
             
+        acc = self.acc
         if INPUTS["left"]:
-            self.acc.x = -self.force
+            acc.x = -self.force
             self.target = vec(0,0)
         elif INPUTS["right"]:
-            self.acc.x = self.force
+            acc.x = self.force
             self.target = vec(0,0)
         else:
             if self.target == vec(0,0):
-                self.acc.x = 0
+                acc.x = 0
             
         if INPUTS["up"]:
-            self.acc.y = -self.force
+            acc.y = -self.force
             self.target = vec(0,0)
         elif INPUTS["down"]:
-            self.acc.y = self.force
+            acc.y = self.force
             self.target = vec(0,0)
         else:
             if self.target == vec(0,0):
-                self.acc.y = 0
+                acc.y = 0
+        self.acc = acc
 
                     
     def check_scene_exit(self):
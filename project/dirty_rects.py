@@ -0,0 +1,126 @@
+import functools
+import numpy as np
+import pygame
+from settings import *
+
+
+@functools.cache
+def get_scale_indices(src_size: int, dst_size: int) -> np.ndarray:
+    """
+    source index of each destination pixel along one axis of pygame.transform.scale (nearest neighbour),
+    taken from scaling a row of indices, so scaling a region matches scaling the whole surface pixel by pixel
+    """
+    row = pygame.Surface((src_size, 1), 0, 32)
+    pygame.surfarray.pixels2d(row)[:, 0] = np.arange(src_size)
+    return pygame.surfarray.array2d(pygame.transform.scale(row, (dst_size, 1)))[:, 0]
+
+
+def scale_region(source: pygame.Surface, size: tuple[int, int], dest: pygame.Surface, region: pygame.Rect):
+    """
+    pygame.transform.scale(source, size, dest) which writes only pixels of region of dest
+    (source and dest have the same pixel format, pixels are copied as they are)
+    """
+    if region == dest.get_rect():
+        pygame.transform.scale(source, size, dest)
+        return
+    if not region:
+        return
+    xs = get_scale_indices(source.get_width(), size[0])[region.left:region.right]
+    ys = get_scale_indices(source.get_height(), size[1])[region.top:region.bottom]
+    source_pixels = pygame.surfarray.pixels2d(source)
+    dest_pixels = pygame.surfarray.pixels2d(dest)
+    # rows and columns are taken separately (faster than indexing by both at once)
+    dest_pixels[region.left:region.right, region.top:region.bottom] = source_pixels.take(xs, axis=0).take(ys, axis=1)
+    # surfaces stay locked while their arrays exist
+    del source_pixels, dest_pixels
+
+
+#####################################################################################################################
+#MARK: DirtyRects
+class DirtyRects:
+    """
+    Areas of the canvas which change in the current frame (opt-in, USE_DIRTY_RECTS).
+    Before drawing, the State (see Scene.draw) and Game report rects of things which moved or changed
+    (sprites, particles, cursor, profiler overlay), or the whole canvas (camera moved, State can't tell).
+    begin_draw clips the canvas to the bounding rect of them (region) and clears only the region,
+    everything is drawn as usual, but blits outside the region are clipped away (zoomed map is scaled only
+    into the region, see scale_region), and only the region is copied to the screen and uploaded to the texture.
+    Nothing is copied when nothing has changed, the whole canvas is redrawn when the region is too big (max_area).
+    Overlays (texts, panels) are compared with the previous frame by their content instead:
+    unchanged ones outside the region are not rendered at all, new or removed ones which are not fully
+    inside the region are redrawn in the next frame (they can't be drawn over a canvas which wasn't cleared,
+    semitransparent background would get darker with every frame).
+    """
+    def __init__(self, size: tuple[int, int], max_area: float = DIRTY_RECTS_MAX_AREA) -> None:
+        self.canvas_rect = pygame.Rect((0, 0), size)
+        self.max_area = max_area
+        self.rects: list[pygame.Rect] = []
+        self.is_full: bool = True
+        # clip of the current frame, empty when nothing has changed
+        self.region: pygame.Rect = self.canvas_rect.copy()
+        # full redraw when State changes (e.g. menu entered, scene exit)
+        self.state: "State | None" = None
+        # overlay key (content and position) => rect, drawn in the previous and the current frame
+        self.prev_overlays: dict[tuple, pygame.Rect] = {}
+        self.overlays: dict[tuple, pygame.Rect] = {}
+        # rects of overlays to be redrawn in the next frame
+        self.carried: list[pygame.Rect] = []
+
+    def begin_frame(self, state: "State"):
+        if state is not self.state:
+            self.state = state
+            self.is_full = True
+        self.rects = self.carried
+        self.carried = []
+        self.prev_overlays = self.overlays
+        self.overlays = {}
+
+    def add(self, rect: pygame.Rect | pygame.FRect):
+        if rect.width > 0 and rect.height > 0:
+            self.rects.append(pygame.Rect(rect))
+
+    def add_full(self):
+        self.is_full = True
+
+    def begin_draw(self, canvas: pygame.Surface):
+        """
+        clip canvas to the region of this frame and clear it
+        """
+        if self.rects and not self.is_full:
+            self.region = self.rects[0].unionall(self.rects[1:]).clip(self.canvas_rect)
+            if self.region.width * self.region.height > self.max_area * self.canvas_rect.width * self.canvas_rect.height:
+                self.is_full = True
+        elif not self.is_full:
+            self.region = pygame.Rect(0, 0, 0, 0)
+        if self.is_full:
+            self.region = self.canvas_rect.copy()
+        self.is_full = False
+        canvas.set_clip(self.region)
+        if self.region:
+            canvas.fill((0, 0, 0, 0))
+
+    #MARK: overlays
+    def is_overlay_drawn(self, key: tuple) -> bool:
+        """
+        overlay is the same as in the previous frame and outside the region (it's still on the canvas)
+        """
+        rect = self.prev_overlays.get(key)
+        if rect and not rect.colliderect(self.region):
+            self.overlays[key] = rect
+            return True
+        return False
+
+    def add_overlay(self, key: tuple, rect: pygame.Rect):
+        self.overlays[key] = rect
+        if key not in self.prev_overlays and not self.region.contains(rect):
+            self.carried.append(rect)
+
+    def end_draw(self, canvas: pygame.Surface) -> pygame.Rect:
+        """
+        remove clip, returns region which has changed (empty when nothing has changed)
+        """
+        canvas.set_clip(None)
+        for key, rect in self.prev_overlays.items():
+            if key not in self.overlays:
+                self.carried.append(rect)
+        return self.region
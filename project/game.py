@@ -1,5 +1,5 @@
 from datetime import datetime
-from os import environ
+from os import environ, PathLike
 from typing import Sequence
 environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
 
@@ -7,7 +7,13 @@ import asyncio
 import os
 from settings import *
 import pygame, sys
-from opengl_shader import OpenGL_shader
+from opengl_shader import OpenGL_shader, Headless_shader, create_upload_surface
+from profiler import Profiler
+from atlas import texture_atlas
+from timer_wheel import TimerWheel
+from input_map import InputMap
+from input_recorder import InputRecorder, InputReplay
+from dirty_rects import DirtyRects
 
 if USE_SOD:
     from second_order_dynamics import SecondOrderDynamics
@@ -17,11 +23,24 @@ traceback.install(show_locals=True, width=150, )
 
 #MARK: Game
 class Game:
-    def __init__(self) -> None:
+    def __init__(self, start_scene: str = "Village", entry_point: str = "start", record_file: PathLike | None = None, replay_file: PathLike | None = None) -> None:
         pygame.init()
         self.clock: pygame.time.Clock = pygame.time.Clock()
         # time elapsed in seconds (milliseconds as fraction) without pause time
         self.time_elapsed: float = 0.0
+        # number of frames rendered so far, loop stops after max_frames (0 = run forever)
+        self.frame_no: int = 0
+        self.max_frames: int = 0
+        # when set, used instead of real time passed between frames and FPS_CAP is not applied (e.g. benchmarks)
+        self.fixed_dt: float = 0.0
+        # time not yet simulated (less than one SIMULATION_STEP after the frame's steps)
+        self.accumulator: float = 0.0
+        # position of the drawn frame between the previous (0.0) and the last (1.0) simulation step
+        self.render_alpha: float = 1.0
+        # events of frames without simulation step, passed to the next step (e.g. menus)
+        self.pending_events: list[pygame.event.EventType] = []
+        # measures time of frame phases, toggled with 'profiler' action
+        self.profiler: Profiler = Profiler()
         
         pygame.display.set_caption(GAME_NAME)
         program_icon = pygame.image.load(PROGRAM_ICON)
@@ -44,13 +63,27 @@ class Game:
             pygame.display.gl_set_attribute(pygame.GL_CONTEXT_PROFILE_MASK, pygame.GL_CONTEXT_PROFILE_CORE)
             pygame.display.gl_set_attribute(pygame.GL_CONTEXT_FORWARD_COMPATIBLE_FLAG, True)
                 
-        self.flags = self.flags | pygame.OPENGL| pygame.DOUBLEBUF # pygame.RESIZABLE , | pygame.SCALED 
-        self.screen: pygame.Surface = pygame.display.set_mode((WIDTH*SCALE, HEIGHT*SCALE), self.flags, vsync=1)
+        if IS_HEADLESS:
+            self.screen: pygame.Surface = pygame.display.set_mode((WIDTH*SCALE, HEIGHT*SCALE), self.flags)
+        else:
+            self.flags = self.flags | pygame.OPENGL| pygame.DOUBLEBUF # pygame.RESIZABLE , | pygame.SCALED 
+            self.screen: pygame.Surface = pygame.display.set_mode((WIDTH*SCALE, HEIGHT*SCALE), self.flags, vsync=1)
             
+        # window size, canvas is scaled up (SCALE) to it by shader on GPU
+        size = self.screen.get_size()
+        # shader uploads screen to texture straight from its memory, so screen is a Surface with pixel format
+        # of the texture (the display Surface of OpenGL window is not used for drawing anyway), in canvas size
+        self.screen = create_upload_surface((WIDTH, HEIGHT))
         self.canvas: pygame.Surface = pygame.Surface((WIDTH, HEIGHT), self.flags) # , 32 .convert_alpha() # pygame.SRCALPHA
+        # changed parts of the canvas (USE_DIRTY_RECTS)
+        self.dirty_rects = DirtyRects((WIDTH, HEIGHT))
+        # next to the debug panel
+        self.profiler_rect = pygame.Rect(620, -10 + FONT_SIZE_MEDIUM * TEXT_ROW_SPACING, 600, 200)
 
-        size = self.screen.get_size()
-        self.shader = OpenGL_shader(size, DEFAULT_SHADER)
+        if IS_HEADLESS:
+            self.shader = Headless_shader(size, SHADER_PASSES, self.screen.get_size())
+        else:
+            self.shader = OpenGL_shader(size, SHADER_PASSES, self.screen.get_size())
 
         self.fonts = {}
         font_sizes = [FONT_SIZE_SMALL, FONT_SIZE_MEDIUM, FONT_SIZE_LARGE]
@@ -63,26 +96,50 @@ class Game:
         # stacked game states (e.g. Scene, Menu)
         from state import State
         self.states: list[State] = []
-        # dict of custom events with callable functions (not used for now since pygame.time.set_timer is not implemented in pygbag)
-        self.custom_events: dict[int, callable] = {}
+        # keys => actions, state of actions (INPUTS) and actions pressed/released in the current frame
+        self.input_map: InputMap = InputMap()
+        # mouse position of the current frame (recorded or replayed with other inputs)
+        self.mouse_pos: tuple[int, int] = (0, 0)
+        # inputs of every frame written to file or read from it instead of keyboard and mouse (see input_recorder.py),
+        # both set seed of random, so they must be created before the first scene
+        self.input_recorder: InputRecorder | None = None
+        self.input_replay: InputReplay | None = None
+        if replay_file:
+            self.input_replay = InputReplay(replay_file)
+            start_scene = self.input_replay.start_scene
+            entry_point = self.input_replay.entry_point
+        elif record_file:
+            self.input_recorder = InputRecorder(record_file, start_scene, entry_point, list(INPUTS.keys()))
+        # recorded run must be repeatable: no wall clock dependent work (e.g. path finding time budget)
+        # and no pause when window loses focus
+        self.is_deterministic: bool = bool(self.input_recorder or self.input_replay)
+        # callbacks scheduled in game time (e.g. end of NPC stun, spawning particles), advanced with time_elapsed
+        self.timer_wheel: TimerWheel = TimerWheel()
+        # parsed maps kept for re-entering scenes
+        from map_cache import MapCache
+        self.map_cache = MapCache()
         # moved imports here to avoid circular imports
         # import menus
         # start_state = menus.MainMenuScreen(self, "MainMenu")
         # self.states.append(start_state)
         import scene
-        start_state = scene.Scene(self, "Village", "start")
+        start_state = scene.Scene(self, start_scene, entry_point)
         # start_state = scene.Scene(self, "Maze", "start", is_maze=True, maze_cols=10, maze_rows=5)
         start_state.enter_state()
         self.states.append(start_state)
         # self.states.append(start_state)
         
         if USE_CUSTOM_MOUSE_CURSOR:
-            cursor_img = pygame.image.load(MOUSE_CURSOR_IMG)
+            cursor_img = texture_atlas.get(MOUSE_CURSOR_IMG)
             scale = cursor_img.get_width() // (TILE_SIZE)
             self.cursor_img = pygame.transform.scale(cursor_img, (scale, scale)).convert_alpha()
             # self.cursor_img = pygame.transform.invert(self.cursor_img)
             self.cursor_img.set_alpha(150)
             pygame.mouse.set_visible(False)
+            # where the cursor is blitted in this and the previous frame (see update_cursor)
+            self.cursor_pos: Sequence[float] = (0, 0)
+            self.cursor_rect = pygame.Rect(0, 0, 0, 0)
+            self.prev_cursor_rect = pygame.Rect(0, 0, 0, 0)
         if USE_SOD:
             self.init_SOD()
 
@@ -105,6 +162,11 @@ class Game:
                         rect (Rect): Size and position of rect
                         color (str|Sequence[int]): color to fill in the rect (with alpha)
             """        
+            if USE_DIRTY_RECTS:
+                key = ("panel", tuple(rect), str(color))
+                if self.dirty_rects.is_overlay_drawn(key):
+                    return
+                self.dirty_rects.add_overlay(key, rect.copy())
             surf = pygame.Surface(rect.size, pygame.SRCALPHA)
             pygame.draw.rect(surf, color, surf.get_rect())
             self.canvas.blit(surf, rect)        
@@ -143,6 +205,10 @@ class Game:
         """
         Blit line of text on game.canvas
         """
+        if USE_DIRTY_RECTS:
+            key = ("text", text, tuple(pos), str(color), str(bg_color), shadow, font_size, centred)
+            if self.dirty_rects.is_overlay_drawn(key):
+                return
         selected_font = self.font
         if self.fonts.get(font_size, False):
             selected_font = self.fonts[font_size]
@@ -168,15 +234,21 @@ class Game:
             self.canvas.blit(surf_shadow, (rect.x, rect.y+offset))
             
         self.canvas.blit(surf, rect)
+
+        if USE_DIRTY_RECTS:
+            drawn_rect = rect.inflate(4, 4) if shadow else rect.copy()
+            if bg_color:
+                drawn_rect.union_ip(bg_rect)
+            self.dirty_rects.add_overlay(key, drawn_rect)
         
-    def custom_cursor(self, screen: pygame.Surface):
+    def update_cursor(self):
         """
-        blit custom cursor in mouse current position if USE_CUSTOM_MOUSE_CURSOR is enabled
+        position of custom cursor in this frame, known before drawing, so it can be reported as dirty rect
         """
         if not USE_CUSTOM_MOUSE_CURSOR:
             return
         
-        cursor_rect = self.cursor_img.get_frect(center=pygame.mouse.get_pos())
+        cursor_rect = self.cursor_img.get_frect(center=self.mouse_pos)
         
         if USE_SOD:
             pos = vec(cursor_rect.center)
@@ -190,9 +262,20 @@ class Game:
             
             res[0] = min(WIDTH - 8, res[0])
             res[1] = min(HEIGHT - 8, res[1])
-            screen.blit(self.cursor_img, res)
+            self.cursor_pos = res
         else:
-            screen.blit(self.cursor_img, cursor_rect.center)
+            self.cursor_pos = cursor_rect.center
+        self.prev_cursor_rect = self.cursor_rect
+        # 1 px margin for rounding of float position
+        self.cursor_rect = self.cursor_img.get_rect(topleft=(int(self.cursor_pos[0]), int(self.cursor_pos[1]))).inflate(2, 2)
+
+    def custom_cursor(self, screen: pygame.Surface):
+        """
+        blit custom cursor in mouse current position if USE_CUSTOM_MOUSE_CURSOR is enabled
+        """
+        if not USE_CUSTOM_MOUSE_CURSOR:
+            return
+        screen.blit(self.cursor_img, self.cursor_pos)
         
     def get_images(self, path: str):
         images = []
@@ -232,69 +315,81 @@ class Game:
             
         # self.reset_inputs()
             
-    def register_custom_event(self, custom_event_id: int, handle_function: callable):
-        self.custom_events[custom_event_id] = handle_function
-    
+    def save_profiler_trace(self):
+        """
+        save frames recorded by profiler to SCREENSHOT_FOLDER as Chrome trace JSON with timestamp in name
+        """
+        time_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_name = SCREENSHOTS_DIR / f"trace_{time_str}.json"
+        self.profiler.export_chrome_trace(file_name)
+        if IS_WEB:
+            import platform
+            platform.window.download_from_browser_fs(file_name.as_posix(), "application/json")
+        else:
+            print(f"profiler trace saved to file '{file_name}'")
+            
     #MARK: get_inputs
     def get_inputs(self) -> list[pygame.event.EventType]:
+        input_map = self.input_map
+        input_map.begin_frame()
         events = pygame.event.get()
         for event in events:
             if event.type == pygame.QUIT:
                 self.is_running = False
+                if self.input_recorder:
+                    self.input_recorder.close()
                 pygame.quit()
                 sys.exit()
                 
             global IS_PAUSED
             
-            if event.type in [pygame.WINDOWHIDDEN, pygame.WINDOWMINIMIZED, pygame.WINDOWFOCUSLOST]:
+            if event.type in [pygame.WINDOWHIDDEN, pygame.WINDOWMINIMIZED, pygame.WINDOWFOCUSLOST] and not self.is_deterministic:
                 IS_PAUSED = True
                 print(f"{IS_PAUSED=}")
                 
             elif event.type in [pygame.WINDOWSHOWN, pygame.WINDOWMAXIMIZED, pygame.WINDOWRESTORED, pygame.WINDOWFOCUSGAINED]:
                 IS_PAUSED = False
                 # print(f"{IS_PAUSED=}")
-            elif event.type in self.custom_events:
-                handler = self.custom_events[event.type]
-                handler()
             elif event.type == pygame.KEYDOWN:
-                for action, definition in ACTIONS.items():
-                    if event.key in definition["keys"]:
-                        INPUTS[action] = True
+                input_map.key_down(event.key)
             elif event.type == pygame.KEYUP:
-                for action, definition in ACTIONS.items():
-                    if event.key in definition["keys"]:
-                        INPUTS[action] = False
+                input_map.key_up(event.key)
                                     
             elif event.type == pygame.MOUSEWHEEL:
+                # wheel has no release event, actions are pressed only for this frame
                 if event.y == 1:
-                    INPUTS["scroll_up"] = True
-                    INPUTS["zoom_in"] = True
+                    input_map.pulse("scroll_up")
+                    input_map.pulse("zoom_in")
                 elif event.y == -1:
-                    INPUTS["scroll_down"] = True
-                    INPUTS["zoom_out"] = True
+                    input_map.pulse("scroll_down")
+                    input_map.pulse("zoom_out")
                     
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:
-                    INPUTS["left_click"] = True
+                    input_map.press("left_click")
                 elif event.button == 3:
-                    INPUTS["right_click"] = True
+                    input_map.press("right_click")
                 elif event.button == 4:
-                    INPUTS["scroll_click"] = True
+                    input_map.press("scroll_click")
                     
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1:
-                    INPUTS["left_click"] = False
+                    input_map.release("left_click")
                 elif event.button == 3:
-                    INPUTS["right_click"] = False
+                    input_map.release("right_click")
                 elif event.button == 4:
-                    INPUTS["scroll_click"] = False
+                    input_map.release("scroll_click")
+
+        self.mouse_pos = pygame.mouse.get_pos()
+        if self.input_replay:
+            self.input_replay.apply(input_map)
+            self.mouse_pos = self.input_replay.mouse_pos
                     
         global USE_SHADERS
-        if INPUTS["shaders_toggle"]:
+        if input_map.is_pressed("shaders_toggle"):
             USE_SHADERS = not USE_SHADERS
-            INPUTS["shaders_toggle"] = False            
         
-        elif INPUTS["next_shader"]:
+        elif input_map.is_pressed("next_shader"):
             shader_index = SHADERS_NAMES.index(self.shader.shader_name)
             if shader_index < 0:
                 shader_index = 0
@@ -304,13 +399,43 @@ class Game:
                     shader_index = 0
                     
             self.shader.create_pipeline(SHADERS_NAMES[shader_index])
-            INPUTS["next_shader"] = False            
+        
+        if input_map.is_pressed("profiler"):
+            self.profiler.toggle()
+            
+        if input_map.is_pressed("profiler_save"):
+            self.save_profiler_trace()
                     
         return events
                     
     def reset_inputs(self):
-        for key in ACTIONS.keys():
-            INPUTS[key] = False
+        self.input_map.reset()
+
+    #MARK: fixed_update
+    def fixed_update(self, dt: float, events: list[pygame.event.EventType]):
+        """
+        run as many SIMULATION_STEPs as fit into the time accumulated so far (at most MAX_SIMULATION_STEPS),
+        so physics, jumps and timers don't depend on frame rate and a slow frame can't move actors through walls
+        """
+        self.accumulator += dt
+        self.pending_events.extend(events)
+        steps = 0
+        while self.accumulator >= SIMULATION_STEP and steps < MAX_SIMULATION_STEPS:
+            self.accumulator -= SIMULATION_STEP
+            self.time_elapsed += SIMULATION_STEP
+            self.timer_wheel.update(self.time_elapsed)
+            # events (and edges of input_map) are handled by the first step only
+            self.input_map.begin_step()
+            events, self.pending_events = self.pending_events, []
+            self.states[-1].update(SIMULATION_STEP, events)
+            self.input_map.end_step()
+            steps += 1
+        if steps == MAX_SIMULATION_STEPS:
+            # too slow to catch up - drop the rest
+            self.accumulator %= SIMULATION_STEP
+        if steps == 0:
+            self.input_map.carry()
+        self.render_alpha = self.accumulator / SIMULATION_STEP
             
     #MARK: loop
     async def loop(self):
@@ -318,32 +443,87 @@ class Game:
         
         while self.is_running:
             # delta time since last frame in milliseconds
-            dt = self.clock.tick(FPS_CAP) / 1000
-            events = []
-            events = self.get_inputs()
+            if self.input_replay:
+                self.clock.tick()
+                dt = self.input_replay.next_frame()
+                if dt is None:
+                    break
+            elif self.fixed_dt:
+                self.clock.tick()
+                dt = self.fixed_dt
+            else:
+                dt = self.clock.tick(FPS_CAP) / 1000
+            profiler = self.profiler
+            profiler.begin_frame()
+            
+            with profiler.scope("input"):
+                events = self.get_inputs()
+                if self.input_recorder:
+                    self.input_recorder.record(dt, self.input_map, self.mouse_pos)
+            
+            # maps prefetched in background
+            self.map_cache.update()
 
             # first draw on separate Surface (game.canvas)
-            if not IS_PAUSED:
-                self.time_elapsed += dt
-                self.states[-1].update(dt, events)
-            self.canvas.fill((0,0,0,0))
-            self.states[-1].draw(self.canvas, dt)
-            self.custom_cursor(self.canvas)
+            with profiler.scope("update"):
+                if not IS_PAUSED:
+                    if USE_FIXED_TIMESTEP:
+                        self.fixed_update(dt, events)
+                    else:
+                        self.time_elapsed += dt
+                        self.timer_wheel.update(self.time_elapsed)
+                        self.states[-1].update(dt, events)
             
-            if IS_PAUSED:
-                self.render_text("PAUSED", (WIDTH*SCALE // 2, HEIGHT*SCALE // 2), font_size=FONT_SIZE_LARGE, centred=True, bg_color=(10,10,10,150), shadow=True)
+            with profiler.scope("draw"):
+                self.update_cursor()
+                state = self.states[-1]
+                if USE_DIRTY_RECTS:
+                    # State clears the changed part of the canvas itself (after reporting its rects)
+                    dirty_rects = self.dirty_rects
+                    dirty_rects.begin_frame(state)
+                    if USE_CUSTOM_MOUSE_CURSOR and self.cursor_rect != self.prev_cursor_rect:
+                        dirty_rects.add(self.prev_cursor_rect)
+                        dirty_rects.add(self.cursor_rect)
+                    if profiler.show_overlay:
+                        dirty_rects.add(self.profiler_rect)
+                    if not state.tracks_dirty_rects:
+                        dirty_rects.add_full()
+                        dirty_rects.begin_draw(self.canvas)
+                else:
+                    self.canvas.fill((0,0,0,0))
+                state.draw(self.canvas, dt)
+                
+                if IS_PAUSED:
+                    self.render_text("PAUSED", (WIDTH*SCALE // 2, HEIGHT*SCALE // 2), font_size=FONT_SIZE_LARGE, centred=True, bg_color=(10,10,10,150), shadow=True)
+                
+                if profiler.show_overlay:
+                    profiler.draw(self, self.profiler_rect)
             
-            # than scale and copy on final Surface (game.screen)
-            if SCALE != 1:
-                self.screen.blit(pygame.transform.scale_by(self.canvas, SCALE), (0,0))
-            else:
-                self.screen.blit(self.canvas, (0,0))
+            with profiler.scope("cursor"):
+                self.custom_cursor(self.canvas)
+            # None - the whole canvas has changed
+            dirty_rect = self.dirty_rects.end_draw(self.canvas) if USE_DIRTY_RECTS else None
+            
+            # than copy on final Surface (game.screen), scaled up to the window by shader (nearest neighbour)
+            with profiler.scope("scale_blit"):
+                if dirty_rect is None:
+                    self.screen.blit(self.canvas, (0,0))
+                elif dirty_rect:
+                    self.screen.blit(self.canvas, dirty_rect, dirty_rect)
             # shaders are used for postprocessing special effects
             # the whole Surface is used as texture on rect that fills to a full screen
             
-            self.shader.render(self.screen, dt, USE_SHADERS)
+            with profiler.scope("shader"):
+                self.shader.render(self.screen, dt, USE_SHADERS, dirty_rect)
                 
-            pygame.display.flip()
-            await asyncio.sleep(0)
+            with profiler.scope("flip"):
+                pygame.display.flip()
+            profiler.end_frame()
             
-            
\ No newline at end of file
+            self.frame_no += 1
+            if self.max_frames and self.frame_no >= self.max_frames:
+                self.is_running = False
+            await asyncio.sleep(0)
+
+        if self.input_recorder:
+            self.input_recorder.close()
@@ -0,0 +1,124 @@
+from settings import *
+
+
+#####################################################################################################################
+#MARK: InputMap
+class InputMap:
+    """
+    Maps keys to actions (see ACTIONS in settings) and keeps the state of actions:
+    INPUTS[action] is True while the action is held (level), pressed/released contain actions
+    which went down/up in the current frame (edges), so one-shot actions (e.g. jump, zoom) are checked
+    with is_pressed instead of reading INPUTS and resetting it by hand.
+    ACTIONS are compiled into key => actions index once (and again after rebind), one key can trigger many actions.
+    """
+    def __init__(self, actions: dict[str, dict] = ACTIONS) -> None:
+        self.actions = actions
+        self.key_actions: dict[int, tuple[str, ...]] = {}
+        # actions which went down/up in the current frame
+        self.pressed: set[str] = set()
+        self.released: set[str] = set()
+        # actions without release event (e.g. mouse wheel), released at the beginning of the next frame
+        self.pulsed: set[str] = set()
+        # edges of frames in which no simulation step was run (see Game.loop), seen by the next step
+        self.carried_pressed: set[str] = set()
+        self.carried_released: set[str] = set()
+        self.compile()
+
+    def compile(self):
+        key_actions: dict[int, list[str]] = {}
+        for action, definition in self.actions.items():
+            for key in definition["keys"]:
+                key_actions.setdefault(key, []).append(action)
+        self.key_actions = {key: tuple(actions) for key, actions in key_actions.items()}
+
+    def rebind(self, action: str, keys: list[int]):
+        """
+        replace keys of action (at runtime, e.g. from settings menu)
+        """
+        if action not in self.actions:
+            raise KeyError(f"unknown action: {action}")
+        self.release(action)
+        self.actions[action]["keys"] = list(keys)
+        self.compile()
+
+    def begin_frame(self):
+        """
+        forget edges of the previous frame, must be called before events of the frame are processed
+        """
+        self.pressed.clear()
+        self.released.clear()
+        for action in self.pulsed:
+            INPUTS[action] = False
+        self.pulsed.clear()
+
+    #MARK: simulation steps
+    def begin_step(self):
+        """
+        add edges carried from frames without simulation step, call before each step
+        """
+        if self.carried_pressed or self.carried_released:
+            self.pressed |= self.carried_pressed
+            self.released |= self.carried_released
+            self.carried_pressed.clear()
+            self.carried_released.clear()
+
+    def end_step(self):
+        """
+        edges are seen only by the first simulation step of a frame (one-shot actions mustn't repeat)
+        """
+        self.pressed.clear()
+        self.released.clear()
+
+    def carry(self):
+        """
+        keep edges of the current frame for the next simulation step (frame ran no step)
+        """
+        self.carried_pressed |= self.pressed
+        self.carried_released |= self.released
+
+    #MARK: events
+    def key_down(self, key: int):
+        for action in self.key_actions.get(key, ()):
+            self.press(action)
+
+    def key_up(self, key: int):
+        for action in self.key_actions.get(key, ()):
+            self.release(action)
+
+    def press(self, action: str):
+        INPUTS[action] = True
+        self.pressed.add(action)
+
+    def release(self, action: str):
+        if INPUTS.get(action):
+            self.released.add(action)
+        INPUTS[action] = False
+
+    def pulse(self, action: str):
+        """
+        press action only for the current frame
+        """
+        self.press(action)
+        self.pulsed.add(action)
+
+    #MARK: queries
+    def is_held(self, action: str) -> bool:
+        return INPUTS.get(action, False)
+
+    def is_pressed(self, action: str) -> bool:
+        return action in self.pressed
+
+    def is_released(self, action: str) -> bool:
+        return action in self.released
+
+    def reset(self):
+        """
+        release all actions without recording edges (e.g. when game state changes)
+        """
+        for action in INPUTS:
+            INPUTS[action] = False
+        self.pressed.clear()
+        self.released.clear()
+        self.pulsed.clear()
+        self.carried_pressed.clear()
+        self.carried_released.clear()
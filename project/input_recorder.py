@@ -0,0 +1,127 @@
+"""
+Recording and replay of player inputs, so the same run can be repeated (e.g. timed across commits).
+
+File format (little endian):
+    header: magic "GREC", version (u16), seed of random (u64), start scene, entry point and names of actions
+            (each as u16 length + UTF-8 bytes, names preceded by their count u16)
+    frames: zlib stream of FRAME records - dt (f64), mouse position (2 x i16), held actions and actions pressed
+            in this frame (2 x u64 bit masks, bit number == index of action name in header)
+"""
+import random
+import struct
+import zlib
+from os import PathLike
+from input_map import InputMap
+from settings import *
+
+MAGIC = b"GREC"
+VERSION = 1
+HEADER = struct.Struct("<4sHQ")
+FRAME = struct.Struct("<dhhQQ")
+MAX_ACTIONS = 64
+
+
+def write_string(f, text: str):
+    data = text.encode("UTF-8")
+    f.write(struct.pack("<H", len(data)))
+    f.write(data)
+
+
+def read_string(f) -> str:
+    (length,) = struct.unpack("<H", f.read(2))
+    return f.read(length).decode("UTF-8")
+
+
+#####################################################################################################################
+#MARK: InputRecorder
+class InputRecorder:
+    """
+    Writes inputs of every frame (after events are processed) to a file.
+    Seed of random is chosen and set in constructor, so it must be created before anything random happens
+    (NPC speed, maze, particles) - Game does it before the first scene is created.
+    """
+    def __init__(self, file_name: PathLike, start_scene: str, entry_point: str, actions: list[str]) -> None:
+        if len(actions) > MAX_ACTIONS:
+            raise ValueError(f"at most {MAX_ACTIONS} actions can be recorded, got {len(actions)}")
+        self.actions = actions
+        self.seed = random.randrange(2**32)
+        random.seed(self.seed)
+        self.frames_cnt = 0
+        self.file = open(file_name, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.seed))
+        write_string(self.file, start_scene)
+        write_string(self.file, entry_point)
+        self.file.write(struct.pack("<H", len(actions)))
+        for action in actions:
+            write_string(self.file, action)
+        self.compressor = zlib.compressobj(9)
+
+    def record(self, dt: float, input_map: InputMap, mouse_pos: tuple[int, int]):
+        held = pressed = 0
+        for bit, action in enumerate(self.actions):
+            if input_map.is_held(action):
+                held |= 1 << bit
+            if input_map.is_pressed(action):
+                pressed |= 1 << bit
+        self.file.write(self.compressor.compress(FRAME.pack(dt, int(mouse_pos[0]), int(mouse_pos[1]), held, pressed)))
+        self.frames_cnt += 1
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.write(self.compressor.flush())
+        self.file.close()
+        print(f"{self.frames_cnt} frames of inputs recorded (seed: {self.seed})")
+
+
+#####################################################################################################################
+#MARK: InputReplay
+class InputReplay:
+    """
+    Reads file written by InputRecorder and sets the same seed of random, dt, mouse position and actions
+    for every frame (real keyboard and mouse are ignored).
+    """
+    def __init__(self, file_name: PathLike) -> None:
+        with open(file_name, "rb") as f:
+            magic, version, self.seed = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"'{file_name}' is not an input recording (version {VERSION})")
+            self.start_scene = read_string(f)
+            self.entry_point = read_string(f)
+            (actions_cnt,) = struct.unpack("<H", f.read(2))
+            self.actions = [read_string(f) for _ in range(actions_cnt)]
+            # recording interrupted without close has truncated stream, all complete frames are used
+            data = zlib.decompressobj().decompress(f.read())
+        self.frames = list(FRAME.iter_unpack(data[:len(data) - len(data) % FRAME.size]))
+        self.frame_no = -1
+        self.mouse_pos: tuple[int, int] = (0, 0)
+        random.seed(self.seed)
+
+    @property
+    def frames_cnt(self) -> int:
+        return len(self.frames)
+
+    def next_frame(self) -> float | None:
+        """
+        move to the next frame, returns its dt or None when the recording has ended
+        """
+        self.frame_no += 1
+        if self.frame_no >= len(self.frames):
+            return None
+        return self.frames[self.frame_no][0]
+
+    def apply(self, input_map: InputMap):
+        """
+        replace state of actions (and edges) with the current frame, must be called after InputMap.begin_frame
+        """
+        _, mouse_x, mouse_y, held, pressed = self.frames[self.frame_no]
+        self.mouse_pos = (mouse_x, mouse_y)
+        input_map.pressed.clear()
+        input_map.released.clear()
+        for bit, action in enumerate(self.actions):
+            is_held = bool(held >> bit & 1)
+            if INPUTS.get(action) and not is_held:
+                input_map.released.add(action)
+            INPUTS[action] = is_held
+            if pressed >> bit & 1:
+                input_map.pressed.add(action)
@@ -14,6 +14,7 @@
 #  "rich",
 #  "Pygments",
 #  "zengl",
+#  "numpy",
 #  "struct",
 #  "pathlib",
 # ]
@@ -21,9 +22,19 @@
 
 import asyncio
 from game import Game
+from settings import IS_WEB
 
 def main():
-    game = Game()    
+    record_file = replay_file = None
+    if not IS_WEB:
+        # ./main.py --record run.grec  => play and record inputs, ./main.py --replay run.grec => watch it again
+        import argparse
+        parser = argparse.ArgumentParser(description="The Game")
+        parser.add_argument("--record", help="record inputs to file")
+        parser.add_argument("--replay", help="replay inputs recorded with --record")
+        args = parser.parse_args()
+        record_file, replay_file = args.record, args.replay
+    game = Game(record_file=record_file, replay_file=replay_file)
     asyncio.run(game.loop())
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Generator
+import pygame
+import pytmx
+from pytmx.util_pygame import load_pygame
+from maze_generator.nav_grid import NavGrid
+from maze_generator.path_search import ClusterGraph
+from settings import *
+
+
+#####################################################################################################################
+#MARK: MapData
+class MapData:
+    """
+    Everything parsed from TMX map which doesn't change while the scene is played:
+    TiledMap (with tileset surfaces), wall rects and base NavGrid (and its HPA cluster graph).
+    The renderer (camera) is changed by the scene (zoom, animated tiles), so each Scene creates its own.
+    With lazy set nothing is built in constructor, build steps are run one by one by the caller (see load_map_async).
+    """
+    def __init__(self, tileset_map: pytmx.TiledMap, lazy: bool = False) -> None:
+        self.tileset_map = tileset_map
+        self.layers: list[str] = [layer.name for layer in tileset_map.layers]
+        self.walls: list[pygame.Rect] = []
+        self.nav_grid: NavGrid | None = None
+        self.cluster_graph: ClusterGraph | None = None
+        if not lazy:
+            for _ in self.build():
+                pass
+
+    def build(self) -> Generator[None, None, None]:
+        tileset_map = self.tileset_map
+        # 'walls' layer contains tiles that collide with characters
+        if "walls" in self.layers:
+            for x, y, surf in tileset_map.get_layer_by_name("walls").tiles():
+                self.walls.append(pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, surf.get_width(), surf.get_height()))
+                # can be created as sprites if needed
+                # Wall([self.block_sprites], (x * TILE_SIZE, y * TILE_SIZE), "blocks", surf)
+
+        # walls are blocked, other tiles have step cost from tiles properties (e.g. road is faster, water slower)
+        # scenes get a copy, so the step cost changed in one scene doesn't leak into the cache
+        self.nav_grid = NavGrid.from_tiled_map(tileset_map)
+        yield
+
+        # the slowest part of "hpa" path finding, done here so it runs in prefetch instead of the first search
+        if PATH_FINDING_ENGINE == "hpa":
+            self.cluster_graph = ClusterGraph(self.nav_grid, HPA_CLUSTER_SIZE)
+            self.cluster_graph.build()
+            yield
+
+
+def load_map(map_name: str) -> MapData:
+    return MapData(load_pygame(MAPS_DIR / f"{map_name}.tmx"))
+
+
+async def load_map_async(map_name: str) -> MapData:
+    """
+    load_map split into steps, control is given back to Game.loop after each step
+    (parsing TMX file is the longest step and it can't be split)
+    """
+    tileset_map = load_pygame(MAPS_DIR / f"{map_name}.tmx")
+    await asyncio.sleep(0)
+    map_data = MapData(tileset_map, lazy=True)
+    for _ in map_data.build():
+        await asyncio.sleep(0)
+    return map_data
+
+
+#####################################################################################################################
+#MARK: MapCache
+class MapCache:
+    """
+    LRU cache of parsed maps (MapData) keyed by map name, so going back and forth through exits
+    (e.g. between Village and VillageHouse) doesn't parse TMX file and build walls and nav grid again.
+    At most cache_size maps are kept, the least recently used one is dropped first.
+    Generated mazes are not cached (new maze is generated on each entry).
+
+    Maps can be prefetched in background (e.g. targets of exits of the current scene):
+    on desktop in a worker thread, on web (no threads) as asyncio task started from update (called by Game.loop).
+    Prefetched maps are added right behind the map of the active scene (the most recently used one),
+    so they never push out the active map and they are not dropped before the scene is left.
+    """
+    def __init__(self, cache_size: int = MAP_CACHE_SIZE) -> None:
+        self.cache_size = cache_size
+        self.cache: OrderedDict[str, MapData] = OrderedDict()
+        # map name => thread future (desktop) or asyncio task (web) loading the map
+        self.loading: dict[str, Future | asyncio.Task] = {}
+        # maps waiting for asyncio task (web loads one map at a time)
+        self.queue: list[str] = []
+        self.executor: ThreadPoolExecutor | None = None if IS_WEB else ThreadPoolExecutor(max_workers=1, thread_name_prefix="map_prefetch")
+
+    def get(self, map_name: str) -> MapData:
+        """
+        cached map, map loaded in background (waits for the worker thread if it is not done yet)
+        or map loaded right now
+        """
+        self.collect()
+        if map_name in self.cache:
+            self.cache.move_to_end(map_name)
+            return self.cache[map_name]
+
+        map_data = None
+        task = self.loading.pop(map_name, None)
+        if isinstance(task, Future):
+            map_data = task.result()
+        elif task:
+            # unfinished asyncio task can't be waited for here
+            task.cancel()
+        if map_data is None:
+            map_data = load_map(map_name)
+        self.add(map_name, map_data)
+        return map_data
+
+    def add(self, map_name: str, map_data: MapData, is_prefetched: bool = False):
+        active_map = next(reversed(self.cache), None) if is_prefetched else None
+        self.cache[map_name] = map_data
+        if active_map is not None and active_map != map_name:
+            self.cache.move_to_end(active_map)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    #MARK: prefetch
+    def prefetch(self, map_names: list[str]):
+        for map_name in map_names:
+            if map_name in self.cache or map_name in self.loading or map_name in self.queue:
+                continue
+            if self.executor:
+                self.loading[map_name] = self.executor.submit(load_map, map_name)
+            else:
+                self.queue.append(map_name)
+
+    def update(self):
+        """
+        move maps loaded in background to the cache and start next asyncio task, must be called every frame
+        """
+        self.collect()
+        if self.queue and not self.loading:
+            map_name = self.queue.pop(0)
+            if map_name not in self.cache:
+                self.loading[map_name] = asyncio.create_task(load_map_async(map_name))
+
+    def collect(self):
+        for map_name, task in list(self.loading.items()):
+            if not task.done():
+                continue
+            del self.loading[map_name]
+            if task.cancelled():
+                continue
+            if task.exception():
+                print(f"[red]ERROR[/] prefetch of map '{map_name}' failed: {task.exception()}")
+                continue
+            self.add(map_name, task.result(), is_prefetched=True)
+
+    def remove(self, map_name: str):
+        """
+        forget map, so it is loaded from file next time (e.g. after live reload)
+        """
+        self.cache.pop(map_name, None)
@@ -3,6 +3,7 @@ import pytmx
 from pygame.math import Vector2 as vec
 # from project.settings import TILE_SIZE
 from .maze import Maze
+from .nav_grid import NavGrid
 
 from functools import partial
 from rich import inspect, pretty, print
@@ -40,77 +41,132 @@ def heuristic(point, goal):
     return abs(point[0] - goal[0]) + abs(point[1] - goal[1])
 
 # def is_diagonal(p)
-def a_star(grid, start, goal):
+def a_star(grid: NavGrid, start, goal, stats: dict | None = None):
     # https://panda-man.medium.com/a-pathfinding-algorithm-efficiently-navigating-the-maze-of-possibilities-8bb16f9cecbd
+    if not grid.is_inside(*start) or not grid.is_inside(*goal):
+        return None
+    
+    # nodes are flat indexes of grid cells, permitted moves and their costs are precomputed in NavGrid 
+    # (orthogonal move cost == step cost, diagonal move cost == sqrt(2) * step cost, no cutting blocked corners)
+    moves, costs, offsets = grid.moves, grid.costs, grid.offsets
+    directions = range(len(offsets))
+    start_index = grid.to_index(start)
+    goal_index = grid.to_index(goal)
     open_set = []
 
     # Priority queue with (F-score, node)
-    heapq.heappush(open_set, (0, start))
+    heapq.heappush(open_set, (0, start_index))
     came_from = {}
-    g_score = {start: 0}
+    g_score = {start_index: 0}
+    expanded = 0
     
     while open_set:
         _, current = heapq.heappop(open_set)
+        expanded += 1
         
-        if current == goal:
+        if current == goal_index:
+            if stats is not None:
+                stats["expanded"] = expanded
             # Reconstruct the path and return
             path = []
             while current in came_from:
-                path.append(current)
+                path.append(grid.to_node(current))
                 current = came_from[current]
             path.append(start)
             path.reverse()
             return path
         
-        # 8 dir
-        for d in [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, -1), (-1, 1),]:
-        
-        # 4 dir
-        # for d in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            dx, dy = d
-            is_diagonal = (abs(dx) + abs(dy)) > 1
-            x, y = current[0] + dx, current[1] + dy
-            neighbor = (x, y)
-
-            # Assuming uniform cost for each step
-            # tentative_g = g_score[current] + 1
-            # orthogonal move cost == 100 diagonal move cost == sqrt(2)
-            # node with negative value indicates custom step cost (e.g. water = -200)
-            tentative_g = g_score[current] + abs(grid[x][y]) if not is_diagonal else g_score[current] + int(abs(-grid[x][y] * 1.41))
-            # move permitted if new node is not blocked
-            # move_permitted = grid[x][y] == 0
-            
-            # all orthogonal moves are permitted, orthogonal move permitted only if not passing blocked corner
-            # e.g. move from S to G (X == blocked)
-            #    |   |
-            # ---+---+---
-            #    | S |       Permitted
-            # ---+---+---
-            #  G |   |
-            
-            #    |   |
-            # ---+---+---
-            #    | S |       Not permitted
-            # ---+---+---
-            #  G | X |
-            
-            #    |   |
-            # ---+---+---
-            #  X | S |       Not permitted
-            # ---+---+---
-            #  G |   |
-            
-            if 0 <= x < len(grid) and 0 <= y < len(grid[0]):
-                move_permitted = grid[x][y] <= 0 if not is_diagonal else (grid[x][y] <= 0 and grid[x][current[1]] <= 0 and grid[current[0]][y] <= 0)
-                if move_permitted:
-                    if neighbor not in g_score or tentative_g < g_score[neighbor]:
-                        g_score[neighbor] = tentative_g
-                        f_score = tentative_g + heuristic(neighbor, goal) * 100
-                        heapq.heappush(open_set, (f_score, neighbor))
-                        came_from[neighbor] = current
+        current_g = g_score[current]
+        for d in directions:
+            if not moves[d][current]:
+                continue
+            neighbor = current + offsets[d]
+            tentative_g = current_g + costs[d][current]
+            if neighbor not in g_score or tentative_g < g_score[neighbor]:
+                g_score[neighbor] = tentative_g
+                f_score = tentative_g + heuristic(grid.to_node(neighbor), goal) * 100
+                heapq.heappush(open_set, (f_score, neighbor))
+                came_from[neighbor] = current
     
+    if stats is not None:
+        stats["expanded"] = expanded
     return None  # No path found
 
+
+class FlowField:
+    """
+    Dijkstra flow field toward a single goal (e.g. Player position), shared by all NPCs chasing it.
+    Instead of running A* for each NPC, every node knows its neighbor one step closer to the goal.
+    Search is lazy - nodes are expanded (in order of their distance to goal) only until the asked node is reached,
+    and it is restarted only when goal changes.
+    Uses the same step costs and corner cutting rules as a_star (precomputed in NavGrid).
+    """
+    def __init__(self, grid: NavGrid) -> None:
+        self.grid = grid
+        self.goal: tuple[int, int] | None = None
+        # nodes below are flat indexes of grid cells
+        self.open_set: list[tuple[int, int]] = []
+        # node => total cost of moving from node to goal
+        self.cost: dict[int, int] = {}
+        # node => neighbor one step closer to goal
+        self.next_step: dict[int, int] = {}
+        self.closed: set[int] = set()
+        
+    def reset(self):
+        """
+        forget calculated field, must be called whenever grid changes
+        """
+        self.goal = None
+        
+    def set_goal(self, goal: tuple[int, int]):
+        if goal == self.goal:
+            return
+        self.goal = goal
+        self.open_set = []
+        self.cost = {}
+        self.next_step = {}
+        self.closed = set()
+        if self.grid.is_inside(*goal):
+            goal_index = self.grid.to_index(goal)
+            self.open_set.append((0, goal_index))
+            self.cost[goal_index] = 0
+        
+    def get_next_step(self, node: tuple[int, int]) -> tuple[int, int] | None:
+        """
+        neighbor of node one step closer to goal, None if node is the goal or goal can't be reached from node
+        """
+        if not self.grid.is_inside(*node):
+            return None
+        index = self.grid.to_index(node)
+        while index not in self.closed and self.open_set:
+            self.expand()
+        next_step = self.next_step.get(index)
+        return None if next_step is None else self.grid.to_node(next_step)
+    
+    def expand(self):
+        cost, current = heapq.heappop(self.open_set)
+        if current in self.closed:
+            return
+        self.closed.add(current)
+        grid = self.grid
+        # it is possible to start on blocked node (like in a_star), but not to go through it
+        node = grid.to_node(current)
+        if node != self.goal and grid.is_blocked(*node):
+            return
+        
+        # neighbor can move to current node in direction d, if the move from neighbor in that direction is permitted
+        for d, offset in enumerate(grid.offsets):
+            neighbor = current - offset
+            if neighbor < 0 or neighbor >= len(grid.moves[d]) or neighbor in self.closed:
+                continue
+            if not grid.moves[d][neighbor]:
+                continue
+            tentative_cost = cost + grid.costs[d][neighbor]
+            if neighbor not in self.cost or tentative_cost < self.cost[neighbor]:
+                self.cost[neighbor] = tentative_cost
+                self.next_step[neighbor] = current
+                heapq.heappush(self.open_set, (tentative_cost, neighbor))
+
 # # Example usage:
 # grid = [
 #     [0, 0, 0, 0],
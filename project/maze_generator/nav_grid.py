@@ -0,0 +1,149 @@
+import numpy as np
+import pytmx
+
+# (row, column) offsets of 8 directions, in the order they are checked by a_star
+DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, -1), (-1, 1),]
+# 4 dir
+# DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+
+# grid value of tiles from 'walls' layer
+BLOCKED = 100
+# step cost of tiles without 'step_cost' property
+DEFAULT_STEP_COST = 100
+# multiplier of step cost for diagonal moves (~sqrt(2))
+DIAGONAL_COST = 1.41
+
+
+def get_shift_slices(offset: int) -> tuple[slice, slice]:
+    """
+    slices along one axis selecting (source, destination) cells of a move by offset (-1, 0 or 1)
+    """
+    if offset > 0:
+        return slice(None, -offset), slice(offset, None)
+    elif offset < 0:
+        return slice(-offset, None), slice(None, offset)
+    return slice(None), slice(None)
+
+
+class NavGrid:
+    """
+    Path finding grid of the map backed by 2-D int16 array (rows x columns, one value per tile):
+    positive value - tile is blocked, zero or negative - tile is walkable and abs(value) is the step cost
+    (e.g. road = -50, grass = -100, water = -200).
+
+    For each of 8 DIRECTIONS masks of permitted moves and their costs are precomputed
+    and kept as flat python lists (index = row * cols + column) for fast access in a_star and FlowField.
+    """
+    def __init__(self, data: np.ndarray) -> None:
+        self.data: np.ndarray = np.asarray(data, dtype=np.int16)
+        self.rows, self.cols = self.data.shape
+        # flat index offset of each direction
+        self.offsets: list[int] = [dr * self.cols + dc for dr, dc in DIRECTIONS]
+        # for each direction: is move from the cell permitted / cost of the move
+        self.moves: list[list[bool]] = []
+        self.costs: list[list[int]] = []
+        # step cost shared by all walkable tiles, None when tiles have different costs (see jump_point_search)
+        self.uniform_cost: int | None = None
+        self.min_cost: int = DEFAULT_STEP_COST
+        # flat list: is tile walkable
+        self.walkable: list[bool] = []
+        self.update_moves()
+
+    @classmethod
+    def from_tiled_map(cls, tileset_map: pytmx.TiledMap) -> "NavGrid":
+        """
+        tiles from 'walls' layer are blocked, other tiles present in the first layer use 'step_cost' property
+        of the tile from the second layer, first layer or DEFAULT_STEP_COST (in that order)
+        """
+        shape = (tileset_map.height, tileset_map.width)
+        # tile gid => step cost (-1 when tile has no 'step_cost' property)
+        step_costs = np.full(tileset_map.maxgid + 1, -1, dtype=np.int32)
+        for gid, properties in tileset_map.tile_properties.items():
+            if properties and "step_cost" in properties:
+                step_costs[gid] = properties["step_cost"]
+
+        layer_0 = np.array(tileset_map.layers[0].data, dtype=np.int32)
+        layer_1 = np.array(tileset_map.layers[1].data, dtype=np.int32)
+        cost = np.full(shape, DEFAULT_STEP_COST, dtype=np.int32)
+        cost = np.where(step_costs[layer_0] >= 0, step_costs[layer_0], cost)
+        cost = np.where(step_costs[layer_1] >= 0, step_costs[layer_1], cost)
+
+        data = np.where(layer_0 != 0, -cost, 0)
+        if "walls" in tileset_map.layernames:
+            walls = np.array(tileset_map.get_layer_by_name("walls").data, dtype=np.int32)
+            data = np.where(walls != 0, BLOCKED, data)
+
+        return cls(data)
+
+    def update_moves(self):
+        """
+        precompute permitted moves and their costs, must be called after data has changed
+        """
+        walkable = self.data <= 0
+        step_cost = np.abs(self.data.astype(np.int32))
+        walkable_costs = np.unique(step_cost[walkable])
+        self.uniform_cost = int(walkable_costs[0]) if len(walkable_costs) == 1 else None
+        self.min_cost = int(walkable_costs[0]) if len(walkable_costs) else DEFAULT_STEP_COST
+        self.walkable = walkable.ravel().tolist()
+        self.moves = []
+        self.costs = []
+        for dr, dc in DIRECTIONS:
+            src_rows, dst_rows = get_shift_slices(dr)
+            src_cols, dst_cols = get_shift_slices(dc)
+            is_diagonal = dr != 0 and dc != 0
+
+            # all orthogonal moves are permitted, diagonal move permitted only if not passing blocked corner
+            # e.g. move from S to G (X == blocked)
+            #    |   |
+            # ---+---+---
+            #    | S |       Permitted
+            # ---+---+---
+            #  G |   |
+
+            #    |   |
+            # ---+---+---
+            #    | S |       Not permitted
+            # ---+---+---
+            #  G | X |
+
+            #    |   |
+            # ---+---+---
+            #  X | S |       Not permitted
+            # ---+---+---
+            #  G |   |
+            permitted = np.zeros_like(walkable)
+            permitted[src_rows, src_cols] = walkable[dst_rows, dst_cols]
+            if is_diagonal:
+                permitted[src_rows, src_cols] &= walkable[dst_rows, src_cols] & walkable[src_rows, dst_cols]
+
+            # orthogonal move cost == step cost of destination tile, diagonal move cost == sqrt(2) * step cost
+            cost = np.zeros_like(step_cost)
+            if is_diagonal:
+                cost[src_rows, src_cols] = (step_cost[dst_rows, dst_cols] * DIAGONAL_COST).astype(np.int32)
+            else:
+                cost[src_rows, src_cols] = step_cost[dst_rows, dst_cols]
+
+            self.moves.append(permitted.ravel().tolist())
+            self.costs.append(cost.ravel().tolist())
+
+    def copy(self) -> "NavGrid":
+        return NavGrid(self.data.copy())
+
+    def is_inside(self, row: int, col: int) -> bool:
+        return 0 <= row < self.rows and 0 <= col < self.cols
+
+    def is_blocked(self, row: int, col: int) -> bool:
+        return bool(self.data[row, col] > 0)
+
+    def get_step_cost(self, row: int, col: int) -> int:
+        return abs(int(self.data[row, col]))
+
+    def set_value(self, row: int, col: int, value: int):
+        self.data[row, col] = value
+        self.update_moves()
+
+    def to_index(self, node: tuple[int, int]) -> int:
+        return node[0] * self.cols + node[1]
+
+    def to_node(self, index: int) -> tuple[int, int]:
+        return divmod(index, self.cols)
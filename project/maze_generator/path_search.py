@@ -0,0 +1,482 @@
+import heapq
+from typing import Generator
+from .maze_utils import a_star
+from .nav_grid import DIAGONAL_COST, DIRECTIONS, NavGrid
+
+Node = tuple[int, int]
+
+# index of the opposite direction for each of DIRECTIONS
+OPPOSITE = [DIRECTIONS.index((-dr, -dc)) for dr, dc in DIRECTIONS]
+# entrances wider than this get two transitions (one at each end) instead of one in the middle
+MAX_ENTRANCE_WIDTH = 6
+
+
+def sign(value: int) -> int:
+    return (value > 0) - (value < 0)
+
+
+def octile_distance(a: Node, b: Node, cost: int, diagonal_cost: int) -> int:
+    """
+    cost of the shortest path between a and b on open grid with uniform step cost
+    """
+    dr = abs(a[0] - b[0])
+    dc = abs(a[1] - b[1])
+    return min(dr, dc) * diagonal_cost + abs(dr - dc) * cost
+
+
+def expand_path(jump_points: list[Node]) -> list[Node]:
+    """
+    turn list of jump points (connected by straight or diagonal lines) into list of all visited tiles
+    """
+    path = [jump_points[0]]
+    for row, col in jump_points[1:]:
+        r, c = path[-1]
+        dr, dc = sign(row - r), sign(col - c)
+        while (r, c) != (row, col):
+            r += dr
+            c += dc
+            path.append((r, c))
+    return path
+
+
+#####################################################################################################################
+#MARK: JPS
+def jump_point_search(grid: NavGrid, start: Node, goal: Node, stats: dict | None = None) -> list[Node] | None:
+    """
+    Jump Point Search - A* which skips over tiles of open areas and long corridors
+    and expands only "jump points" (tiles where path may have to turn).
+    Uses the same rules as a_star (8 directions, no cutting blocked corners),
+    returns path of all tiles (like a_star) with optimal cost.
+    JPS requires uniform step cost, on grids with different step costs (e.g. roads) a_star is used instead.
+    """
+    if grid.uniform_cost is None:
+        return a_star(grid, start, goal, stats)
+    if not grid.is_inside(*start) or not grid.is_inside(*goal):
+        return None
+
+    rows, cols, walkable = grid.rows, grid.cols, grid.walkable
+    cost = grid.uniform_cost
+    diagonal_cost = int(cost * DIAGONAL_COST)
+
+    def walk(r: int, c: int) -> bool:
+        return 0 <= r < rows and 0 <= c < cols and walkable[r * cols + c]
+
+    def jump(r: int, c: int, dr: int, dc: int) -> Node | None:
+        """
+        move from (r, c) in direction (dr, dc) until jump point is found (None when blocked)
+        """
+        while True:
+            if not walk(r, c):
+                return None
+            if (r, c) == goal:
+                return (r, c)
+            if dr and dc:
+                # diagonal move - stop when there is a jump point in any of orthogonal directions
+                if jump(r, c + dc, 0, dc) or jump(r + dr, c, dr, 0):
+                    return (r, c)
+                if not (walk(r, c + dc) and walk(r + dr, c)):
+                    return None
+            elif dc:
+                # horizontal move - stop when there is a forced neighbor above or below
+                if (walk(r - 1, c) and not walk(r - 1, c - dc)) or (walk(r + 1, c) and not walk(r + 1, c - dc)):
+                    return (r, c)
+            else:
+                # vertical move - stop when there is a forced neighbor on the left or right
+                if (walk(r, c - 1) and not walk(r - dr, c - 1)) or (walk(r, c + 1) and not walk(r - dr, c + 1)):
+                    return (r, c)
+            r += dr
+            c += dc
+
+    def get_directions(node: Node, parent: Node | None) -> list[tuple[int, int]]:
+        """
+        directions worth exploring from node (pruned by direction of move from parent)
+        """
+        r, c = node
+        if parent is None:
+            index = grid.to_index(node)
+            return [direction for d, direction in enumerate(DIRECTIONS) if grid.moves[d][index]]
+
+        dr, dc = sign(r - parent[0]), sign(c - parent[1])
+        directions = []
+        if dr and dc:
+            vertical, horizontal = walk(r + dr, c), walk(r, c + dc)
+            if vertical:
+                directions.append((dr, 0))
+            if horizontal:
+                directions.append((0, dc))
+            if vertical and horizontal:
+                directions.append((dr, dc))
+        elif dc:
+            next, up, down = walk(r, c + dc), walk(r - 1, c), walk(r + 1, c)
+            if next:
+                directions.append((0, dc))
+                if up:
+                    directions.append((-1, dc))
+                if down:
+                    directions.append((1, dc))
+            if up:
+                directions.append((-1, 0))
+            if down:
+                directions.append((1, 0))
+        else:
+            next, right, left = walk(r + dr, c), walk(r, c + 1), walk(r, c - 1)
+            if next:
+                directions.append((dr, 0))
+                if right:
+                    directions.append((dr, 1))
+                if left:
+                    directions.append((dr, -1))
+            if right:
+                directions.append((0, 1))
+            if left:
+                directions.append((0, -1))
+        return directions
+
+    open_set = [(octile_distance(start, goal, cost, diagonal_cost), start)]
+    came_from: dict[Node, Node] = {}
+    g_score = {start: 0}
+    closed: set[Node] = set()
+    expanded = 0
+
+    while open_set:
+        _, current = heapq.heappop(open_set)
+        if current in closed:
+            continue
+        closed.add(current)
+        expanded += 1
+
+        if current == goal:
+            jump_points = [current]
+            while current in came_from:
+                current = came_from[current]
+                jump_points.append(current)
+            jump_points.reverse()
+            if stats is not None:
+                stats["expanded"] = expanded
+            return expand_path(jump_points)
+
+        current_g = g_score[current]
+        for dr, dc in get_directions(current, came_from.get(current)):
+            jump_point = jump(current[0] + dr, current[1] + dc, dr, dc)
+            if jump_point is None or jump_point in closed:
+                continue
+            tentative_g = current_g + octile_distance(current, jump_point, cost, diagonal_cost)
+            if jump_point not in g_score or tentative_g < g_score[jump_point]:
+                g_score[jump_point] = tentative_g
+                came_from[jump_point] = current
+                f_score = tentative_g + octile_distance(jump_point, goal, cost, diagonal_cost)
+                heapq.heappush(open_set, (f_score, jump_point))
+
+    if stats is not None:
+        stats["expanded"] = expanded
+    return None
+
+
+#####################################################################################################################
+#MARK: HPA*
+class ClusterGraph:
+    """
+    HPA* (hierarchical path finding) - NavGrid is split into square clusters of cluster_size tiles.
+    Transitions between neighboring clusters (entrances) and costs of paths between entrances
+    of the same cluster are precomputed into small abstract graph.
+    Path search runs on the abstract graph and the found path is refined using cached paths inside clusters,
+    so long paths (e.g. across the whole maze) expand only a few hundred nodes.
+    The refined path is then shortened by local A* in each pair of neighboring clusters along it (see refine_path),
+    so it does not have to go through the entrances and its cost stays close to the cost of a_star path.
+
+    Abstract graph is built with the map (see MapData.build) or in small steps spread over frames (see build_steps),
+    copies for scenes share it (see copy), after invalidate (call it when NavGrid changes)
+    it is rebuilt lazily on the next search.
+    """
+    def __init__(self, grid: NavGrid, cluster_size: int) -> None:
+        self.grid = grid
+        self.cluster_size = cluster_size
+        self.is_built = False
+        # flat index => cluster id
+        self.cluster_of: list[int] = []
+        # cluster id => entrance nodes (flat indexes) in this cluster
+        self.entrances: dict[int, list[int]] = {}
+        # abstract graph: node => {neighbor: cost}
+        self.edges: dict[int, dict[int, int]] = {}
+        # (node, neighbor) => path (flat indexes, both ends included)
+        self.paths: dict[tuple[int, int], list[int]] = {}
+
+    def copy(self, grid: NavGrid) -> "ClusterGraph":
+        """
+        ClusterGraph of a copy of the grid sharing the built abstract graph (build replaces it, never changes it)
+        """
+        cluster_graph = ClusterGraph(grid, self.cluster_size)
+        cluster_graph.is_built = self.is_built
+        cluster_graph.cluster_of = self.cluster_of
+        cluster_graph.entrances = self.entrances
+        cluster_graph.edges = self.edges
+        cluster_graph.paths = self.paths
+        return cluster_graph
+
+    def invalidate(self):
+        self.is_built = False
+
+    def build(self):
+        for _ in self.build_steps():
+            pass
+
+    def build_steps(self) -> Generator[None, None, None]:
+        """
+        build split into steps (clusters of one row of clusters, one border or paths between entrances of one cluster per step), is_built is set after the last one
+        """
+        self.is_built = False
+        grid, size = self.grid, self.cluster_size
+        clusters_cols = (grid.cols + size - 1) // size
+        self.cluster_of = []
+        self.entrances = {}
+        self.edges = {}
+        self.paths = {}
+        for row in range(grid.rows):
+            self.cluster_of.extend((row // size) * clusters_cols + col // size for col in range(grid.cols))
+            if row % size == size - 1:
+                yield
+
+        # transitions between clusters: (node, neighbor) pairs on both sides of the border
+        # vertical borders (between left and right cluster) and horizontal borders (between top and bottom)
+        for border_col in range(size - 1, grid.cols - 1, size):
+            self.add_entrances([(row, border_col) for row in range(grid.rows)], (0, 1))
+            yield
+        for border_row in range(size - 1, grid.rows - 1, size):
+            self.add_entrances([(border_row, col) for col in range(grid.cols)], (1, 0))
+            yield
+
+        # paths between entrances of the same cluster
+        for entrances in self.entrances.values():
+            for node in entrances:
+                for target, (cost, path) in self.search_cluster(node, entrances).items():
+                    if target != node:
+                        self.edges[node][target] = cost
+                        self.paths[(node, target)] = path
+            yield
+        self.is_built = True
+
+    def add_entrances(self, border: list[Node], direction: tuple[int, int]):
+        """
+        find runs of walkable tiles along the border (with walkable neighbor across the border)
+        and add transitions for them, border is a list of tiles on the top/left side of the border
+        """
+        grid, size = self.grid, self.cluster_size
+        d = DIRECTIONS.index(direction)
+        run: list[int] = []
+        for i, node in enumerate(border + [None]):
+            index = None if node is None else grid.to_index(node)
+            # entrance ends on blocked tile or on the corner of clusters
+            if index is None or not grid.moves[d][index] or not grid.walkable[index] or (i % size == 0 and run):
+                if run:
+                    if len(run) > MAX_ENTRANCE_WIDTH:
+                        transitions = [run[0], run[-1]]
+                    else:
+                        transitions = [run[len(run) // 2]]
+                    for transition in transitions:
+                        self.add_transition(transition, transition + grid.offsets[d], d)
+                    run = []
+                if index is None or not grid.moves[d][index] or not grid.walkable[index]:
+                    continue
+            run.append(index)
+
+    def add_transition(self, node: int, neighbor: int, d: int):
+        for index in (node, neighbor):
+            if index not in self.edges:
+                self.edges[index] = {}
+                self.entrances.setdefault(self.cluster_of[index], []).append(index)
+        self.edges[node][neighbor] = self.grid.costs[d][node]
+        self.edges[neighbor][node] = self.grid.costs[OPPOSITE[d]][neighbor]
+        self.paths[(node, neighbor)] = [node, neighbor]
+        self.paths[(neighbor, node)] = [neighbor, node]
+
+    def search_cluster(self, source: int, targets: list[int], reverse: bool = False, stats: dict | None = None) -> dict[int, tuple[int, list[int]]]:
+        """
+        Dijkstra limited to the cluster of source: cost and path from source to each reachable target,
+        when reverse is set: cost and path from each target to source
+        """
+        grid, cluster_of = self.grid, self.cluster_of
+        moves, costs, offsets = grid.moves, grid.costs, grid.offsets
+        size = len(cluster_of)
+        cluster = cluster_of[source]
+        remaining = set(targets)
+        cost_of = {source: 0}
+        came_from: dict[int, int] = {}
+        open_set = [(0, source)]
+        found: dict[int, tuple[int, list[int]]] = {}
+        expanded = 0
+
+        while open_set and remaining:
+            cost, current = heapq.heappop(open_set)
+            if cost > cost_of[current]:
+                continue
+            expanded += 1
+            if current in remaining:
+                remaining.discard(current)
+                path = [current]
+                while path[-1] in came_from:
+                    path.append(came_from[path[-1]])
+                if not reverse:
+                    path.reverse()
+                found[current] = (cost, path)
+
+            for d, offset in enumerate(offsets):
+                if reverse:
+                    # neighbor can move to current in direction d
+                    neighbor = current - offset
+                    if neighbor < 0 or neighbor >= size or not moves[d][neighbor]:
+                        continue
+                    tentative_cost = cost + costs[d][neighbor]
+                else:
+                    if not moves[d][current]:
+                        continue
+                    neighbor = current + offset
+                    tentative_cost = cost + costs[d][current]
+                if cluster_of[neighbor] != cluster:
+                    continue
+                if neighbor not in cost_of or tentative_cost < cost_of[neighbor]:
+                    cost_of[neighbor] = tentative_cost
+                    came_from[neighbor] = current
+                    heapq.heappush(open_set, (tentative_cost, neighbor))
+
+        if stats is not None:
+            stats["expanded"] = stats.get("expanded", 0) + expanded
+        return found
+
+    def find_path(self, start: Node, goal: Node, stats: dict | None = None) -> list[Node] | None:
+        grid = self.grid
+        if not grid.is_inside(*start) or not grid.is_inside(*goal):
+            return None
+        if not self.is_built:
+            self.build()
+        if stats is not None:
+            stats["expanded"] = 0
+
+        start_index = grid.to_index(start)
+        goal_index = grid.to_index(goal)
+        if start_index == goal_index:
+            return [start]
+
+        # connect start and goal to entrances of their clusters (and directly to each other when in the same cluster)
+        start_targets = self.entrances.get(self.cluster_of[start_index], []) + [goal_index]
+        start_edges = self.search_cluster(start_index, start_targets, stats=stats)
+        goal_edges = self.search_cluster(goal_index, self.entrances.get(self.cluster_of[goal_index], []), reverse=True, stats=stats)
+        extra_edges: dict[int, dict[int, int]] = {start_index: {}}
+        extra_paths: dict[tuple[int, int], list[int]] = {}
+        for node, (cost, path) in start_edges.items():
+            extra_edges[start_index][node] = cost
+            extra_paths[(start_index, node)] = path
+        for node, (cost, path) in goal_edges.items():
+            extra_edges.setdefault(node, {})[goal_index] = cost
+            extra_paths[(node, goal_index)] = path
+
+        # A* on abstract graph
+        min_cost = grid.min_cost
+        diagonal_cost = int(min_cost * DIAGONAL_COST)
+        open_set = [(0, start_index)]
+        came_from: dict[int, int] = {}
+        g_score = {start_index: 0}
+        closed: set[int] = set()
+        expanded = 0
+        while open_set:
+            _, current = heapq.heappop(open_set)
+            if current in closed:
+                continue
+            closed.add(current)
+            expanded += 1
+            if current == goal_index:
+                break
+
+            current_g = g_score[current]
+            for edges in (self.edges.get(current, {}), extra_edges.get(current, {})):
+                for neighbor, cost in edges.items():
+                    tentative_g = current_g + cost
+                    if neighbor not in g_score or tentative_g < g_score[neighbor]:
+                        g_score[neighbor] = tentative_g
+                        came_from[neighbor] = current
+                        h = octile_distance(grid.to_node(neighbor), goal, min_cost, diagonal_cost)
+                        heapq.heappush(open_set, (tentative_g + h, neighbor))
+
+        if stats is not None:
+            stats["expanded"] += expanded
+        if goal_index not in closed:
+            return None
+
+        # refine abstract path using cached paths
+        abstract_path = [goal_index]
+        while abstract_path[-1] in came_from:
+            abstract_path.append(came_from[abstract_path[-1]])
+        abstract_path.reverse()
+        path = [start_index]
+        for node, next_node in zip(abstract_path, abstract_path[1:]):
+            key = (node, next_node)
+            path.extend(extra_paths[key][1:] if key in extra_paths else self.paths[key][1:])
+        return [grid.to_node(index) for index in self.refine_path(path, stats)]
+
+    def refine_path(self, path: list[int], stats: dict | None = None) -> list[int]:
+        """
+        shorten path refined from the abstract graph (it always crosses borders of clusters at the entrances):
+        each part of the path in two neighboring clusters is replaced with the shortest path inside these clusters,
+        parts start and end in the middle of the path through a cluster, so the border can be crossed anywhere
+        """
+        cluster_of = self.cluster_of
+        # runs of the path through the same cluster: (cluster, position of the middle tile of the run in the path)
+        runs: list[tuple[int, int]] = []
+        run_start = 0
+        for i in range(1, len(path) + 1):
+            if i == len(path) or cluster_of[path[i]] != cluster_of[path[run_start]]:
+                runs.append((cluster_of[path[run_start]], (run_start + i - 1) // 2))
+                run_start = i
+        if len(runs) < 2:
+            return path
+
+        anchors = [0] + [middle for _, middle in runs[1:-1]] + [len(path) - 1]
+        refined = [path[0]]
+        for k in range(len(runs) - 1):
+            start, end = anchors[k], anchors[k + 1]
+            local_path = self.search_local(path[start], path[end], {runs[k][0], runs[k + 1][0]}, stats)
+            refined.extend((local_path or path[start:end + 1])[1:])
+        return refined
+
+    def search_local(self, source: int, target: int, clusters: set[int], stats: dict | None = None) -> list[int] | None:
+        """
+        A* limited to the given clusters: path (flat indexes, both ends included) from source to target
+        """
+        grid, cluster_of = self.grid, self.cluster_of
+        moves, costs, offsets = grid.moves, grid.costs, grid.offsets
+        min_cost = grid.min_cost
+        diagonal_cost = int(min_cost * DIAGONAL_COST)
+        goal = grid.to_node(target)
+        g_score = {source: 0}
+        came_from: dict[int, int] = {}
+        open_set = [(0, 0, source)]
+        expanded = 0
+
+        while open_set:
+            _, cost, current = heapq.heappop(open_set)
+            if cost > g_score[current]:
+                continue
+            expanded += 1
+            if current == target:
+                break
+            for d, offset in enumerate(offsets):
+                if not moves[d][current]:
+                    continue
+                neighbor = current + offset
+                if cluster_of[neighbor] not in clusters:
+                    continue
+                tentative_g = cost + costs[d][current]
+                if neighbor not in g_score or tentative_g < g_score[neighbor]:
+                    g_score[neighbor] = tentative_g
+                    came_from[neighbor] = current
+                    h = octile_distance(grid.to_node(neighbor), goal, min_cost, diagonal_cost)
+                    heapq.heappush(open_set, (tentative_g + h, tentative_g, neighbor))
+
+        if stats is not None:
+            stats["expanded"] += expanded
+        if target not in g_score:
+            return None
+        path = [target]
+        while path[-1] in came_from:
+            path.append(came_from[path[-1]])
+        path.reverse()
+        return path
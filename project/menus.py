@@ -1,4 +1,4 @@
-from state import State
+from state import DeferredState, State
 from settings import *
 import pygame
 import pygame_menu
@@ -92,9 +92,12 @@ class MainMenuScreen(MenuScreen):
         # am.create_menu()
 
         # main_menu.add.button('Play', Scene(self.game, 'grasslands', 'start').enter_state)
-        main_menu.add.button('Play', scene.Scene(self.game, 'Village', 'start').enter_state)
-        main_menu.add.button('Settings', splash_screen.SplashScreen(self.game, "Settings").enter_state)
-        main_menu.add.button('About', AboutMenuScreen(self.game, "AboutMenu").enter_state)
+        # target states are built when the button is pressed, map of the scene is parsed in background with PREWARM_MENU_STATES
+        if PREWARM_MENU_STATES:
+            self.game.map_cache.prefetch(['Village'])
+        main_menu.add.button('Play', DeferredState(lambda: scene.Scene(self.game, 'Village', 'start')).enter_state)
+        main_menu.add.button('Settings', DeferredState(lambda: splash_screen.SplashScreen(self.game, "Settings")).enter_state)
+        main_menu.add.button('About', DeferredState(lambda: AboutMenuScreen(self.game, "AboutMenu")).enter_state)
         # main_menu.add.button('Close menu', self.deactivate)
         if not IS_WEB:
             main_menu.add.button('Quit', pygame_menu.events.EXIT)
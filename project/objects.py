@@ -1,4 +1,5 @@
 import pygame
+from atlas import texture_atlas
 from settings import *
 
 class Collider(pygame.sprite.Sprite):
@@ -23,27 +24,61 @@ class Shadow(pygame.sprite.Sprite):
         # self.image.set_colorkey("black")
         pygame.draw.ellipse(self.image, (0,0,0,255), self.rect)
 
+#####################################################################################################################
+#MARK: HealthBarRenderer
+class HealthBarRenderer:
+    """
+    Health bar images shared by all HealthBar sprites.
+    HUD images are loaded once and bars are rendered (lazily) once for each of levels fill levels,
+    so HealthBar only switches its image by reference.
+    """
+    def __init__(self, levels: int = HEALTH_BAR_LEVELS) -> None:
+        self.levels = levels
+        self.image_full: pygame.Surface | None = None
+        self.image_empty: pygame.Surface | None = None
+        # fill level => rendered bar
+        self.bars: dict[int, pygame.Surface] = {}
+
+    def get_level(self, percentage: float) -> int:
+        percentage = min(1.0, percentage)
+        percentage = max(0.0, percentage)
+        return int(self.levels * percentage)
+
+    def get_bar(self, level: int) -> pygame.Surface:
+        if level in self.bars:
+            return self.bars[level]
+
+        if self.image_full is None:
+            self.image_full = texture_atlas.get(HUD_DIR / "LifeBarMiniProgress.png")
+            self.image_empty = texture_atlas.get(HUD_DIR / "LifeBarMiniUnder.png")
+        image = self.image_full.copy()
+        bar_width, bar_height = image.get_size()
+        # empty part of the bar on the right side
+        width = bar_width * level // self.levels
+        rect = pygame.Rect(width, 0, bar_width - width, bar_height)
+        image.blit(self.image_empty.subsurface(rect), (width, 0))
+        self.bars[level] = image
+        return image
+
+
+health_bar_renderer = HealthBarRenderer()
+
+
 class HealthBar(pygame.sprite.Sprite):
     def __init__(self, groups: list[pygame.sprite.Group], pos: list[int]):
         super().__init__(groups)
-        self.image_full: pygame.Surface = load_image(HUD_DIR / "LifeBarMiniProgress.png").convert_alpha()
-        self.image_empty: pygame.Surface = load_image(HUD_DIR / "LifeBarMiniUnder.png").convert_alpha()
-        self.image = self.image_full.copy()
+        self.level = health_bar_renderer.levels
+        self.image = health_bar_renderer.get_bar(self.level)
         self.rect: pygame.FRect = self.image.get_frect(midbottom = pos)
         
     def set_bar(self, percentage: float):
-        self.image.blit(self.image_full, (0, 0))
-        # tmp_img = self.image_empty.copy()
-        # tmp_img.set_colorkey((0,0,0))
-        percentage = min(1.0, percentage)
-        percentage = max(0.0, percentage)
-        width = int(self.rect.width * percentage)
-        rect = pygame.Rect(width, 0, self.rect.width - width, self.rect.height)
-        tmp_img = self.image_empty.subsurface(rect)
-        # pygame.draw.rect(tmp_img, (0, 0, 0), rect)
-        
-        # self.image.blit(self.image_empty, rect)
-        self.image.blit(tmp_img, (width, 0))
+        """
+        image is changed only when fill level changes
+        """
+        level = health_bar_renderer.get_level(percentage)
+        if level != self.level:
+            self.level = level
+            self.image = health_bar_renderer.get_bar(level)
         
         
 class Object(pygame.sprite.Sprite):
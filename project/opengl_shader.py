@@ -1,13 +1,17 @@
 from pathlib import Path
 import struct
-import zengl
+import sys
+from time import monotonic
 import pygame
 
-from settings import SHADERS_DIR
+from settings import SHADERS_DIR, IS_HEADLESS, IS_WEB, SHADER_UPLOAD_RING, SHADER_HOT_RELOAD, SHADER_WATCH_INTERVAL
 
-zengl.init()
+# zengl needs a window with OpenGL support, which is not available in headless mode
+if not IS_HEADLESS:
+    import zengl
+    zengl.init()
 
-import _zengl
+    import _zengl
 
 """
 def compile_error(shader: bytes, shader_type: int, log: bytes):
@@ -39,57 +43,151 @@ except:
         pass
 
 
-class OpenGL_shader():
-    def __init__(self, size: tuple[int, int], shader_name: str = "") -> None:
-        
-        def compile_error_debug(shader: bytes, shader_type: int, log: bytes):
-            name = {0x8B31: "Vertex Shader", 0x8B30: "Fragment Shader"}[shader_type]
-            print("="*30,name,"="*30)
-            try:
+# byte order of pixels in memory the same as "rgba8unorm" texture (on little endian machines, incl. wasm)
+RGBA_MASKS = (0x000000FF, 0x0000FF00, 0x00FF0000, 0)
 
-                log = log.rstrip(b"\x00").decode()
-                shader = shader.rstrip(b"\x00").decode()
-                _, pos, msg  = log.split(': ',2)
-                c,l = map( int, pos.split(':',1) )
-                #print( l,c,msg  )
-                spacer = ""
-                for ln,line in enumerate(shader.split("\n")):
-                    if ln==l:
-                        CSI("1;93m")
-                    print(f"{str(ln).zfill(3)}: {line.rstrip()}", end="")
-                    if ln==l:
-                        CSI("1;97m")
-                        CSI("1;91m")
-                        print(f" // {msg}", end=spacer)
-                        CSI("1;97m")
-                        CSI("1;0m")
-                    print()
-                raise ValueError(f"{name} Error\n\n{log}")
 
-            finally:
-                print("="*70)
+def create_upload_surface(size: tuple[int, int]) -> pygame.Surface:
+    """
+    Surface which memory can be uploaded to "rgba8unorm" texture as is (see get_pixels),
+    pixel format conversion is done by blit on it (which copies the canvas anyway)
+    """
+    return pygame.Surface(size, 0, 32, RGBA_MASKS)
 
-        self.ctx = zengl.context()
-        self.timestamp: float = 0.0
+
+def get_passes(shader_name: str | list[str]) -> list[str]:
+    return [shader_name] if isinstance(shader_name, str) else list(shader_name)
+
+
+def get_pixels(surface: pygame.Surface) -> pygame.BufferProxy | bytes:
+    """
+    pixels of surface in "rgba8unorm" layout, rows from the top (flipped in vertex shader),
+    view of surface memory (no copy) when possible, otherwise converted copy
+    """
+    if sys.byteorder == "little" and surface.get_shifts()[:3] == (0, 8, 16) and surface.get_pitch() == surface.get_width() * 4:
+        return surface.get_view("0")
+    return pygame.image.tobytes(surface, 'RGBA')
+
+
+def get_dirty_rows(dirty_rect: pygame.Rect | None) -> tuple[int, int] | None:
+    """
+    rows (top, bottom) of the texture to be uploaded, None for the whole texture, empty band when nothing has changed
+    """
+    if dirty_rect is None:
+        return None
+    if not dirty_rect:
+        return (0, 0)
+    return (dirty_rect.top, dirty_rect.bottom)
+
+
+def union_rows(rows: tuple[int, int] | None, other: tuple[int, int] | None) -> tuple[int, int] | None:
+    if rows is None or other is None:
+        return None
+    if rows[0] >= rows[1]:
+        return other
+    if other[0] >= other[1]:
+        return rows
+    return (min(rows[0], other[0]), max(rows[1], other[1]))
+
+
+class RenderTargetPool():
+    """
+    Intermediate render targets of post-processing passes, released targets are reused by size and format
+    """
+    def __init__(self, ctx: "zengl.Context") -> None:
+        self.ctx = ctx
+        self.free: dict[tuple[tuple[int, int], str], list["zengl.Image"]] = {}
+
+    def acquire(self, size: tuple[int, int], format: str = "rgba8unorm") -> "zengl.Image":
+        free = self.free.get((size, format))
+        if free:
+            return free.pop()
+        return self.ctx.image(size, format)
+
+    def release(self, image: "zengl.Image"):
+        self.free.setdefault((tuple(image.size), image.format), []).append(image)
+
+
+class ShaderManager():
+    """
+    Pipelines of post-processing passes: (shader name, input texture, output texture or None for screen) => pipeline.
+    Texture ring and pooled render targets are reused, so each pipeline is compiled only once.
+    With hot_reload (desktop) modification times of shader files are checked every watch_interval seconds
+    and only pipelines using changed files are recompiled. Pipeline which fails to compile (error is printed
+    by compile_error_debug) is kept as it was, new one is replaced by default shader until its files are fixed.
+    """
+    def __init__(self, ctx: "zengl.Context", size: tuple[int, int], hot_reload: bool = SHADER_HOT_RELOAD, watch_interval: float = SHADER_WATCH_INTERVAL) -> None:
+        self.ctx = ctx
         self.size = size
+        self.hot_reload = hot_reload and not IS_WEB
+        self.watch_interval = watch_interval
+        self.next_check: float = 0.0
+        self.pipelines: dict[tuple[str, "zengl.Image", "zengl.Image | None"], "zengl.Pipeline"] = {}
+        # key of pipeline => (vertex shader, fragment shader) file names
+        self.files: dict[tuple[str, "zengl.Image", "zengl.Image | None"], tuple[Path, Path]] = {}
+        # file name => source of shader and its modification time
+        self.sources: dict[Path, str] = {}
+        self.mtimes: dict[Path, float] = {}
 
-        _zengl.compile_error = compile_error_debug
+    def get(self, shader_name: str, image: "zengl.Image", target: "zengl.Image | None") -> "zengl.Pipeline":
+        key = (shader_name, image, target)
+        pipeline = self.pipelines.get(key)
+        if not pipeline:
+            self.files[key] = (self.get_shader_file_name("vs", shader_name), self.get_shader_file_name("fs", shader_name))
+            pipeline = self.compile(key)
+            if not pipeline:
+                if not shader_name:
+                    raise ValueError("default shader can't be compiled")
+                pipeline = self.get("", image, target)
+            self.replace(key, pipeline)
+        return pipeline
 
-        self.image = self.ctx.image(size, "rgba8unorm") #, samples=4)
-        self.shader_name = shader_name
-        self.pipeline = None
+    def compile(self, key: tuple[str, "zengl.Image", "zengl.Image | None"]) -> "zengl.Pipeline | None":
+        vs_file, fs_file = self.files[key]
+        try:
+            return self.create_image_pipeline(self.read_shader_from_file(vs_file), self.read_shader_from_file(fs_file), key[1], key[2])
+        except (ValueError, KeyError, OSError) as error:
+            # compile and linker errors are printed by compile_error_debug, missing uniforms etc. here
+            print(f"shader {key[0] or 'default'} not compiled: {str(error).splitlines()[0]}")
+            return None
 
-    def create_pipeline(self, shader_name: str = ""):
-        # if provided new shader_name then use it (otherwise use shader_name provided in constructor)
-        if shader_name:
-            self.shader_name = shader_name
-        
-        fs_file = self.get_shader_file_name("fs")
-        vs_file = self.get_shader_file_name("vs")
+    def update(self):
+        """
+        recompile pipelines which shader files have changed since they were read
+        """
+        if not self.hot_reload or monotonic() < self.next_check:
+            return
+        self.next_check = monotonic() + self.watch_interval
+        changed = set()
+        for file_name, mtime in self.mtimes.items():
+            try:
+                if file_name.stat().st_mtime != mtime:
+                    changed.add(file_name)
+            except OSError:
+                # file is being replaced by editor, try again next time
+                continue
+        if not changed:
+            return
+        for file_name in changed:
+            del self.sources[file_name]
+        for key, files in self.files.items():
+            if changed.intersection(files):
+                pipeline = self.compile(key)
+                if pipeline:
+                    print(f"shader {key[0] or 'default'} reloaded")
+                    self.replace(key, pipeline)
 
-        FS = self.read_shader_from_file(fs_file)
-        VS = self.read_shader_from_file(vs_file)
-        
+    def replace(self, key: tuple[str, "zengl.Image", "zengl.Image | None"], pipeline: "zengl.Pipeline"):
+        """
+        set pipeline of key and release the old one (GL program) unless it is still used by another key
+        (default pipeline is shared by keys of shaders which failed to compile)
+        """
+        old_pipeline = self.pipelines.get(key)
+        self.pipelines[key] = pipeline
+        if old_pipeline is not None and not any(old_pipeline is used for used in self.pipelines.values()):
+            self.ctx.release(old_pipeline)
+
+    def create_image_pipeline(self, VS: str, FS: str, image: "zengl.Image", target: "zengl.Image | None" = None) -> "zengl.Pipeline":
         layout =[
             {
                     'name': 'Texture',
@@ -100,13 +198,15 @@ class OpenGL_shader():
         uniforms = {
                 'time': 0.0,
                 'screen_size': (self.size[0], self.size[1]),
+                # render targets are written upside down, so they are read like uploaded Surface by the next pass
+                'flip_y': 1.0 if target is None else -1.0,
         }
         
         resources = [
                 {
                     'type': 'sampler',
                     'binding': 0,
-                    'image': self.image,
+                    'image': image,
                     'min_filter': 'nearest',
                     'mag_filter': 'nearest',
                     'wrap_x': 'clamp_to_edge',
@@ -114,22 +214,22 @@ class OpenGL_shader():
                 },
         ]
         
-        self.pipeline = self.ctx.pipeline(
+        return self.ctx.pipeline(
             vertex_shader = VS,
             fragment_shader = FS,
             layout = layout,
             resources = resources,
             uniforms = uniforms,
-            framebuffer = None,
+            framebuffer = None if target is None else [target],
             viewport = (0, 0, self.size[0], self.size[1]),
             topology = "triangle_strip",
             vertex_count = 4,
             # instance_count = 7,
         )
         
-    def get_shader_file_name(self, prefix: str) -> Path:
+    def get_shader_file_name(self, prefix: str, shader_name: str) -> Path:
         # try to get shader program specific for particular effect (shader_name)
-        f_name = SHADERS_DIR / f"{prefix}_{self.shader_name}.glsl"
+        f_name = SHADERS_DIR / f"{prefix}_{shader_name}.glsl"
         # if there is no specific shader program, use default
         if not f_name.exists():
             f_name = SHADERS_DIR / f"{prefix}.glsl"
@@ -137,21 +237,155 @@ class OpenGL_shader():
         return f_name
         
     def read_shader_from_file(self, file_name: Path):
+        if file_name in self.sources:
+            return self.sources[file_name]
+        self.mtimes[file_name] = file_name.stat().st_mtime
         with open(file_name, encoding="UTF-8") as f:
             shader = "".join(f.readlines())
+        self.sources[file_name] = shader
             
         return shader
 
 
-    def render(self, surface, dt: float = 0.0, use_shaders: bool = True):
+class OpenGL_shader():
+    def __init__(self, size: tuple[int, int], shader_name: str | list[str] = "", texture_size: tuple[int, int] | None = None) -> None:
+        """
+        size: window (viewport) size, texture_size: size of uploaded Surface (canvas), scaled up to size on GPU
+        shader_name: effect or list of effects applied one after another (post-processing passes)
+        """
+        
+        def compile_error_debug(shader: bytes, shader_type: int, log: bytes):
+            name = {0x8B31: "Vertex Shader", 0x8B30: "Fragment Shader"}[shader_type]
+            print("="*30,name,"="*30)
+            try:
+
+                log = log.rstrip(b"\x00").decode()
+                shader = shader.rstrip(b"\x00").decode()
+                _, pos, msg  = log.split(': ',2)
+                c,l = map( int, pos.split(':',1) )
+                #print( l,c,msg  )
+                spacer = ""
+                for ln,line in enumerate(shader.split("\n")):
+                    if ln==l:
+                        CSI("1;93m")
+                    print(f"{str(ln).zfill(3)}: {line.rstrip()}", end="")
+                    if ln==l:
+                        CSI("1;97m")
+                        CSI("1;91m")
+                        print(f" // {msg}", end=spacer)
+                        CSI("1;97m")
+                        CSI("1;0m")
+                    print()
+                raise ValueError(f"{name} Error\n\n{log}")
+
+            finally:
+                print("="*70)
+
+        self.ctx = zengl.context()
+        self.timestamp: float = 0.0
+        self.size = size
+        self.texture_size = texture_size or size
+
+        _zengl.compile_error = compile_error_debug
+
+        # ring of textures, each frame writes to the next one, so upload doesn't wait for the GPU
+        # still reading the texture of the previous frame
+        self.images = [self.ctx.image(self.texture_size, "rgba8unorm") for _ in range(max(1, SHADER_UPLOAD_RING))] #, samples=4)
+        self.image_index = 0
+        self.image = self.images[0]
+        # rows of each texture in the ring which differ from the canvas (None - all), see render with dirty_rect
+        self.stale_rows: list[tuple[int, int] | None] = [None] * len(self.images)
+        self.passes: list[str] = get_passes(shader_name)
+        # effect of the last pass (changed by 'next_shader' action)
+        self.shader_name = self.passes[-1]
+        self.render_targets = RenderTargetPool(self.ctx)
+        self.shaders = ShaderManager(self.ctx, size)
+        self.pipeline = None
+
+    def create_pipeline(self, shader_name: str | list[str] = ""):
+        """
+        set effect of the last pass (or all passes when list is provided),
+        pipelines are created when they are used for the first time and cached
+        """
+        if isinstance(shader_name, list):
+            self.passes = get_passes(shader_name)
+        elif shader_name:
+            self.passes[-1] = shader_name
+        self.shader_name = self.passes[-1]
+
+    def render(self, surface, dt: float = 0.0, use_shaders: bool = True, dirty_rect: pygame.Rect | None = None):
+        """
+        upload surface to texture and draw it with shader passes,
+        only rows of dirty_rect are uploaded when provided (USE_DIRTY_RECTS), empty rect uploads nothing
+        """
         self.ctx.new_frame()
-        self.image.clear()
-        self.image.write(pygame.image.tobytes(surface, 'RGBA', flipped=True))
+        self.image_index = (self.image_index + 1) % len(self.images)
+        self.image = self.images[self.image_index]
+        # the other textures of the ring still have content of older frames, they get these rows when their turn comes
+        rows = get_dirty_rows(dirty_rect)
+        self.stale_rows = [union_rows(stale, rows) for stale in self.stale_rows]
+        rows = self.stale_rows[self.image_index]
+        self.stale_rows[self.image_index] = (0, 0)
+        # the whole texture is overwritten, no need to clear it
+        pixels = get_pixels(surface)
+        if rows is None:
+            self.image.write(pixels)
+        elif rows[0] < rows[1]:
+            # band of whole rows is contiguous in memory
+            top, bottom = rows
+            row_size = surface.get_width() * 4
+            with memoryview(pixels) as view, view[top * row_size:bottom * row_size] as band:
+                self.image.write(band, (surface.get_width(), bottom - top), (0, top))
+        # surface stays locked while its view exists
+        del pixels
         self.timestamp += dt
-        self.pipeline.uniforms["time"][:] = struct.pack("f", self.timestamp / 100.0)
-        if use_shaders:
+        self.shaders.update()
+        time = struct.pack("f", self.timestamp / 100.0)
+        # default shader (no effect) when shaders are off - Image.blit would show texture upside down
+        # (rows are flipped in vertex shader)
+        passes = self.passes if use_shaders else [""]
+        source = self.image
+        for i, shader_name in enumerate(passes):
+            # the last pass draws on screen, the others on pooled render targets (read by the next pass)
+            target = None if i == len(passes) - 1 else self.render_targets.acquire(self.size)
+            self.pipeline = self.shaders.get(shader_name, source, target)
+            self.pipeline.uniforms["time"][:] = time
             self.pipeline.render()
-        else:
-            self.image.blit()
+            if source is not self.image:
+                self.render_targets.release(source)
+            source = target
         self.ctx.end_frame()
 
+
+class Headless_shader():
+    """
+    Drop-in replacement for OpenGL_shader when there is no OpenGL context (IS_HEADLESS).
+    Nothing is displayed, but pixels of the canvas are taken the same way and copied to preallocated
+    memory in place of Image.write, so the CPU side of the texture upload is part of the frame time.
+    """
+    def __init__(self, size: tuple[int, int], shader_name: str | list[str] = "", texture_size: tuple[int, int] | None = None) -> None:
+        self.timestamp: float = 0.0
+        self.size = size
+        self.texture_size = texture_size or size
+        # stands for the texture (rgba8unorm)
+        self.texture = bytearray(self.texture_size[0] * self.texture_size[1] * 4)
+        self.passes: list[str] = get_passes(shader_name)
+        self.shader_name = self.passes[-1]
+
+    def create_pipeline(self, shader_name: str | list[str] = ""):
+        if isinstance(shader_name, list):
+            self.passes = get_passes(shader_name)
+        elif shader_name:
+            self.passes[-1] = shader_name
+        self.shader_name = self.passes[-1]
+
+    def render(self, surface, dt: float = 0.0, use_shaders: bool = True, dirty_rect: pygame.Rect | None = None):
+        rows = get_dirty_rows(dirty_rect)
+        top, bottom = (0, surface.get_height()) if rows is None else rows
+        row_size = surface.get_width() * 4
+        pixels = get_pixels(surface)
+        with memoryview(pixels) as view, memoryview(self.texture) as texture:
+            texture[top * row_size:bottom * row_size] = view[top * row_size:bottom * row_size]
+        # surface stays locked while its view exists
+        del pixels
+        self.timestamp += dt
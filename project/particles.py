@@ -2,6 +2,8 @@ from dataclasses import dataclass
 import math
 import pygame, random
 from pygame.math import Vector2 as vec
+# module import (not name) - settings imports particles, so atlas may be partially initialized here
+import atlas
 from settings import *
 
 #####################################################################################################################
@@ -45,10 +47,8 @@ class ParticleImageBased:
         
         # amount of new particles per second
         self.rate = rate
-        self.custom_event_id  = pygame.event.custom_type()
-        
-        self.interval: int = int(1000 / rate)
-        pygame.time.set_timer(pygame.event.Event(self.custom_event_id), self.interval)
+        # seconds between new particles (owner schedules its add in game.timer_wheel, see Scene)
+        self.interval: float = 1 / rate
         
         # scale_speed: 1.0 ==> from 100% to 0% size in 1 second
         self.scale_speed = scale_speed
@@ -58,11 +58,20 @@ class ParticleImageBased:
         self.alpha_speed = alpha_speed
         # (optional) if provided, add_particles function will choose random start point from inside this rect
         self.spawn_rect = spawn_rect
+        # bounding rects of particles after the last and the previous update (see Scene.draw with USE_DIRTY_RECTS)
+        self.rects: list[pygame.Rect] = []
+        self.prev_rects: list[pygame.Rect] = []
 
     #MARK: emit
     def emit(self, dt: float):
+        self.update(dt)
+        self.draw()
+
+    def update(self, dt: float):
         
         MILI_SEC = 1.001
+        self.prev_rects = self.rects
+        self.rects = []
         if self.particles:
             self.delete_particles()
             for particle in self.particles:
@@ -83,14 +92,23 @@ class ParticleImageBased:
                 particle.alpha -= self.alpha_speed * 255 * MILI_SEC * dt
                 if particle.alpha < 0:
                     particle.alpha = 0
-                self.img.set_alpha(particle.alpha)
-                
-                self.rect.centerx = particle.x - self.width 
-                self.rect.centery = particle.y - self.height
-                surface  = self.img 
-                surface = pygame.transform.scale(self.img, (self.width * particle.scale, self.height * particle.scale))
-                surface = pygame.transform.rotate(surface, particle.rotation)
-                self.screen.blit(surface, (particle.x - int(surface.get_width()//2), particle.y - int(surface.get_height()//2)))
+
+                # scaled image fits into it in any rotation
+                size = int(math.hypot(self.width, self.height) * particle.scale) + 2
+                self.rects.append(pygame.Rect(int(particle.x) - size // 2, int(particle.y) - size // 2, size, size))
+
+    def draw(self):
+        for particle in self.particles:
+            if particle.scale <=0:
+                continue
+            self.img.set_alpha(particle.alpha)
+            
+            self.rect.centerx = particle.x - self.width 
+            self.rect.centery = particle.y - self.height
+            surface  = self.img 
+            surface = pygame.transform.scale(self.img, (self.width * particle.scale, self.height * particle.scale))
+            surface = pygame.transform.rotate(surface, particle.rotation)
+            self.screen.blit(surface, (particle.x - int(surface.get_width()//2), particle.y - int(surface.get_height()//2)))
 
     #MARK: add_particles
     def add_particles(
@@ -131,7 +149,7 @@ class ParticleImageBased:
 class ParticleLeafs():
     def __init__(self, canvas: pygame.Surface) -> None:
         spawn_rect = pygame.Rect(0, 0, WIDTH, HEIGHT // 2)
-        leaf_img = pygame.image.load(PARTICLES_DIR / "Leaf_single.png").convert_alpha()
+        leaf_img = atlas.texture_atlas.get(PARTICLES_DIR / "Leaf_single.png")
         self.particle = ParticleImageBased(
             screen=canvas, 
             img=leaf_img, 
@@ -141,7 +159,7 @@ class ParticleLeafs():
             rotation_speed=0.0, 
             spawn_rect=spawn_rect
         )
-        self.custom_event_id = self.particle.custom_event_id
+        self.interval = self.particle.interval
 
     def add(self):
         # move 80 pixels/seconds into south-west (down-left) +/- 30 degree, enlarge 5 x, kill after 4 seconds
@@ -150,12 +168,21 @@ class ParticleLeafs():
     def emit(self, dt: float):
         self.particle.emit(dt)
 
+    def update(self, dt: float):
+        self.particle.update(dt)
+
+    def draw(self):
+        self.particle.draw()
+
+    def get_dirty_rects(self) -> list[pygame.Rect]:
+        return self.particle.prev_rects + self.particle.rects
+
 #######################################################################################################
 # MARK: Rain
 class ParticleRain():
     def __init__(self, canvas: pygame.Surface) -> None:
         spawn_rect = pygame.Rect(0, 0, WIDTH, 16)
-        leaf_img = pygame.image.load(PARTICLES_DIR / "Rain.png").convert_alpha()
+        leaf_img = atlas.texture_atlas.get(PARTICLES_DIR / "Rain.png")
         self.particle = ParticleImageBased(
             screen=canvas, 
             img=leaf_img, 
@@ -165,7 +192,7 @@ class ParticleRain():
             rotation_speed=0.0, 
             spawn_rect=spawn_rect
         )
-        self.custom_event_id = self.particle.custom_event_id
+        self.interval = self.particle.interval
 
     def add(self):
         # move 80 pixels/seconds into south-west (down-left) +/- 30 degree, enlarge 5 x, kill after 4 seconds
@@ -173,3 +200,12 @@ class ParticleRain():
         
     def emit(self, dt: float):
         self.particle.emit(dt)
+
+    def update(self, dt: float):
+        self.particle.update(dt)
+
+    def draw(self):
+        self.particle.draw()
+
+    def get_dirty_rects(self) -> list[pygame.Rect]:
+        return self.particle.prev_rects + self.particle.rects
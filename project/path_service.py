@@ -0,0 +1,100 @@
+from collections import OrderedDict
+from time import perf_counter
+from typing import Callable, Generator
+from maze_generator.maze_utils import a_star
+from maze_generator.nav_grid import NavGrid
+from maze_generator.path_search import ClusterGraph, jump_point_search
+from settings import *
+
+Node = tuple[int, int]
+Path = tuple[Node, ...] | None
+
+
+#####################################################################################################################
+#MARK: PathService
+class PathService:
+    """
+    Central path finding for a Scene.
+    NPCs submit (start, goal) requests with a callback, identical requests waiting in the queue are merged,
+    recently found paths are kept in LRU cache and searches are done in Scene.update
+    only until time budget for the frame is used up (at least one search per frame).
+    Nodes are (row, column) of NavGrid like in a_star.
+    Search algorithm is selected by engine: "a_star", "jps" or "hpa" (see maze_generator/path_search.py).
+    Cluster graph of "hpa" which doesn't come built from MapData (e.g. generated maze) is built in steps
+    with the time left from the searches (at least one step per frame), until then "jps" is used.
+    """
+    def __init__(self, grid: NavGrid, budget_ms: float = PATH_FINDING_BUDGET_MS, cache_size: int = PATH_CACHE_SIZE, engine: str = PATH_FINDING_ENGINE, cluster_graph: ClusterGraph | None = None) -> None:
+        self.grid = grid
+        self.engine = engine
+        self.cluster_graph: ClusterGraph | None = None
+        self.cluster_graph_steps: Generator[None, None, None] | None = None
+        if engine == "hpa":
+            self.cluster_graph = cluster_graph or ClusterGraph(grid, HPA_CLUSTER_SIZE)
+            if not self.cluster_graph.is_built:
+                self.cluster_graph_steps = self.cluster_graph.build_steps()
+        elif engine not in ("a_star", "jps"):
+            raise ValueError(f"unknown path finding engine: {engine}")
+        self.budget: float = budget_ms / 1000
+        self.cache_size = cache_size
+        self.cache: OrderedDict[tuple[Node, Node], Path] = OrderedDict()
+        # (start, goal) => callbacks waiting for the path, in order of submission
+        self.pending: dict[tuple[Node, Node], list[Callable[[Path], None]]] = {}
+
+    def request(self, start: Node, goal: Node, callback: Callable[[Path], None]):
+        """
+        callback is called with found path (or None when there is no path) immediately if path is cached,
+        otherwise later from update
+        """
+        key = (start, goal)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            callback(self.cache[key])
+        elif key in self.pending:
+            self.pending[key].append(callback)
+        else:
+            self.pending[key] = [callback]
+
+    def update(self):
+        time_start = perf_counter()
+        while self.pending:
+            key = next(iter(self.pending))
+            callbacks = self.pending.pop(key)
+            start, goal = key
+            path = self.find_path(start, goal)
+            path = tuple(path) if path else None
+
+            self.cache[key] = path
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+            for callback in callbacks:
+                callback(path)
+
+            if perf_counter() - time_start >= self.budget:
+                break
+
+        if self.cluster_graph_steps:
+            for _ in self.cluster_graph_steps:
+                if perf_counter() - time_start >= self.budget:
+                    break
+            else:
+                self.cluster_graph_steps = None
+
+    def find_path(self, start: Node, goal: Node, stats: dict | None = None) -> list[Node] | None:
+        """
+        search path immediately (without cache and time budget) using selected engine
+        """
+        if self.cluster_graph and self.cluster_graph.is_built:
+            return self.cluster_graph.find_path(start, goal, stats)
+        if self.engine in ("jps", "hpa"):
+            return jump_point_search(self.grid, start, goal, stats)
+        return a_star(self.grid, start, goal, stats)
+
+    def invalidate(self):
+        """
+        forget cached paths, must be called whenever NavGrid changes
+        """
+        self.cache.clear()
+        if self.cluster_graph:
+            self.cluster_graph.invalidate()
+            self.cluster_graph_steps = self.cluster_graph.build_steps()
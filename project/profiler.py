@@ -0,0 +1,174 @@
+import json
+from collections import deque
+from contextlib import nullcontext
+from os import PathLike
+from time import perf_counter
+import pygame
+from settings import *
+
+# colors of phases in overlay, phases not listed here are drawn in PROFILER_DEFAULT_COLOR
+PROFILER_COLORS = {
+    "input":      (120, 120, 120),
+    "update":     (220, 80,  60),
+    "draw":       (60,  160, 220),
+    "cursor":     (200, 200, 60),
+    "scale_blit": (160, 80,  200),
+    "shader":     (60,  200, 100),
+    "flip":       (230, 140, 40),
+}
+PROFILER_DEFAULT_COLOR = (200, 200, 200)
+
+# returned by Profiler.scope when profiler is disabled, so the scope costs only a method call
+NULL_SCOPE = nullcontext()
+
+
+#####################################################################################################################
+#MARK: ProfilerScope
+class ProfilerScope:
+    def __init__(self, profiler: "Profiler", name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.depth = self.profiler.depth
+        self.profiler.depth += 1
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end = perf_counter()
+        self.profiler.depth -= 1
+        self.profiler.scopes.append((self.name, self.depth, self.start, end - self.start))
+
+
+#####################################################################################################################
+#MARK: Profiler
+class Profiler:
+    """
+    Hierarchical frame profiler. Time of named (nested) scopes is collected for each frame
+    and the last max_frames frames are kept in a ring buffer.
+
+    usage:
+        profiler.begin_frame()
+        with profiler.scope("update"):
+            with profiler.scope("collisions"):
+                ...
+        profiler.end_frame()
+    """
+    def __init__(self, max_frames: int = PROFILER_FRAMES) -> None:
+        self.enabled: bool = False
+        # overlay with stacked bars is rendered by Game only when this is set
+        self.show_overlay: bool = False
+        # each frame is a tuple: (frame start, frame end, list of scopes)
+        # each scope is a tuple: (name, depth, start, duration), times in seconds from perf_counter
+        self.frames: deque[tuple[float, float, list[tuple[str, int, float, float]]]] = deque(maxlen=max_frames)
+        self.scopes: list[tuple[str, int, float, float]] = []
+        self.depth: int = 0
+        self.frame_start: float = 0.0
+
+    def scope(self, name: str) -> ProfilerScope | nullcontext:
+        if not self.enabled:
+            return NULL_SCOPE
+        return ProfilerScope(self, name)
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.scopes = []
+        self.depth = 0
+        self.frame_start = perf_counter()
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.frames.append((self.frame_start, perf_counter(), self.scopes))
+
+    def toggle(self):
+        """
+        switch recording on/off together with the overlay
+        """
+        self.enabled = not self.enabled
+        self.show_overlay = self.enabled
+        self.frames.clear()
+
+    def phase_times(self, depth: int = 0) -> dict[str, list[float]]:
+        """
+        time (in seconds) of each scope at given depth for every recorded frame,
+        scopes with the same name in one frame are summed up, 'frame' contains the whole frame time
+        """
+        phases: dict[str, list[float]] = {"frame": []}
+        for frame_no, (frame_start, frame_end, scopes) in enumerate(self.frames):
+            phases["frame"].append(frame_end - frame_start)
+            for name, scope_depth, _, duration in scopes:
+                if scope_depth != depth:
+                    continue
+                times = phases.setdefault(name, [0.0] * len(self.frames))
+                times[frame_no] += duration
+        return phases
+
+    def export_chrome_trace(self, file_name: PathLike):
+        """
+        save recorded frames as Chrome trace JSON (open in chrome://tracing or https://ui.perfetto.dev)
+        """
+        events = []
+        for frame_no, (frame_start, frame_end, scopes) in enumerate(self.frames):
+            events.append({
+                "name": "frame", "ph": "X", "pid": 0, "tid": 0,
+                "ts": frame_start * 1_000_000, "dur": (frame_end - frame_start) * 1_000_000,
+                "args": {"frame_no": frame_no},
+            })
+            for name, _, start, duration in scopes:
+                events.append({
+                    "name": name, "ph": "X", "pid": 0, "tid": 0,
+                    "ts": start * 1_000_000, "dur": duration * 1_000_000,
+                })
+        with open(file_name, "w", encoding="UTF-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    #MARK: draw
+    def draw(self, game: "game.Game", rect: pygame.Rect):
+        """
+        render stacked bar (one column per frame) of top level phases with average times as legend
+        """
+        game.render_panel(rect, (10,10,10,150))
+        if not self.frames:
+            return
+
+        bar_width = 3
+        graph_height = rect.height - FONT_SIZE_MEDIUM * TEXT_ROW_SPACING * 2
+        # the full graph height is twice the frame time budget
+        budget = 1 / FPS_CAP
+        px_per_sec = graph_height / (budget * 2)
+        bottom = rect.bottom - 4
+        frames = list(self.frames)[-((rect.width - 8) // bar_width):]
+
+        for i, (_, _, scopes) in enumerate(frames):
+            x = rect.x + 4 + i * bar_width
+            y = bottom
+            for name, depth, _, duration in scopes:
+                if depth != 0:
+                    continue
+                height = duration * px_per_sec
+                color = PROFILER_COLORS.get(name, PROFILER_DEFAULT_COLOR)
+                pygame.draw.rect(game.canvas, color, (x, y - height, bar_width, height + 1))
+                y -= height
+
+        budget_y = bottom - budget * px_per_sec
+        pygame.draw.line(game.canvas, "white", (rect.x, budget_y), (rect.right, budget_y))
+
+        # legend with average time of each phase in last frames
+        totals: dict[str, float] = {}
+        for _, _, scopes in frames:
+            for name, depth, _, duration in scopes:
+                if depth == 0:
+                    totals[name] = totals.get(name, 0.0) + duration
+        x = rect.x + 4
+        y = rect.y + 4
+        for name, total in totals.items():
+            text = f"{name} {total / len(frames) * 1000:.1f}"
+            text_width = game.fonts[FONT_SIZE_SMALL].size(text)[0] + 10
+            if x + text_width > rect.right:
+                x = rect.x + 4
+                y += FONT_SIZE_SMALL * TEXT_ROW_SPACING
+            game.render_text(text, (x, y), PROFILER_COLORS.get(name, PROFILER_DEFAULT_COLOR), font_size=FONT_SIZE_SMALL)
+            x += text_width
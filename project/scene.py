@@ -1,11 +1,19 @@
 from state import State
 from settings import *
 import pygame
+import math
 import game
 from objects import Wall, Collider
+from spatial_grid import SpatialGrid
+from actor_world import ActorWorld
+from simulation_lod import SimulationLOD
+from timer_wheel import Timer
+from path_service import PathService
+from map_cache import MapData
+from dirty_rects import DirtyRects, scale_region
 from transition import Transition, TransitionCircle
 from maze_generator import hunt_and_kill_maze
-from maze_generator.maze_utils import get_gid_from_tmx_id, get_pyscroll_from_maze
+from maze_generator.maze_utils import get_gid_from_tmx_id, get_pyscroll_from_maze, FlowField
 
 from pytmx.util_pygame import load_pygame
 import pyscroll
@@ -17,6 +25,8 @@ import menus
 ##########################################################################################################################
 #MARK: Scene
 class Scene(State):
+    tracks_dirty_rects = True
+
     def __init__(self, game: game.Game, current_scene: str, entry_point: str, is_maze: bool = False, maze_cols: int = 0, maze_rows: int = 0) -> None:
         super().__init__(game)
         self.current_scene = current_scene
@@ -30,6 +40,14 @@ class Scene(State):
         self.draw_sprites = pygame.sprite.Group()
         self.block_sprites = pygame.sprite.Group()
         self.exit_sprites = pygame.sprite.Group()
+        # walls and NPCs for collision checks
+        self.collision_grid = SpatialGrid()
+        # repeating timers of this scene (game.timer_wheel), cancelled when the scene is left
+        self.timers: list[Timer] = []
+        # physics state of Player and NPCs in NumPy arrays (None - each character integrates itself)
+        self.actor_world: ActorWorld | None = ActorWorld() if USE_ACTOR_WORLD else None
+        # NPCs far from the camera view are updated less often or not at all (None - all NPCs updated every frame)
+        self.simulation_lod: SimulationLOD | None = SimulationLOD() if USE_SIMULATION_LOD else None
         
         # self.transition = Transition(self)
         self.transition = TransitionCircle(self)
@@ -58,23 +76,24 @@ class Scene(State):
                     to_map=self.prev_state.current_scene,
                     entry_point=self.prev_state.new_scene.return_entry_point
                 )
+                map_data = MapData(tileset_map)
         else:
-            tileset_map = load_pygame(MAPS_DIR / f"{self.current_scene}.tmx")
+            map_data = self.game.map_cache.get(self.current_scene)
+            tileset_map = map_data.tileset_map
 
         # setup level geometry with simple pygame rectangles, loaded from pytmx
-        self.layers = []
-        for layer in tileset_map.layers:
-            self.layers.append(layer.name)
+        self.layers = map_data.layers
             
-        self.walls = []
+        # under1 layer contains 'walls' - tiles that collide with characters
+        self.walls = map_data.walls
+        for rect in self.walls:
+            self.collision_grid.add_wall(rect)
         # for obj in tileset_map.objects:
         #     if obj.name == "player":
         #         self.player.rect.center = [obj.x, obj.y]
         #         break
         #     self.walls.append(pygame.Rect(obj.x, obj.y, obj.width, obj.height))
         
-        # under1 layer contains 'walls' - tiles that collide with characters
-        
         # string with coma separated names of particle systems active in this map
         map_particles = tileset_map.properties.get("particles", "").replace(" ", "").strip().lower().split(",")
         # print(tileset_map.properties.get("particles", ""), self.map_particles)
@@ -83,22 +102,18 @@ class Scene(State):
             if particle in PARTICLES:
                 particle_class = PARTICLES[particle]
                 self.particles.append(particle_class(self.game.canvas))
-                self.game.register_custom_event(self.particles[-1].custom_event_id, self.particles[-1].add)
+                self.timers.append(self.game.timer_wheel.schedule(self.particles[-1].interval, self.particles[-1].add, repeat=True))
         
-        if "walls" in self.layers:
-            walls = tileset_map.get_layer_by_name("walls")
-            walls_width = walls.width
-            walls_height = walls.height
-            # since NPCs hitbox (feet) is half the size of TILE, for path finding it's enough to approximate 
-            # the full map with only 4 squares (one quoter of the TILE size)
-            self.path_finding_grid = [[0 for _ in range(walls_width)] for _ in range(walls_height)]
-            
-            for x, y, surf in tileset_map.get_layer_by_name("walls").tiles():
-                rect = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, surf.get_width(), surf.get_height())
-                self.walls.append(rect)
-                self.path_finding_grid[y][x] = 100
-                # can be created as sprites if needed
-        #         Wall([self.block_sprites], (x * TILE_SIZE, y * TILE_SIZE), "blocks", surf)
+        # walls are blocked, other tiles have step cost from tiles properties (e.g. road is faster, water slower)
+        self.nav_grid = map_data.nav_grid.copy()
+        # new renderer (camera) for each scene, it is changed by the scene (zoom, scaling function, map animations),
+        # so it is not cached with the map (created with the zoom, so the buffer is not rebuilt)
+        self.map_layer = pyscroll.BufferedRenderer(
+            data=pyscroll.data.TiledMapData(tileset_map),
+            size=self.game.screen.get_size(),
+            clamp_camera=True, # camera stops at map borders (no black area around), player needs to be stopped separately
+            zoom=ZOOM_LEVEL,
+        )
                         
         if "exits" in self.layers:
             for obj in tileset_map.get_layer_by_name("exits"):
@@ -151,20 +166,11 @@ class Scene(State):
         if self.entry_point in self.entry_points:
             ep = self.entry_points[self.entry_point]
             # print(ep)
-            self.player.pos = vec(ep.x, ep.y)
-            self.player.adjust_rect()
+            self.player.teleport(vec(ep.x, ep.y))
         else:
             print("[red]no entry point found!")
             # put the player in the center of the map
-            self.player.pos = self.map_layer.map_rect.center
-            
-        # create new renderer (camera)
-        self.map_layer = pyscroll.BufferedRenderer(
-            data=pyscroll.data.TiledMapData(tileset_map),
-            size=self.game.screen.get_size(),
-            clamp_camera=True, # camera stops at map borders (no black area around), player needs to be stopped separately
-        )
-        self.map_layer.zoom = ZOOM_LEVEL
+            self.player.teleport(vec(self.map_layer.map_rect.center))
         
 
         # pyscroll supports layered rendering.  our map has 3 'under'
@@ -179,31 +185,55 @@ class Scene(State):
         self.group.add(self.shadow_sprites, layer=self.sprites_layer - 1)
         self.group.add(self.player)
         self.group.add(self.NPC)
-                
-        for x, y, surf in tileset_map.layers[0].tiles():
-            
-            # rect = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, surf.get_width(), surf.get_height())
-            # self.walls.append(rect)        
-            if self.path_finding_grid[y][x] == 0:
-                sprites = self.group.get_sprites_at((x,y))
-                # tile_0_gid = tileset_map.get_tile_gid(x, y, 0)
-                # tile_1_gid = tileset_map.get_tile_gid(x, y, 1)
-                tile_0_gid = tileset_map.get_tile_properties(x, y, 0)
-                tile_1_gid = tileset_map.get_tile_properties(x, y, 1)
-                step_cost = 100
-                if tile_0_gid and "step_cost" in tile_0_gid.keys():
-                    step_cost = tile_0_gid["step_cost"]
-                if tile_1_gid and "step_cost" in tile_1_gid.keys():
-                    step_cost = tile_1_gid["step_cost"]
-                self.path_finding_grid[y][x] = -step_cost
-                # if x == 28 and y in [6,7]:
-                    # print(x, y, tile_0_gid, tile_1_gid, step_cost)
+        # sprite => (image, rect on canvas) drawn in the previous frame, camera (offset, zoom) of it (USE_DIRTY_RECTS)
+        self.drawn_sprites: dict[pygame.sprite.Sprite, tuple[pygame.Surface, pygame.Rect]] = {}
+        self.camera: tuple[tuple[int, int], float] | None = None
+        # animated tiles change the whole buffer of the map
+        self.has_map_animations = bool(getattr(self.map_layer.data, "_animation_queue", None))
+        if USE_DIRTY_RECTS:
+            self.map_layer.scaling_function = self.scale_map
+        
+        # shared by all NPCs chasing the Player, recalculated only when the Player changes tile
+        self.flow_field = FlowField(self.nav_grid)
+        # engine is picked per map - hand-made maps are small enough for a_star, "hpa" pays off only on big mazes
+        engine = PATH_FINDING_ENGINE
+        if self.is_maze:
+            engine = MAZE_PATH_FINDING_ENGINE
+            if engine == "hpa" and self.nav_grid.rows * self.nav_grid.cols < HPA_MIN_TILES:
+                engine = "jps"
+        # A* path requests from NPCs (see NPC.find_path), time budget depends on wall clock, so it is not used
+        # while inputs are recorded or replayed (the same requests must be served in the same frame)
+        self.path_service = PathService(
+            self.nav_grid,
+            budget_ms=math.inf if self.game.is_deterministic else PATH_FINDING_BUDGET_MS,
+            engine=engine,
+            cluster_graph=map_data.cluster_graph.copy(self.nav_grid) if map_data.cluster_graph else None,
+        )
+        
+        # parse maps reachable through exits in background, so going through the exit only swaps in a ready scene
+        if PREFETCH_EXITS:
+            self.game.map_cache.prefetch([exit.to_map for exit in self.exit_sprites if not exit.is_maze])
     
     
     def __repr__(self) -> str:
         return f"{__class__.__name__}: {self.current_scene}"
     
+    def set_step_cost(self, x: int, y: int, value: int):
+        """
+        change nav_grid value of a tile (positive - blocked, negative - custom step cost)
+        and drop paths calculated for the old grid
+        """
+        self.nav_grid.set_value(y, x, value)
+        self.path_service.invalidate()
+        self.flow_field.reset()
+    
     
+    def exit_state(self, quit: bool = True):
+        # one-shot timers (e.g. NPC stun) just expire, repeating ones would run forever
+        for timer in self.timers:
+            timer.cancel()
+        super().exit_state(quit)
+
     def go_to_scene(self):
         self.transition.exiting = False
         new_scene = Scene(self.game, self.new_scene.to_map, self.new_scene.entry_point, self.new_scene.is_maze, self.new_scene.maze_cols, self.new_scene.maze_rows)
@@ -214,8 +244,20 @@ class Scene(State):
     #MARK: update
     def update(self, dt: float, events: list[pygame.event.EventType]):
         global INPUTS
+        profiler = self.game.profiler
         # self.update_sprites.update(dt)
-        self.group.update(dt)
+        with profiler.scope("sprites"):
+            if self.simulation_lod:
+                self.simulation_lod.update(dt, self.NPC, self.player, self.get_view_rect())
+                updated_npcs = self.simulation_lod.updated
+            else:
+                self.group.update(dt)
+                updated_npcs = self.NPC
+        if self.actor_world:
+            with profiler.scope("physics"):
+                self.actor_world.step(self.nav_grid)
+        with profiler.scope("path_finding"):
+            self.path_service.update()
         self.transition.update(dt)
         
         # check if the sprite's feet are colliding with wall       
@@ -224,30 +266,32 @@ class Scene(State):
         # for sprite in self.group.sprites():
         #     if sprite.rect.collidelist(self.walls) > -1:
         #         sprite.move_back(dt)
-        if self.player.feet.collidelist(self.walls) > -1:
-            # self.player.move_back(dt)
-            self.player.slide(self.walls)
+        with profiler.scope("collisions"):
+            grid = self.collision_grid
+            if grid.collide_walls(self.player.feet):
+                # self.player.move_back(dt)
+                self.player.slide(grid.collide_walls)
 
-        if not self.player.is_flying:
-            collided_index = self.player.feet.collidelist(self.NPC)
-            if collided_index > -1:
-                # self.player.move_back()
-                self.player.encounter(self.NPC[collided_index])
-                self.player.slide(self.NPC)
-            
-        colliders = self.walls
-        # if self.player.is_flying:
-        #     colliders = self.walls
-        # else:
-        #     colliders = self.walls + [self.player]
-            
-        for npc in self.NPC:
-            if npc.feet.collidelist(colliders) > -1:
-                # npc.move_back(dt)
-                npc.slide(colliders)
+            if not self.player.is_flying:
+                collided_npc = grid.get_actor_at(self.player.feet, exclude=self.player)
+                if collided_npc:
+                    # self.player.move_back()
+                    self.player.encounter(collided_npc)
+                    self.player.slide(lambda rect: grid.collide_actors(rect, exclude=self.player))
+                
+            # if self.player.is_flying:
+            #     colliders = self.walls
+            # else:
+            #     colliders = self.walls + [self.player]
+                
+            for npc in updated_npcs:
+                if grid.collide_walls(npc.feet):
+                    # npc.move_back(dt)
+                    npc.slide(grid.collide_walls)
 
+        input_map = self.game.input_map
         # switch to splash screen        
-        if INPUTS['quit']:
+        if input_map.is_pressed('quit'):
             # SplashScreen(self.game).enter_state()
             # Scene(self.game, 'grasslands', 'start').enter_state()
             # MainMenuScreen(self.game, next_scene).enter_state()
@@ -255,32 +299,25 @@ class Scene(State):
             self.game.reset_inputs()
 
         global SHOW_DEBUG_INFO
-        if INPUTS['debug']:
+        if input_map.is_pressed('debug'):
             SHOW_DEBUG_INFO = not SHOW_DEBUG_INFO
             # print(f"{SHOW_DEBUG_INFO=}")
-            # self.game.reset_inputs()
-            INPUTS['debug'] = False            
 
         global USE_ALPHA_FILTER
-        if INPUTS['alpha']:
+        if input_map.is_pressed('alpha'):
             USE_ALPHA_FILTER = not USE_ALPHA_FILTER
-            INPUTS['alpha'] = False            
 
         global SHOW_HELP_INFO
-        if INPUTS['help']:
+        if input_map.is_pressed('help'):
             SHOW_HELP_INFO = not SHOW_HELP_INFO
-            # self.game.reset_inputs()
-            INPUTS['help'] = False
             
-        if INPUTS['run']:
+        if input_map.is_pressed('run'):
             if self.player.speed == self.player.speed_run:
                 self.player.speed = self.player.speed_walk
             else:
                 self.player.speed = self.player.speed_run
-            INPUTS['run'] = False
-            # self.game.reset_inputs()
         
-        if INPUTS["jump"]:
+        if input_map.is_pressed("jump"):
             # self.player.is_jumping = not self.player.is_jumping
             if not self.player.is_flying:
                 if not self.player.is_jumping:
@@ -297,9 +334,7 @@ class Scene(State):
                 #     self.group.remove(self.player)
                 #     self.group.add(self.player, layer=3)
             
-            INPUTS["jump"] = False
-            
-        if INPUTS["fly"]:
+        if input_map.is_pressed("fly"):
             if not self.player.is_jumping:            
                 self.player.is_flying = not self.player.is_flying
                 if self.player.is_flying:
@@ -314,48 +349,99 @@ class Scene(State):
                     # self.group.remove(self.player)
                     # self.group.add(self.player, layer=3)
                     self.group.change_layer(self.player, self.sprites_layer)
-                
-                INPUTS["fly"] = False
         
         # if INPUTS['right_click']:
             # self.exit_state()
             # self.game.reset_inputs()
         
-        if INPUTS['help']:
+        # help action toggles help panel (above)
+        # if input_map.is_pressed('help'):
             # print("need help")
             # next_scene = None #  self # Scene(self.game, 'grasslands', 'start')
             # AboutMenuScreen(self.game, next_scene).enter_state()
-            menus.MainMenuScreen(self.game, "MainMenu").enter_state()
+            # menus.MainMenuScreen(self.game, "MainMenu").enter_state()
             # self.game.reset_inputs()
-            INPUTS['help'] = False
         global IS_PAUSED
-        if INPUTS['pause']:
+        if input_map.is_pressed('pause'):
             IS_PAUSED = not IS_PAUSED
             print(f"{IS_PAUSED=}")
-            INPUTS['pause'] = False
 
-        if INPUTS['screenshot']:
+        if input_map.is_pressed('screenshot'):
             self.game.save_screenshot()
-            INPUTS['screenshot'] = False
             
         # live reload map
-        if INPUTS['reload']:
+        if input_map.is_pressed('reload'):
             self.map_layer.reload()
-            INPUTS['reload'] = False
+            self.game.map_cache.remove(self.current_scene)
             
         # camera zoom in/out
-        if INPUTS['zoom_in']: # or INPUTS["scroll_up"]:
+        if input_map.is_pressed('zoom_in'): # or INPUTS["scroll_up"]:
             self.map_layer.zoom += 0.25
-            # self.game.reset_inputs()
-            INPUTS['zoom_in'] = False
             
-        if INPUTS['zoom_out']: # or INPUTS["scroll_down"]:
+        if input_map.is_pressed('zoom_out'): # or INPUTS["scroll_down"]:
             value = self.map_layer.zoom - 0.25
             if value > 0:
                 self.map_layer.zoom = value
-            # self.game.reset_inputs()
-            INPUTS['zoom_out'] = False
             
+    def get_view_rect(self) -> pygame.Rect:
+        """
+        camera view centred on simulated (not interpolated, see draw) position of the Player, clamped like in pyscroll
+        """
+        view_rect = self.map_layer.view_rect.copy()
+        view_rect.center = round(self.player.pos.x), round(self.player.pos.y)
+        if self.map_layer.map_rect:
+            view_rect.clamp_ip(self.map_layer.map_rect)
+        return view_rect
+
+    #MARK: dirty rects
+    def track_dirty_rects(self, dirty_rects: DirtyRects):
+        """
+        report rects of sprites which moved or changed image since the previous frame and rects of particles,
+        the whole canvas when the camera moved (the map scrolled) or something covers the whole screen.
+        Only zoomed map is redrawn partially (see scale_map), without zoom pyscroll blits it over the whole canvas.
+        """
+        ox, oy = self.map_layer.get_center_offset()
+        zoom = self.map_layer.zoom
+        camera = ((ox, oy), zoom)
+        if (camera != self.camera or zoom == 1 or self.has_map_animations or SHOW_DEBUG_INFO
+                or self.transition.alpha > 0 or self.transition.exiting):
+            dirty_rects.add_full()
+        self.camera = camera
+
+        # sprites are drawn on zoom buffer (of view_rect size), which is scaled to the canvas
+        view_rect = self.map_layer.view_rect
+        ratio_x, ratio_y = WIDTH / view_rect.width, HEIGHT / view_rect.height
+        drawn_sprites = {}
+        for sprite in self.group.sprites():
+            if not sprite.rect.colliderect(view_rect):
+                continue
+            x, y = int(sprite.rect.x + ox), int(sprite.rect.y + oy)
+            left, top = math.floor(x * ratio_x) - 1, math.floor(y * ratio_y) - 1
+            right = math.ceil((x + sprite.rect.width + 1) * ratio_x) + 1
+            bottom = math.ceil((y + sprite.rect.height + 1) * ratio_y) + 1
+            drawn = (sprite.image, pygame.Rect(left, top, right - left, bottom - top))
+            drawn_sprites[sprite] = drawn
+            prev_drawn = self.drawn_sprites.pop(sprite, None)
+            if prev_drawn is None:
+                dirty_rects.add(drawn[1])
+            elif prev_drawn[0] is not drawn[0] or prev_drawn[1] != drawn[1]:
+                dirty_rects.add(prev_drawn[1])
+                dirty_rects.add(drawn[1])
+        # removed or out of view
+        for _, rect in self.drawn_sprites.values():
+            dirty_rects.add(rect)
+        self.drawn_sprites = drawn_sprites
+
+        for particle in self.particles:
+            for rect in particle.get_dirty_rects():
+                dirty_rects.add(rect)
+
+    def scale_map(self, source: pygame.Surface, size: tuple[int, int], dest: pygame.Surface):
+        """
+        scaling function of pyscroll (zoom), only the changed region of the canvas is scaled (USE_DIRTY_RECTS)
+        """
+        scale_region(source, size, dest, self.game.dirty_rects.region)
+
     def show_help(self):
         i = 1
         show_actions = [action for action in ACTIONS.values() if action["show"]]
@@ -369,7 +455,24 @@ class Scene(State):
     #MARK: draw
     def draw(self, screen: pygame.Surface, dt: float):
         # screen.fill(COLORS["red"])
-        self.group.center(self.player.pos)
+        # simulation runs in fixed steps, actors (in view) and camera are drawn between the last two steps
+        alpha = self.game.render_alpha
+        actors = (self.simulation_lod.in_view if self.simulation_lod else self.NPC) + [self.player]
+        if USE_FIXED_TIMESTEP and alpha < 1.0:
+            for npc in actors:
+                npc.place_sprites(npc.render_prev_pos.lerp(npc.pos, alpha))
+            self.group.center(self.player.render_prev_pos.lerp(self.player.pos, alpha))
+        else:
+            self.group.center(self.player.pos)
+        
+        profiler = self.game.profiler
+        if USE_DIRTY_RECTS:
+            # particles are moved before drawing, so their rects can be reported
+            with profiler.scope("particles"):
+                for particle in self.particles:
+                    particle.update(dt)
+            self.track_dirty_rects(self.game.dirty_rects)
+            self.game.dirty_rects.begin_draw(screen)
         # self.draw_sprites.draw(screen)
 
         # for npc in self.NPC + [self.player]:
@@ -379,9 +482,18 @@ class Scene(State):
         #     # self.game.render_text(npc.name, pos, font_size=FONT_SIZE_SMALL, centred=True)
         #     screen.blit(self.shadow_surf, pos)
         
-        self.group.draw(screen)
-        for particle in self.particles:
-            particle.emit(dt)
+        with profiler.scope("map"):
+            self.group.draw(screen)
+        if USE_FIXED_TIMESTEP and alpha < 1.0:
+            # rects are also used for collisions
+            for npc in actors:
+                npc.place_sprites(npc.pos)
+        with profiler.scope("particles"):
+            for particle in self.particles:
+                if USE_DIRTY_RECTS:
+                    particle.draw()
+                else:
+                    particle.emit(dt)
         
         self.transition.draw(screen)
         
@@ -437,15 +549,14 @@ class Scene(State):
                 
                 # a={npc.acc.magnitude():4.1f}
             # walls grid
-            for y, row in enumerate(self.path_finding_grid):
-                for x, tile in enumerate(row):
-                    if tile > 0:
-                        rect_w = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-                        rect_s = self.map_layer.translate_rect(rect_w)
-                        img = pygame.Surface(rect_s.size, pygame.SRCALPHA)
-                        # img.fill((200,0,0,128))
-                        pygame.draw.rect(img, (0,0,200,64), img.get_rect())
-                        self.game.canvas.blit(img, rect_s)
+            for y, x in zip(*self.nav_grid.data.nonzero()):
+                if self.nav_grid.is_blocked(y, x):
+                    rect_w = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+                    rect_s = self.map_layer.translate_rect(rect_w)
+                    img = pygame.Surface(rect_s.size, pygame.SRCALPHA)
+                    # img.fill((200,0,0,128))
+                    pygame.draw.rect(img, (0,0,200,64), img.get_rect())
+                    self.game.canvas.blit(img, rect_s)
                 
         
         if SHOW_HELP_INFO:
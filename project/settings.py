@@ -36,6 +36,8 @@ IS_WEB = False
 # local storage in web version for high score table
 if __import__("sys").platform == "emscripten":
     IS_WEB = True
+# SDL dummy video driver has no OpenGL support, so run without window and shaders (e.g. benchmarks)
+IS_HEADLESS = __import__("os").environ.get("SDL_VIDEODRIVER", "") == "dummy"
 
 IS_FULLSCREEN = False
 IS_PAUSED = False
@@ -47,6 +49,49 @@ SHOW_DEBUG_INFO = False
 SHOW_HELP_INFO = False
 
 FPS_CAP = 30
+# number of textures the screen is uploaded to in turns (so upload doesn't wait for the previous frame's draw)
+SHADER_UPLOAD_RING = 2
+# simulation runs in fixed steps (seconds) independent of frame rate, sprites are drawn interpolated between steps,
+# a longer step lowers simulation cost (e.g. on weak browsers) without changing gameplay
+USE_FIXED_TIMESTEP = True
+SIMULATION_STEP = 1 / FPS_CAP
+# max simulation steps in one frame, time above that is dropped (the game slows down instead of freezing)
+MAX_SIMULATION_STEPS = 5
+# clear, redraw and upload only the part of the canvas which has changed (moved sprites, particles, texts, cursor),
+# the whole canvas is redrawn when the camera moves, in menus and during transitions (see DirtyRects)
+USE_DIRTY_RECTS = False
+# changed region covering more than this part of the canvas is redrawn whole (copying pixels of a big region
+# of the zoomed map is slower than scaling the whole map)
+DIRTY_RECTS_MAX_AREA = 0.35
+# number of last frames kept by frame profiler
+PROFILER_FRAMES = 300
+# max time (in milliseconds) spent on path finding in one frame (at least one path is always searched)
+PATH_FINDING_BUDGET_MS = 2.0
+# number of recently found paths kept in cache
+PATH_CACHE_SIZE = 64
+# path finding algorithm used by PathService on hand-made maps: "a_star", "jps" (Jump Point Search) or "hpa" (hierarchical A*),
+# a_star fits the frame budget on them and finds the shortest paths
+PATH_FINDING_ENGINE = "a_star"
+# path finding algorithm used on generated mazes, "hpa" keeps searches of long paths through corridors within the frame budget
+MAZE_PATH_FINDING_ENGINE = "hpa"
+# mazes with fewer tiles use "jps" instead of "hpa"
+HPA_MIN_TILES = 2000
+# size (in tiles) of square clusters of "hpa" engine
+HPA_CLUSTER_SIZE = 12
+# parse map of Scene started from main menu in background (map prefetch) as soon as the menu is opened
+PREWARM_MENU_STATES = False
+# number of parsed maps (TiledMap with tileset surfaces, walls, nav grid) kept in memory for re-entering scenes
+MAP_CACHE_SIZE = 4
+# load maps reachable through exits of the current scene in background (thread on desktop, asyncio task on web)
+PREFETCH_EXITS = True
+# number of characters which animations (cut sprite sheets) are kept in memory
+ANIMATION_CACHE_SIZE = 8
+# colors blended over frames of tinted animation variants (precomputed once per character)
+ANIMATION_TINTS = {
+    "stunned": (200, 0, 0, 64),
+    "hit":     (255, 255, 255, 128),
+    "poison":  (0, 160, 0, 64),
+}
 ANIMATION_SPEED = 10 # frames per second
 # when character speed is grater than this value, it's state changes to Run
 RUN_SPEED: float = 39.0
@@ -67,6 +112,8 @@ ACTIONS = {
     'accept':     {"show": None,         "msg": "accept",     "keys": [pygame.K_RETURN, pygame.K_KP_ENTER]},
     'help':       {"show": ["F1", 'h'],  "msg": "help",       "keys": [pygame.K_F1,    pygame.K_h]},
     'screenshot': {"show": ["F12"],      "msg": "screenshot", "keys": [pygame.K_F12]},
+    'profiler':   {"show": ["F3"],       "msg": "profiler",   "keys": [pygame.K_F3]},
+    'profiler_save':{"show": ["F4"],     "msg": "save trace", "keys": [pygame.K_F4]},
     'reload':     {"show": ([] if IS_WEB else ["r"]),       "msg": "reload map", "keys": [pygame.K_r]},
     'zoom_in':    {"show": ["+"],       "msg": "zoom in",    "keys": [pygame.K_EQUALS, pygame.K_KP_PLUS]},
     'zoom_out':   {"show": ["-"],       "msg": "zoom out",   "keys": [pygame.K_MINUS, pygame.K_KP_MINUS]},
@@ -89,6 +136,7 @@ ACTIONS = {
     'pause':      {"show": ["F8"],       "msg": "pause",          "keys": [pygame.K_F8]},
     
     'scroll_up':   {"show": None,            "msg": "",           "keys": []},
+    'scroll_down': {"show": None,            "msg": "",           "keys": []},
     'left_click':  {"show": ["Left click"],  "msg": "go to",      "keys": []},
     'right_click': {"show": ["Right click"], "msg": "stop",       "keys": []},
     'scroll_click':{"show": None,            "msg": "",           "keys": []},
@@ -129,6 +177,38 @@ PARTICLES_DIR = RESOURCES_DIR / "particles"
 HUD_DIR = RESOURCES_DIR / "HUD"
 PROGRAM_ICON = ASSETS_DIR / "icon.png"
 MOUSE_CURSOR_IMG = ASSETS_DIR / "aim.png"
+# characters, HUD, particles and the cursor packed into atlas pages (see atlas.py)
+ATLAS_DIR = ASSETS_DIR / "atlas"
+ATLAS_PAGE_SIZE = 1024
+ATLAS_PADDING = 1
+# larger images are not packed (must not be greater than ATLAS_PAGE_SIZE)
+ATLAS_MAX_IMAGE_SIZE = 512
+# number of fill levels of health bars (bars are prerendered for each level), 18 == pixel width of the bar
+HEALTH_BAR_LEVELS = 18
+# physics state of all characters of a scene kept in NumPy arrays and integrated in one vectorized step (see actor_world.py),
+# no break-even measured yet (benchmark_actors.py, LOD off, frame p50 with 100 / 300 / 1000 NPCs):
+# 10.6 / 18.0 / 40.7 ms without it, 13.1 / 21.9 / 45.9 ms with it (rects are still adjusted per actor after the step)
+USE_ACTOR_WORLD = False
+# initial number of rows of ActorWorld arrays (doubled when full)
+ACTOR_WORLD_CAPACITY = 64
+# NPCs outside the camera view are updated less often, far NPCs sleep (see simulation_lod.py)
+USE_SIMULATION_LOD = True
+# NPCs closer than this (in tiles) to the camera view are updated every frame
+LOD_VIEW_MARGIN = 2
+# NPCs outside the view are updated once per this number of frames (with accordingly bigger dt)
+LOD_NEAR_INTERVAL = 3
+# NPCs further than this (in tiles) from the Player sleep
+LOD_SLEEP_DISTANCE = 40
+# NPCs are sorted into LOD tiers once per this number of frames (new NPCs and NPCs entering the view are moved in view at once)
+LOD_REFRESH_INTERVAL = 8
+# max dt (in seconds) of one update of NPC outside the view (sum of dt of LOD_NEAR_INTERVAL frames is clamped to it),
+# the fastest NPC (40 pixels per second) moves less than a tile in one update, so it can't pass through a wall
+LOD_MAX_DT = 0.25
+# game time timers (see timer_wheel.py): tick in seconds, number of slots of each level (as power of 2) and levels
+# 10 ms * 64^4 slots ~ 46 hours, timers further than that are cascaded from the last level again
+TIMER_WHEEL_TICK = 0.01
+TIMER_WHEEL_SLOTS_BITS = 6
+TIMER_WHEEL_LEVELS = 4
 if IS_WEB:
     SHADERS_DIR = Path("shaders") / "OpenGL3.0_ES"
 else:
@@ -140,6 +220,13 @@ SHADERS_NAMES = [
     "B_AND_W",
 ]
 DEFAULT_SHADER = "SATURATED"
+# post-processing passes applied in order (each pass is one more fullscreen draw), e.g. ["SATURATED", "RETRO_CRT"],
+# 'next_shader' action changes the last one
+SHADER_PASSES = [DEFAULT_SHADER]
+# recompile shaders when their files change (checked every SHADER_WATCH_INTERVAL seconds), desktop only,
+# turn on while editing shaders (the file watcher shouldn't run in release builds)
+SHADER_HOT_RELOAD = False
+SHADER_WATCH_INTERVAL = 1.0
 
 import particles
 PARTICLES = {
@@ -8,9 +8,13 @@ vec2 vertices[4] = vec2[](
     vec2(1.0, 1.0)
 );
 
+// -1.0 when drawing on render target of post-processing pass, which is read by the next pass like uploaded Surface
+uniform float flip_y;
+
 out vec2 vertex;
 
 void main() {
-    gl_Position = vec4(vertices[gl_VertexID], 0.0, 1.0);
-    vertex = vertices[gl_VertexID];
+    gl_Position = vec4(vertices[gl_VertexID] * vec2(1.0, flip_y), 0.0, 1.0);
+    // rows of the texture are uploaded from the top (as in pygame Surface), flip them here instead of on CPU
+    vertex = vertices[gl_VertexID] * vec2(1.0, -1.0);
 }
\ No newline at end of file
@@ -0,0 +1,116 @@
+from collections import deque
+import pygame
+from settings import *
+
+
+#####################################################################################################################
+#MARK: SimulationLOD
+class SimulationLOD:
+    """
+    Level of detail of NPC simulation for a Scene.
+    NPCs are sorted into tiers every refresh_interval frames:
+    - in view (camera view rect of the map extended by view_margin tiles): updated every frame,
+    - near (outside the view, but at most sleep_distance tiles from the Player): updated in near_interval buckets,
+      each bucket once per near_interval frames with the sum of dt since its last update (at most max_dt),
+    - far: asleep, not updated at all until the Player comes closer than sleep_distance tiles.
+    Between refreshes new NPCs and near NPCs entering the view are moved in view in the same frame.
+    Player is always updated, so the cost of a frame depends on the number of NPCs around the Player,
+    not on the size of the map.
+    """
+    def __init__(
+            self,
+            view_margin: int = LOD_VIEW_MARGIN,
+            near_interval: int = LOD_NEAR_INTERVAL,
+            sleep_distance: int = LOD_SLEEP_DISTANCE,
+            refresh_interval: int = LOD_REFRESH_INTERVAL,
+            max_dt: float = LOD_MAX_DT
+        ) -> None:
+        self.view_margin = view_margin
+        self.near_interval = max(1, near_interval)
+        self.sleep_distance = sleep_distance
+        self.refresh_interval = max(1, refresh_interval)
+        self.max_dt = max_dt
+        self.frame_no: int = 0
+        # list of NPCs of the scene from the last update and NPCs sorted into tiers (to find new NPCs)
+        self.npcs: list["characters.NPC"] = []
+        self.npc_count: int = 0
+        self.sorted: set["characters.NPC"] = set()
+        self.in_view: list["characters.NPC"] = []
+        self.near: list[list["characters.NPC"]] = [[] for _ in range(self.near_interval)]
+        self.asleep: list["characters.NPC"] = []
+        # dt of last frames, sum is dt of near bucket update
+        self.recent_dt: deque[float] = deque(maxlen=self.near_interval)
+        # NPCs updated in the last frame (only they can move, so only they need wall collision checks)
+        self.updated: list["characters.NPC"] = []
+
+    def get_view(self, view_rect: pygame.Rect) -> pygame.Rect:
+        return view_rect.inflate(self.view_margin * TILE_SIZE * 2, self.view_margin * TILE_SIZE * 2)
+
+    def refresh(self, npcs: list["characters.NPC"], player: "characters.NPC", view: pygame.Rect):
+        player_coord = player.tileset_coord
+        self.sorted = set(npcs)
+        self.in_view = []
+        self.near = [[] for _ in range(self.near_interval)]
+        self.asleep = []
+        near_count = 0
+        for npc in npcs:
+            if view.colliderect(npc.rect):
+                self.in_view.append(npc)
+            elif max(abs(npc.tileset_coord.x - player_coord.x), abs(npc.tileset_coord.y - player_coord.y)) <= self.sleep_distance:
+                self.near[near_count % self.near_interval].append(npc)
+                near_count += 1
+            else:
+                self.asleep.append(npc)
+
+    def add_new(self, npcs: list["characters.NPC"]):
+        """
+        NPCs which are not sorted into tiers yet (spawned since the last refresh) are updated every frame
+        """
+        for npc in npcs:
+            if npc not in self.sorted:
+                self.sorted.add(npc)
+                self.in_view.append(npc)
+
+    def promote(self, view: pygame.Rect):
+        """
+        move near NPCs which entered the view in view
+        """
+        for bucket in self.near:
+            for npc in [npc for npc in bucket if view.colliderect(npc.rect)]:
+                bucket.remove(npc)
+                self.in_view.append(npc)
+
+    def update(self, dt: float, npcs: list["characters.NPC"], player: "characters.NPC", view_rect: pygame.Rect):
+        view = self.get_view(view_rect)
+        if self.frame_no % self.refresh_interval == 0:
+            self.refresh(npcs, player, view)
+        else:
+            # Scene.NPC is appended to when NPC is spawned and replaced when NPC dies
+            if npcs is not self.npcs or len(npcs) != self.npc_count:
+                self.add_new(npcs)
+            self.promote(view)
+        self.npcs, self.npc_count = npcs, len(npcs)
+        self.recent_dt.append(dt)
+        bucket = self.near[self.frame_no % self.near_interval]
+        self.frame_no += 1
+
+        player.update(dt)
+        self.updated = []
+        # longer dt would let NPC pass through a wall (walls are checked once per frame, see Scene.update)
+        bucket_dt = min(sum(self.recent_dt), self.max_dt)
+        for npc_dt, tier in ((dt, self.in_view), (bucket_dt, bucket)):
+            for npc in tier:
+                # skip NPCs which died since the last refresh (e.g. killed by the Player)
+                if not npc.alive():
+                    continue
+                npc.update(npc_dt)
+                # NPC could die during its update (e.g. left the scene through an exit)
+                if npc.alive():
+                    self.updated.append(npc)
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            "in_view": len(self.in_view),
+            "near": sum(len(bucket) for bucket in self.near),
+            "asleep": len(self.asleep),
+        }
@@ -0,0 +1,86 @@
+import pygame
+from settings import *
+
+
+#####################################################################################################################
+#MARK: SpatialGrid
+class SpatialGrid:
+    """
+    Uniform grid (spatial hash) used for collision checks.
+    Static walls are added once when map is loaded, actors (NPCs) are moved between buckets
+    when their position changes (see NPC.adjust_rect).
+    Each query looks only at the few cells under the tested rect,
+    so its cost doesn't depend on number of walls and actors on the map.
+    """
+    def __init__(self, cell_size: int = TILE_SIZE) -> None:
+        self.cell_size = cell_size
+        # cell (x, y) => wall rects overlapping this cell
+        self.walls: dict[tuple[int, int], list[pygame.Rect]] = {}
+        # cell (x, y) => actors which rect overlaps this cell (dict used as insertion ordered set,
+        # so queries return the same actor in every run, set order depends on object ids)
+        self.actors: dict[tuple[int, int], dict["characters.NPC", None]] = {}
+        # actor => cells it was put into last time (to remove it from old buckets)
+        self.actor_cells: dict["characters.NPC", tuple[tuple[int, int], ...]] = {}
+
+    def get_cells(self, rect: pygame.Rect | pygame.FRect) -> tuple[tuple[int, int], ...]:
+        """
+        all grid cells overlapped by rect
+        """
+        size = self.cell_size
+        left = int(rect.left // size)
+        top = int(rect.top // size)
+        # right and bottom edges are exclusive
+        right = int((rect.right - 1) // size)
+        bottom = int((rect.bottom - 1) // size)
+        if left == right and top == bottom:
+            return ((left, top),)
+        return tuple((x, y) for y in range(top, bottom + 1) for x in range(left, right + 1))
+
+    #MARK: walls
+    def add_wall(self, rect: pygame.Rect):
+        for cell in self.get_cells(rect):
+            self.walls.setdefault(cell, []).append(rect)
+
+    def collide_walls(self, rect: pygame.Rect | pygame.FRect) -> bool:
+        """
+        is rect colliding with any wall
+        """
+        walls = self.walls
+        for cell in self.get_cells(rect):
+            if cell in walls and rect.collidelist(walls[cell]) > -1:
+                return True
+        return False
+
+    #MARK: actors
+    def move_actor(self, actor: "characters.NPC"):
+        """
+        put actor into buckets of cells under its rect (call after actor's rect has changed)
+        """
+        cells = self.get_cells(actor.rect)
+        old_cells = self.actor_cells.get(actor, ())
+        if cells == old_cells:
+            return
+
+        for cell in old_cells:
+            self.actors[cell].pop(actor, None)
+        for cell in cells:
+            self.actors.setdefault(cell, {})[actor] = None
+        self.actor_cells[actor] = cells
+
+    def remove_actor(self, actor: "characters.NPC"):
+        for cell in self.actor_cells.pop(actor, ()):
+            self.actors[cell].pop(actor, None)
+
+    def get_actor_at(self, rect: pygame.Rect | pygame.FRect, exclude: "characters.NPC | None" = None) -> "characters.NPC | None":
+        """
+        first actor (other than exclude) which rect collides with provided rect
+        """
+        actors = self.actors
+        for cell in self.get_cells(rect):
+            for actor in actors.get(cell, ()):
+                if actor is not exclude and rect.colliderect(actor.rect):
+                    return actor
+        return None
+
+    def collide_actors(self, rect: pygame.Rect | pygame.FRect, exclude: "characters.NPC | None" = None) -> bool:
+        return self.get_actor_at(rect, exclude) is not None
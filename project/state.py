@@ -1,3 +1,4 @@
+from typing import Callable
 from settings import *
 import pygame
 import game
@@ -5,6 +6,9 @@ import game
 ##########################################################################################################################
 #MARK: State
 class State:
+    # State reports changed rects to game.dirty_rects before drawing (USE_DIRTY_RECTS), otherwise it is redrawn whole
+    tracks_dirty_rects: bool = False
+
     def __init__(self, game: game.Game) -> None:
         self.game = game
         self.prev_state: "State" | None = None
@@ -47,5 +51,25 @@ class State:
 
         for i, msg in enumerate(msgs):
             self.game.render_text(msg, (10, FONT_SIZE_MEDIUM * TEXT_ROW_SPACING * (i + 1)))
-    
-    
\ No newline at end of file
+
+##########################################################################################################################
+#MARK: DeferredState
+class DeferredState:
+    """
+    Factory of a State which is built only when it is entered for the first time
+    (e.g. when menu button is pressed), so creating a menu doesn't load maps and sprite sheets of all its targets.
+    Built state is kept and entered again next time.
+    State is always built in the main thread (it uses game timers, map cache and random),
+    its slow part - parsing the map - can be prefetched in background (see MapCache.prefetch).
+    """
+    def __init__(self, factory: Callable[[], State]) -> None:
+        self.factory = factory
+        self.state: State | None = None
+
+    def get_state(self) -> State:
+        if self.state is None:
+            self.state = self.factory()
+        return self.state
+
+    def enter_state(self):
+        self.get_state().enter_state()
@@ -0,0 +1,113 @@
+from typing import Callable
+from settings import *
+
+
+#####################################################################################################################
+#MARK: Timer
+class Timer:
+    """
+    Handle of a callback scheduled in TimerWheel, cancel() removes it (lazily - it is skipped when its slot is reached)
+    """
+    __slots__ = ("expire_tick", "interval_ticks", "callback", "is_cancelled")
+
+    def __init__(self, expire_tick: int, interval_ticks: int, callback: Callable[[], None]) -> None:
+        self.expire_tick = expire_tick
+        # 0 for one-shot timer
+        self.interval_ticks = interval_ticks
+        self.callback = callback
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+
+
+#####################################################################################################################
+#MARK: TimerWheel
+class TimerWheel:
+    """
+    Hierarchical timer wheel driven by game time (Game.time_elapsed, which doesn't advance while the game is paused,
+    so timers are paused too).
+    Time is divided into ticks, level 0 has one slot per tick, each slot of the next level covers all slots
+    of the previous one. Scheduling and cancelling is O(1), timers from a slot of higher level are moved (cascaded)
+    to lower levels when level 0 wraps around. Timers further than the whole wheel are kept in the last level
+    and cascaded again until they are due.
+    Replaces pygame custom events + pygame.time.set_timer (limited pool of event ids, real time, not available in pygbag).
+    """
+    def __init__(self, tick: float = TIMER_WHEEL_TICK, slots_bits: int = TIMER_WHEEL_SLOTS_BITS, levels: int = TIMER_WHEEL_LEVELS) -> None:
+        self.tick = tick
+        self.slots_bits = slots_bits
+        self.slots_mask = (1 << slots_bits) - 1
+        self.wheels: list[list[list[Timer]]] = [[[] for _ in range(1 << slots_bits)] for _ in range(levels)]
+        self.current_tick: int = 0
+
+    def schedule(self, delay: float, callback: Callable[[], None], repeat: bool = False) -> Timer:
+        """
+        call callback after delay (in seconds of game time), every delay seconds if repeat is set
+        """
+        ticks = max(1, round(delay / self.tick))
+        timer = Timer(self.current_tick + ticks, ticks if repeat else 0, callback)
+        self.add(timer)
+        return timer
+
+    def add(self, timer: Timer):
+        # 0 only when cascaded timer is due in the current tick (its level 0 slot is processed right after cascading)
+        delta = max(0, timer.expire_tick - self.current_tick)
+        bits = self.slots_bits
+        for level, wheel in enumerate(self.wheels):
+            if delta < 1 << (bits * (level + 1)) or level == len(self.wheels) - 1:
+                if delta >= 1 << (bits * (level + 1)):
+                    # beyond the wheel - put it to the furthest slot, it will be cascaded again
+                    expire_tick = self.current_tick + (1 << (bits * (level + 1))) - 1
+                else:
+                    expire_tick = self.current_tick + delta
+                wheel[(expire_tick >> (bits * level)) & self.slots_mask].append(timer)
+                return
+
+    def cascade(self, level: int) -> int:
+        """
+        move timers from the current slot of level to lower levels, returns index of that slot
+        """
+        index = (self.current_tick >> (self.slots_bits * level)) & self.slots_mask
+        timers = self.wheels[level][index]
+        self.wheels[level][index] = []
+        for timer in timers:
+            if not timer.is_cancelled:
+                self.add(timer)
+        return index
+
+    #MARK: update
+    def update(self, time: float):
+        """
+        fire all timers due until time (in seconds, e.g. Game.time_elapsed)
+        """
+        target_tick = int(time / self.tick)
+        while self.current_tick < target_tick:
+            self.current_tick += 1
+            # level 0 wrapped around - cascade the next level (and the one above it when it wrapped around too)
+            if self.current_tick & self.slots_mask == 0:
+                for level in range(1, len(self.wheels)):
+                    if self.cascade(level) != 0:
+                        break
+
+            slot = self.wheels[0][self.current_tick & self.slots_mask]
+            if not slot:
+                continue
+            self.wheels[0][self.current_tick & self.slots_mask] = []
+            for timer in slot:
+                if timer.is_cancelled:
+                    continue
+                if timer.expire_tick > self.current_tick:
+                    # placed in the furthest slot, not due yet
+                    self.add(timer)
+                    continue
+                if timer.interval_ticks:
+                    timer.expire_tick += timer.interval_ticks
+                    self.add(timer)
+                else:
+                    timer.is_cancelled = True
+                timer.callback()
+
+    def clear(self):
+        for wheel in self.wheels:
+            for slot in wheel:
+                slot.clear()